@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+# Differences below this many seconds are timer and scheduler noise, whatever their ratio
+DEFAULT_MIN_SECONDS = 0.002
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = DEFAULT_THRESHOLD, min_seconds: float = DEFAULT_MIN_SECONDS) -> list[dict]:
+    """Compares the results of two benchmark runs, case by case
+
+    The total and every phase of each case are compared, and so is its peak RSS. A metric regresses
+    when the candidate is more than threshold slower (or bigger) than the baseline, by more than
+    min_seconds for times.
+
+    Arguments:
+        baseline, candidate {dict} -- Runs as written by bench.run
+        threshold {float} -- Relative increase tolerated, 0.10 being 10%
+        min_seconds {float} -- Absolute increase in time tolerated
+
+    Returns:
+        list[dict] -- One comparison per metric of the cases in both runs: name, metric, baseline,
+                      candidate, change (relative) and whether it is a regression
+    """
+    candidates = {result["name"]: result for result in candidate["results"]}
+    comparisons = []
+    for before in baseline["results"]:
+        after = candidates.get(before["name"])
+        if after is None:
+            continue
+
+        metrics = [("seconds", before["seconds"], after["seconds"], min_seconds)]
+        metrics += [
+            (f"phases.{phase}", seconds, after["phases"][phase], min_seconds)
+            for phase, seconds in before["phases"].items() if phase in after["phases"]
+        ]
+        if before.get("peak_rss_bytes") and after.get("peak_rss_bytes"):
+            metrics.append(("peak_rss_bytes", before["peak_rss_bytes"], after["peak_rss_bytes"], 0))
+
+        for metric, old, new, tolerance in metrics:
+            change = (new - old) / old if old else 0.0
+            comparisons.append({
+                "name": before["name"], "metric": metric, "baseline": old, "candidate": new, "change": change,
+                "regression": change > threshold and new - old > tolerance,
+            })
+    return comparisons
+
+
+def missing_cases(baseline: dict, candidate: dict) -> tuple[list[str], list[str]]:
+    """Names of the cases only in the baseline, and of those only in the candidate"""
+    before = [result["name"] for result in baseline["results"]]
+    after = [result["name"] for result in candidate["results"]]
+    return [name for name in before if name not in after], [name for name in after if name not in before]
+
+
+def comparison_line(comparison: dict) -> str:
+    if comparison["metric"] == "peak_rss_bytes":
+        values = f"{comparison['baseline'] / (1 << 20):.1f} MiB -> {comparison['candidate'] / (1 << 20):.1f} MiB"
+    else:
+        values = f"{comparison['baseline']:.4f}s -> {comparison['candidate']:.4f}s"
+    line = f"{comparison['name']} {comparison['metric']}: {values} ({comparison['change']:+.1%})"
+    return f"{line} REGRESSION" if comparison["regression"] else line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs and flag regressions.")
+    parser.add_argument("baseline", help="Results of the reference run (.json)")
+    parser.add_argument("candidate", help="Results of the run being checked (.json)")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help=f"Relative slowdown or memory growth flagged as a regression (default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--min-seconds", type=float, default=DEFAULT_MIN_SECONDS,
+        help=f"Slowdowns of fewer seconds are never flagged, as they are within noise (default: {DEFAULT_MIN_SECONDS})",
+    )
+    parser.add_argument("--all", action="store_true", help="Print every metric, not only the regressions")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    comparisons = compare(baseline, candidate, threshold=args.threshold, min_seconds=args.min_seconds)
+    for comparison in comparisons:
+        if args.all or comparison["regression"]:
+            print(comparison_line(comparison))
+    only_baseline, only_candidate = missing_cases(baseline, candidate)
+    for name in only_baseline:
+        print(f"{name}: missing from the candidate")
+    for name in only_candidate:
+        print(f"{name}: new in the candidate")
+
+    regressions = sum(comparison["regression"] for comparison in comparisons)
+    print(f"{regressions} regressions in {len(comparisons)} metrics compared")
+    # A non zero exit status fails the CI step that runs the comparison
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
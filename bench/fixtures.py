@@ -0,0 +1,27 @@
+import numpy as np
+from src.bmp_file import BMPFile
+
+
+def synthetic_bmp(file_path, width: int, height: int, seed: int = 0, bits_per_pixel: int = 8, reserved1: int = 0) -> BMPFile:
+    """Writes a BMP of random pixels (greyscale for 8 bits per pixel) and returns it, the images of the benchmarks and the tests"""
+    header = BMPFile.default_header(width, height, bits_per_pixel)
+    header['reserved1'] = reserved1
+    pixel_data = np.random.default_rng(seed).integers(0, 256, size=width * height * bits_per_pixel // BMPFile.BITS_PER_BYTE, dtype=np.uint8)
+    bmp = BMPFile(header=header, pixel_data=pixel_data.tobytes())
+    bmp.save(file_path)
+    return bmp
+
+
+def parse_size(size: str) -> tuple[int, int]:
+    """Width and height of a size written as WIDTHxHEIGHT, such as 300x300
+
+    Raises:
+        ValueError -- If the size isn't two positive integers separated by x
+    """
+    try:
+        width, height = (int(value) for value in size.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid size: {size}. Expected WIDTHxHEIGHT, such as 300x300")
+    if width < 1 or height < 1:
+        raise ValueError(f"Invalid size: {size}. Width and height must be positive")
+    return width, height
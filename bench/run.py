@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+from bench.fixtures import parse_size, synthetic_bmp
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.plan_cache import PlanCache
+from src.polynomial import Polynomial
+from src.recover_image import RecoverImage
+from src.z251 import Z251
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS isn't reported
+    resource = None
+
+DEFAULT_SIZES = ["300x300", "1024x1024"]
+DEFAULT_K_VALUES = DistributeImage.ALLOWED_K_VALUES
+DEFAULT_EXTRA_SHARES = [0, 2]
+DEFAULT_REPEAT = 3
+DEFAULT_ITERATIONS = 200
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the current process or of its largest child, such as the block workers, in bytes (None where it isn't available)"""
+    if resource is None:
+        return None
+    # Children are only counted once they have been waited for
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def secret_geometry(width: int, height: int, k: int) -> tuple[int, int]:
+    """Geometry of the secret for a k, the height cropped so the pixels split in whole blocks of 2k - 2"""
+    block_size = 2 * k - 2
+    while height > 0 and width * height % block_size:
+        height -= 1
+    if height == 0:
+        raise ValueError(f"No {width}-pixel wide image splits in blocks of {block_size} pixels")
+    return width, height
+
+
+def make_fixtures(directory: str, width: int, height: int, n: int):
+    """Writes the secret and n covers of a case, all of the same geometry"""
+    directory = Path(directory)
+    synthetic_bmp(directory / "secret.bmp", width, height, seed=0)
+    (directory / "covers").mkdir()
+    for i in range(n):
+        synthetic_bmp(directory / "covers" / f"cover{i}.bmp", width, height, seed=i + 1)
+
+
+def time_phases(phases) -> tuple[dict, object]:
+    """Runs each (name, callable) in order, each one receiving the result of the previous one
+
+    Returns:
+        Tuple[dict, object] -- Seconds spent in each phase, and the result of the last one
+    """
+    timings = {}
+    result = None
+    for name, phase in phases:
+        start = time.perf_counter()
+        result = phase(result)
+        timings[name] = time.perf_counter() - start
+    return timings, result
+
+
+def best_run(runs: list[dict]) -> dict:
+    """Phases of the fastest run, the one least disturbed by the rest of the system"""
+    return min(runs, key=lambda phases: sum(phases.values()))
+
+
+def bench_distribute(directory: str, k: int, repeat: int, workers: int = 1) -> dict:
+    directory = Path(directory)
+    cover_paths = sorted((directory / "covers").glob("*.bmp"))
+    runs = []
+    for _ in range(repeat):
+        def read(_):
+            distribute_image = DistributeImage(str(directory / "secret.bmp"), k, participants=[BMPFile(path) for path in cover_paths], workers=workers, seed=0)
+            # With several workers, each one reads its own cover from disk
+            if workers == 1:
+                for cover in distribute_image.participants:
+                    DistributeImage.load_cover(cover)
+            return distribute_image, distribute_image.secret_image.planes().reshape(-1)
+
+        phases, _ = time_phases([
+            ("read", read),
+            ("share", lambda result: (result[0], result[0].compute_shadows(result[1]))),
+            ("embed_save", lambda result: result[0].lsb_hide(result[1], result[0].participants)),
+        ])
+        runs.append(phases)
+    return {"phases": best_run(runs), "peak_rss_bytes": peak_rss_bytes()}
+
+
+def bench_recover(directory: str, k: int, repeat: int, workers: int = 1) -> dict:
+    directory = Path(directory)
+    share_paths = sorted((directory / "covers").glob("*.bmp"))
+    output = directory / "recovered.bmp"
+    runs = []
+    for _ in range(repeat):
+        def open_shares(_):
+            shares = [BMPFile(path, use_mmap=True) for path in share_paths]
+            # A cache of its own, so every run computes its plan
+            recover_image = RecoverImage(shares, k, shares[0].total_pixels, workers=workers, plans=PlanCache())
+            recover_image.validate_shares()
+            return recover_image
+
+        # The phases of RecoverImage.recover, timed one by one
+
+        phases, _ = time_phases([
+            ("open", open_shares),
+            ("plan", lambda recover_image: (recover_image, recover_image.recovery_plan())),
+            ("read_shadows", lambda result: (*result, result[0].read_shadows())),
+            ("reconstruct", lambda result: result[0].reconstruct(result[1], result[2])),
+            ("save", lambda secret_image: secret_image.save(output)),
+        ])
+        runs.append(phases)
+    return {"phases": best_run(runs), "peak_rss_bytes": peak_rss_bytes()}
+
+
+def bench_bmp(file_path: str, repeat: int) -> dict:
+    output = Path(file_path).with_name("copy.bmp")
+    runs = []
+    for _ in range(repeat):
+        def read(_):
+            bmp = BMPFile(file_path)
+            bmp.pixel_data
+            return bmp
+
+        phases, _ = time_phases([
+            ("read", read),
+            ("save", lambda bmp: bmp.save(output)),
+        ])
+        runs.append(phases)
+    return {"phases": best_run(runs), "peak_rss_bytes": peak_rss_bytes()}
+
+
+def bench_interpolate(k: int, iterations: int) -> dict:
+    rng = np.random.default_rng(k)
+    points = [[(Z251(x), Z251(int(y))) for x, y in zip(range(1, k + 1), rng.integers(0, 251, k))] for _ in range(iterations)]
+    start = time.perf_counter()
+    for case in points:
+        Polynomial.interpolate(case)
+    return {"phases": {"interpolate": time.perf_counter() - start}, "peak_rss_bytes": peak_rss_bytes()}
+
+
+def run_isolated(function, *args):
+    """Runs a benchmark in a fresh process, so its peak RSS isn't that of the cases before it"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def record(name: str, operation: str, measurement: dict, **fields) -> dict:
+    seconds = sum(measurement["phases"].values())
+    result = {"name": name, "operation": operation, **fields, "seconds": seconds, **measurement}
+    if "pixels" in fields:
+        result["pixels_per_second"] = fields["pixels"] / seconds if seconds else None
+    if "operations" in fields:
+        result["operations_per_second"] = fields["operations"] / seconds if seconds else None
+    return result
+
+
+def run(sizes: list[str], k_values: list[int], extra_shares: list[int], repeat: int = DEFAULT_REPEAT,
+        iterations: int = DEFAULT_ITERATIONS, workers: int = 1, report=None) -> dict:
+    """Runs every benchmark, each one in a process of its own
+
+    Arguments:
+        sizes {list[str]} -- Geometries of the images, as WIDTHxHEIGHT
+        k_values {list[int]} -- Values of k shared and recovered with
+        extra_shares {list[int]} -- Shares beyond k of each case, n being k plus each of them
+        repeat {int} -- Runs of each case, the fastest one is reported
+        iterations {int} -- Interpolations timed for each k
+        workers {int} -- Processes used by DistributeImage and RecoverImage
+        report {callable} -- Called with a summary line of each result as it completes
+
+    Returns:
+        dict -- Metadata of the run and its results, ready to be dumped as JSON
+    """
+    results = []
+
+    def add(result):
+        results.append(result)
+        if report is not None:
+            report(summary_line(result))
+
+    for k in k_values:
+        add(record(f"interpolate k={k}", "interpolate", run_isolated(bench_interpolate, k, iterations), k=k, operations=iterations))
+
+    for size in sizes:
+        width, height = parse_size(size)
+        with tempfile.TemporaryDirectory() as directory:
+            run_isolated(make_fixtures, directory, width, height, 1)
+            add(record(f"bmp {width}x{height}", "bmp", run_isolated(bench_bmp, str(Path(directory) / "secret.bmp"), repeat), width=width, height=height, pixels=width * height))
+
+        for k in k_values:
+            secret_width, secret_height = secret_geometry(width, height, k)
+            for extra in extra_shares:
+                n = k + extra
+                fields = {"width": secret_width, "height": secret_height, "k": k, "n": n, "pixels": secret_width * secret_height}
+                with tempfile.TemporaryDirectory() as directory:
+                    run_isolated(make_fixtures, directory, secret_width, secret_height, n)
+                    add(record(f"distribute {secret_width}x{secret_height} k={k} n={n}", "distribute", run_isolated(bench_distribute, directory, k, repeat, workers), **fields))
+                    add(record(f"recover {secret_width}x{secret_height} k={k} n={n}", "recover", run_isolated(bench_recover, directory, k, repeat, workers), **fields))
+
+    return {
+        "metadata": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "repeat": repeat,
+            "workers": workers,
+        },
+        "results": results,
+    }
+
+
+def summary_line(result: dict) -> str:
+    line = f"{result['name']}: {result['seconds']:.4f}s"
+    if result.get("pixels_per_second"):
+        line += f", {result['pixels_per_second'] / 1e6:.2f} Mpixels/s"
+    if result.get("operations_per_second"):
+        line += f", {result['operations_per_second']:.0f} ops/s"
+    if result["peak_rss_bytes"] is not None:
+        line += f", peak RSS {result['peak_rss_bytes'] / (1 << 20):.1f} MiB"
+    phases = ", ".join(f"{name} {seconds:.4f}s" for name, seconds in result["phases"].items())
+    return f"{line} ({phases})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark distribution and recovery on synthetic greyscale images.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, metavar="WIDTHxHEIGHT", help=f"Image sizes (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument("--k", nargs="+", type=int, default=DEFAULT_K_VALUES, dest="k_values", help="Values of k (default: 3 to 8)")
+    parser.add_argument(
+        "--extra-shares", nargs="+", type=int, default=DEFAULT_EXTRA_SHARES, metavar="EXTRA",
+        help=f"Shares beyond k, each one a case with n = k + EXTRA (default: {' '.join(map(str, DEFAULT_EXTRA_SHARES))})",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs of each case, the fastest one is reported")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Interpolations timed for each k")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes of DistributeImage and RecoverImage")
+    parser.add_argument("--output", default="bench-results.json", metavar="FILE", help="Where the results are written as JSON")
+    args = parser.parse_args()
+
+    try:
+        results = run(args.sizes, args.k_values, args.extra_shares, repeat=args.repeat, iterations=args.iterations, workers=args.jobs, report=print)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import asyncio
+import inspect
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.bmp_file import BMPFile
+from src.recover_image import RecoverImage
+
+
+async def recover_first_k(sources, k: int, share_length: int = None, workers: int = 1) -> BMPFile:
+    """Recovers the secret from the first k valid shares to arrive
+
+    Every source is read concurrently, and reconstruction starts as soon as k shares with distinct,
+    non zero ids (header['reserved1']) have been read. The reads still pending are then cancelled, so
+    the wait depends on the k-th fastest share rather than on the slowest one. Sources that fail to load
+    or repeat an id are skipped, and only shares of the same geometry are recovered together: the first k
+    of a size and bit depth are used, whatever arrives of another one is left out.
+
+        secret_image = asyncio.run(recover_first_k(["shares/a.bmp", fetch_share("b"), ...], k=3))
+
+    Reads of paths run in worker threads: a cancelled one is abandoned and its result discarded, but the
+    thread finishes the read in the background. Cancelled awaitables stop at their next await.
+
+    Arguments:
+        sources {list} -- Paths of the shares, BMPFile objects, or awaitables returning either of them
+        k {int} -- Minimum number of shadows to recover the secret
+        share_length {int} -- Pixels of the secret image (default: those of the first share that arrives)
+        workers {int} -- Processes used to recover the blocks of large secrets in parallel
+
+    Raises:
+        ValueError -- If fewer than k valid shares could be read
+        CheatingDetectedError -- If any block fails the cheating check
+
+    Returns:
+        BMPFile -- The recovered secret image
+    """
+    pending = {asyncio.ensure_future(read_share(source, k, share_length)) for source in sources}
+    # Shares and their shadows by geometry, then by id
+    groups = {}
+    shares = {}
+    try:
+        while pending and len(shares) < k:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None or len(shares) == k:
+                    continue
+                share, shadow = task.result()
+                share_id = share.header['reserved1'] % z251_array.MODULUS
+                group = groups.setdefault(geometry(share), {})
+                if share_id != 0 and share_id not in group:
+                    group[share_id] = (share, shadow)
+                    shares = group
+    finally:
+        # Nothing waits for the cancelled reads, they only need to stop delivering shares
+        for task in pending:
+            task.cancel()
+
+    if len(shares) < k:
+        distinct = max((len(group) for group in groups.values()), default=0)
+        raise ValueError(f"Only {distinct} shares of the same size with distinct ids could be read. At least {k} shares are required")
+
+    recover_image = RecoverImage([share for share, _ in shares.values()], k=k, share_length=share_length or next(iter(shares.values()))[0].total_pixels, workers=workers)
+    # The shadows were read along with the shares, in the order RecoverImage selected them
+    shadows = np.stack([shares[share.header['reserved1'] % z251_array.MODULUS][1] for share in recover_image.shares])
+    return await asyncio.to_thread(recover_image.reconstruct, recover_image.recovery_plan(), shadows)
+
+
+async def read_share(source, k: int, share_length: int = None):
+    """Reads a share given as a path, a BMPFile or an awaitable returning either of them, and its shadow, without blocking the event loop"""
+    if inspect.isawaitable(source):
+        source = await source
+    return await asyncio.to_thread(load_share, source, k, share_length)
+
+
+def geometry(share: BMPFile):
+    return share.header['width'], share.header['height'], share.header['bits_per_pixel']
+
+
+def load_share(source, k: int, share_length: int = None):
+    """Maps a share and reads its shadow, only from the rows that carry it (see RecoverImage.read_shadow)
+
+    Raises:
+        ValueError -- If the share is too small to carry a shadow
+    """
+    if isinstance(source, BMPFile):
+        return source, read_shadow(source, k, share_length)
+    # The shadow is a copy, so the mapping is released right away, even by reads that were cancelled
+    with BMPFile(Path(source), use_mmap=True) as share:
+        return share, read_shadow(share, k, share_length)
+
+
+def read_shadow(share: BMPFile, k: int, share_length: int = None):
+    # A reader over this share alone knows the carrier prefix of its shadow
+    reader = RecoverImage([share] * k, k=k, share_length=share_length or share.total_pixels)
+    reader.validate_shares()
+    return reader.read_shadow(share)
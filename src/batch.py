@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+
+DEFAULT_WORKERS = 4
+JOURNAL_SUFFIX = '.done'
+
+
+class BatchJob:
+    """
+    One manifest entry: a secret shared with a (k, n) scheme among a cover set
+
+        {"secret": "secrets/a.bmp", "k": 3, "covers": "covers/", "output": "shares/a/"}
+
+    covers is a directory (every .bmp in it) or a list of cover files (separated by ';' in CSV manifests).
+    With an output directory the covers are left untouched and the shares are written there, under the
+    names of the covers. Without one, the shadows are hidden in the covers themselves.
+    """
+
+    def __init__(self, line: int, secret: str, k: int, covers, output: str = None, seed: int = None):
+        self.line = line
+        self.secret = secret
+        self.k = int(k)
+        if isinstance(covers, str) and Path(covers).is_dir():
+            self.covers = tuple(str(cover) for cover in sorted(Path(covers).glob("*.bmp")))
+        else:
+            self.covers = tuple(covers.split(";") if isinstance(covers, str) else covers)
+        self.output = output or None
+        self.seed = None if seed in (None, "") else int(seed)
+
+    @property
+    def key(self) -> str:
+        """Identifies the job in the journal, so it isn't run again when the batch is resumed"""
+        spec = json.dumps([self.secret, self.k, self.covers, self.output, self.seed])
+        return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+class CoverSet:
+    """
+    Covers shared by several jobs, read once for all of them
+
+    Jobs with an output directory embed their shadows in copies of the pixels read the first time, so
+    hundreds of secrets hidden in the same covers read each cover once. The job that hides its shadows in
+    the covers themselves (a set has one at most) takes the lock for its whole run, so the covers aren't
+    read while they're rewritten. The pixels are dropped once every job of the set is done.
+    """
+
+    def __init__(self, paths: tuple[str, ...]):
+        self.paths = paths
+        self.lock = threading.Lock()
+        self.pending_jobs = 0
+        self._covers = None
+
+    def copies(self, output: Path) -> list[BMPFile]:
+        """In-memory copies of the covers, which are saved into the output directory"""
+        with self.lock:
+            if self._covers is None:
+                covers = [BMPFile(path) for path in self.paths]
+                for cover in covers:
+                    # Reads the pixels and the color table of the lazily loaded cover
+                    cover.pixel_data
+                    cover.gap_data
+                self._covers = covers
+            covers = self._covers
+
+        copies = []
+        for cover in covers:
+            copy = BMPFile(header=dict(cover.header), pixel_data=cover.pixel_data, gap_data=cover.gap_data)
+            copy.file_path = str(output / Path(cover.file_path).name)
+            copies.append(copy)
+        return copies
+
+    def job_done(self):
+        with self.lock:
+            self.pending_jobs -= 1
+            if self.pending_jobs == 0:
+                self._covers = None
+
+
+class Batch:
+    """
+    Distributes every secret of a manifest, concurrently, and journals the jobs that finish
+
+    Jobs hiding their shadows in the same covers share a single read of them, and run on a pool of
+    threads (the heavy lifting happens in NumPy, outside the GIL). Every finished job is appended to the
+    journal, which is flushed to disk, so an interrupted batch resumes where it stopped:
+
+        batch = Batch(Batch.read_manifest("nightly.jsonl"), journal="nightly.jsonl.done", workers=4)
+        results = batch.run(print)
+    """
+
+    def __init__(self, jobs: list[BatchJob], journal: str, workers: int = DEFAULT_WORKERS):
+        """
+        Arguments:
+            jobs {list[BatchJob]} -- Jobs of the manifest
+            journal {str} -- File listing the finished jobs, appended to as they finish
+            workers {int} -- Jobs run at the same time
+
+        Raises:
+            ValueError -- If several jobs hide their shadows in the same covers, each one overwriting the last
+        """
+        if workers < 1:
+            raise ValueError(f"Invalid workers amount: {workers}. At least 1 is required")
+        in_place_lines = {}
+        for job in jobs:
+            if job.output is None:
+                in_place_lines.setdefault(job.covers, []).append(job.line)
+        for lines in in_place_lines.values():
+            if len(lines) > 1:
+                raise ValueError(f"Jobs at lines {lines} hide their shadows in the same covers, only one of them can (give the others an output)")
+        self.jobs = jobs
+        self.journal = journal
+        self.workers = workers
+        self.cover_sets = {}
+        for job in jobs:
+            self.cover_sets.setdefault(job.covers, CoverSet(job.covers)).pending_jobs += 1
+        self._journal_lock = threading.Lock()
+
+    @staticmethod
+    def read_manifest(file_path: str) -> list[BatchJob]:
+        """Reads a manifest of JSON lines, or a CSV file with a header row (secret, k, covers, output, seed)
+
+        Raises:
+            ValueError -- If an entry lacks a field or isn't valid
+        """
+        jobs = []
+        with open(file_path, newline='') as file:
+            if Path(file_path).suffix.lower() == '.csv':
+                reader = csv.DictReader(file)
+                entries = ((reader.line_num, entry) for entry in reader)
+            else:
+                entries = ((line, json.loads(text)) for line, text in enumerate(file, start=1) if text.strip())
+            try:
+                for line, entry in entries:
+                    try:
+                        jobs.append(BatchJob(line, entry["secret"], entry["k"], entry["covers"], entry.get("output"), entry.get("seed")))
+                    except (KeyError, TypeError, ValueError) as error:
+                        raise ValueError(f"Invalid manifest entry at line {line}: {error!r}")
+            except json.JSONDecodeError as error:
+                raise ValueError(f"Invalid manifest: {error}")
+        return jobs
+
+    def finished_jobs(self) -> set[str]:
+        """Keys of the jobs already in the journal"""
+        if not os.path.exists(self.journal):
+            return set()
+        with open(self.journal) as file:
+            # A line cut short by an interruption is ignored, its job runs again
+            return {entry["job"] for entry in map(parse_journal_line, file) if entry is not None}
+
+    def run(self, report=None) -> list[dict]:
+        """Runs the jobs that aren't in the journal yet
+
+        Arguments:
+            report {callable} -- Called with the result line of each job as it finishes (or is skipped)
+
+        Returns:
+            list[dict] -- Result of each job, in manifest order: its status ("ok", "skipped" or "error"),
+                          and the timings or the error
+        """
+        finished = self.finished_jobs()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Jobs are started grouped by k and cover set, so the covers of a set are only held while its jobs run
+            futures = {
+                job: executor.submit(self.run_job, job, job.key in finished, report)
+                for job in sorted(self.jobs, key=lambda job: (job.k, job.covers))
+            }
+            return [futures[job].result() for job in self.jobs]
+
+    def run_job(self, job: BatchJob, skip: bool = False, report=None) -> dict:
+        if skip:
+            result = {"line": job.line, "secret": job.secret, "status": "skipped"}
+        else:
+            try:
+                result = {"line": job.line, "secret": job.secret, "status": "ok", **self.distribute(job)}
+            except Exception as error:
+                # Whatever a malformed secret or cover raises fails its job alone, the rest of the batch still runs
+                result = {"line": job.line, "secret": job.secret, "status": "error", "error": str(error) or type(error).__name__}
+            else:
+                self.record(job, result)
+        self.cover_sets[job.covers].job_done()
+
+        if report is not None:
+            report(result_line(result))
+        return result
+
+    def distribute(self, job: BatchJob) -> dict:
+        """Distributes the secret of a job, returning the time spent reading, sharing and writing, in seconds"""
+        if len(job.covers) < job.k:
+            raise ValueError(f"At least {job.k} covers are required, {len(job.covers)} given")
+        cover_set = self.cover_sets[job.covers]
+        start = time.perf_counter()
+
+        if job.output is not None:
+            output = Path(job.output)
+            output.mkdir(parents=True, exist_ok=True)
+            return self.share(job, cover_set.copies(output), start)
+        with cover_set.lock:
+            return self.share(job, [BMPFile(cover) for cover in cover_set.paths], start)
+
+    @staticmethod
+    def share(job: BatchJob, covers: list[BMPFile], start: float) -> dict:
+        distribute_image = DistributeImage(job.secret, job.k, participants=covers, seed=job.seed)
+        pixels = distribute_image.secret_image.planes().reshape(-1)
+        read = time.perf_counter()
+        shadows = distribute_image.compute_shadows(pixels)
+        shared = time.perf_counter()
+        distribute_image.bytes_written = distribute_image.lsb_hide(shadows, covers)
+        written = time.perf_counter()
+        return {
+            "shares": len(covers),
+            "bytes_written": sum(distribute_image.bytes_written),
+            "read_seconds": read - start,
+            "share_seconds": shared - read,
+            "write_seconds": written - shared,
+            "total_seconds": written - start,
+        }
+
+    def record(self, job: BatchJob, result: dict):
+        with self._journal_lock:
+            with open(self.journal, 'a') as file:
+                file.write(json.dumps({"job": job.key, **result}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+
+def parse_journal_line(text: str) -> dict:
+    try:
+        entry = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return entry if isinstance(entry, dict) and "job" in entry else None
+
+
+def result_line(result: dict) -> str:
+    prefix = f"[line {result['line']}] {result['secret']}"
+    match result["status"]:
+        case "ok":
+            return (
+                f"{prefix}: {result['shares']} shares, {result['bytes_written']} bytes written in {result['total_seconds']:.3f}s "
+                f"(read {result['read_seconds']:.3f}s, share {result['share_seconds']:.3f}s, write {result['write_seconds']:.3f}s)"
+            )
+        case "skipped":
+            return f"{prefix}: already distributed, skipped"
+        case _:
+            return f"{prefix}: Error: {result['error']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute every secret image of a manifest.")
+    parser.add_argument(
+        "manifest",
+        help="JSON lines, or CSV with a header row, of secret, k, covers (a directory or ';'-separated .bmp files), and optionally output (a directory) and seed",
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Number of jobs run at the same time")
+    parser.add_argument(
+        "--journal",
+        metavar="FILE",
+        help=f"File listing the finished jobs, which are skipped when the batch is run again (default: the manifest path followed by {JOURNAL_SUFFIX})",
+    )
+    args = parser.parse_args()
+
+    try:
+        jobs = Batch.read_manifest(args.manifest)
+        batch = Batch(jobs, journal=args.journal or args.manifest + JOURNAL_SUFFIX, workers=args.workers)
+    except (ValueError, OSError) as error:
+        print(f"Error: {error}")
+        return
+
+    start = time.perf_counter()
+    results = batch.run(print)
+    statuses = [result["status"] for result in results]
+    print(
+        f"{statuses.count('ok')} distributed, {statuses.count('skipped')} skipped, {statuses.count('error')} failed "
+        f"in {time.perf_counter() - start:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+import numpy as np
+from src import z251_array
+
+
+def max_errors(n: int, k: int) -> int:
+    """Number of wrong values that can be located among n evaluations of a k-1 degree polynomial"""
+    return (n - k) // 2
+
+
+def decode(xs, k: int, values) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Berlekamp-Welch decoding of many polynomials evaluated at the same points, all at once
+
+    For each polynomial f of degree k-1 with evaluations y_j at x_j, some of them possibly wrong, it finds an
+    error locator E (monic, of degree e = (n - k) // 2) and Q = f * E such that Q(x_j) = y_j * E(x_j) for
+    every j. That is one linear system per polynomial, and every system is solved in the same batch.
+    f is then Q / E, and the evaluations it doesn't go through are the wrong ones.
+
+    Arguments:
+        xs {array_like} -- Distinct, non zero evaluation points (n,)
+        k {int} -- Number of coefficients of every polynomial
+        values {array_like} -- Evaluations (n, m), column c holds the n values of polynomial c
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray] --
+            Coefficients (m, k), constant term first,
+            wrong evaluations (m, n), True where y_j doesn't match f(x_j),
+            and whether each polynomial could be decoded (m,), False when it has more than e wrong values
+    """
+    xs = z251_array.reduce(xs)
+    values = z251_array.reduce(values).T
+    n = len(xs)
+    if n < k:
+        raise ValueError(f"Invalid evaluations amount: {n}. At least {k} are required")
+    e = max_errors(n, k)
+    vandermonde = z251_array.vandermonde(xs, e + k)
+
+    # Unknowns: q_0, ..., q_{e+k-1} followed by e_0, ..., e_{e-1}, the x^e coefficient of E being 1
+    #   Q(x_j) - y_j * (e_0 + ... + e_{e-1} x_j^{e-1}) = y_j * x_j^e
+    locator_terms = z251_array.mul(values[:, :, np.newaxis], vandermonde[np.newaxis, :, :e])
+    systems = np.concatenate((np.broadcast_to(vandermonde, (len(values), n, e + k)), z251_array.neg(locator_terms)), axis=2)
+    solutions, decoded = z251_array.solve(systems, z251_array.mul(values, vandermonde[:, e]))
+
+    quotient, remainder = divide(solutions[:, :e + k], np.concatenate((solutions[:, e + k:], np.ones((len(values), 1), dtype=np.uint8)), axis=1))
+    decoded &= ~np.any(remainder, axis=1)
+
+    wrong = z251_array.dot(quotient, z251_array.vandermonde(xs, k).T) != values
+    decoded &= wrong.sum(axis=1) <= e
+    return quotient, wrong, decoded
+
+
+def divide(dividend: np.ndarray, divisor: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Long division of a batch of polynomials by monic ones, coefficients constant term first
+
+    Arguments:
+        dividend {np.ndarray} -- Coefficients (m, d + 1)
+        divisor {np.ndarray} -- Coefficients (m, e + 1), the last one being 1
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- Quotients (m, d - e + 1) and remainders (m, e)
+    """
+    e = divisor.shape[1] - 1
+    remainder = z251_array.reduce(dividend).copy()
+    quotient = np.zeros((len(dividend), dividend.shape[1] - e), dtype=np.uint8)
+    for degree in range(quotient.shape[1] - 1, -1, -1):
+        quotient[:, degree] = remainder[:, degree + e]
+        remainder[:, degree:degree + e + 1] = z251_array.sub(
+            remainder[:, degree:degree + e + 1], z251_array.mul(quotient[:, degree, np.newaxis], divisor)
+        )
+    return quotient, remainder[:, :e]
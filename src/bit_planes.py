@@ -0,0 +1,48 @@
+from __future__ import annotations
+import numpy as np
+from src.bmp_file import BMPFile
+
+
+def _shifts(bits: int) -> np.ndarray:
+    if BMPFile.BITS_PER_BYTE % bits != 0:
+        raise ValueError(f"Invalid amount of bits: {bits}. It must divide {BMPFile.BITS_PER_BYTE}")
+    # Most significant group first, e.g. [4, 0] for 4 bits or [6, 4, 2, 0] for 2 bits
+    return np.arange(BMPFile.BITS_PER_BYTE - bits, -1, -bits, dtype=np.uint8)
+
+
+def unpack(data, bits: int) -> np.ndarray:
+    """
+    Splits every byte into groups of bits, most significant group first
+
+        unpack(b"\\xb4", 2) -> [0b10, 0b11, 0b01, 0b00]
+
+    Arguments:
+        data {array_like} -- Bytes to split (bytes, bytearray or uint8 array)
+        bits {int} -- Size of each group (2 or 4)
+
+    Returns:
+        np.ndarray -- uint8 array with len(data) * 8 / bits groups
+    """
+    data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray, memoryview)) else np.asarray(data, dtype=np.uint8)
+    mask = (1 << bits) - 1
+    return ((data[:, np.newaxis] >> _shifts(bits)) & mask).reshape(-1)
+
+
+def pack(groups, bits: int) -> np.ndarray:
+    """
+    Joins groups of bits back into bytes, the inverse of unpack. Only the lowest bits of each group are used,
+    so the carrier bytes themselves can be passed in
+
+    Arguments:
+        groups {array_like} -- Groups of bits, most significant group first (length multiple of 8 / bits)
+        bits {int} -- Size of each group (2 or 4)
+
+    Returns:
+        np.ndarray -- uint8 array with exactly len(groups) * bits / 8 bytes
+    """
+    shifts = _shifts(bits)
+    groups = np.asarray(groups, dtype=np.uint8)
+    if len(groups) % len(shifts) != 0:
+        raise ValueError(f"Invalid amount of groups: {len(groups)}. It must be a multiple of {len(shifts)}")
+    mask = (1 << bits) - 1
+    return np.bitwise_or.reduce((groups.reshape(-1, len(shifts)) & mask) << shifts, axis=1).astype(np.uint8)
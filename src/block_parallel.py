@@ -0,0 +1,86 @@
+from __future__ import annotations
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from typing import Callable, List, Tuple
+
+
+# Below this many blocks per chunk, starting processes costs more than the work they take over
+MIN_BLOCKS_PER_CHUNK = 1 << 16
+# More chunks than workers, so a slow chunk doesn't leave the other workers idle at the end
+CHUNKS_PER_WORKER = 4
+
+
+class SharedArray:
+    """
+    NumPy array that lives in multiprocessing.shared_memory, so worker processes can read and write it
+    without any pixel being pickled. Only its spec (name, shape, dtype) travels to the workers:
+
+        with SharedArray((n, 2 * t)) as shadows:
+            executor.submit(work, shadows.spec)  # in the worker: SharedArray.attach(spec)
+    """
+
+    def __init__(self, shape, dtype=np.uint8, name=None):
+        shape = tuple(int(dimension) for dimension in shape)
+        dtype = np.dtype(dtype)
+        if name is None:
+            self.shm = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+            self.owner = True
+        else:
+            self.shm = SharedMemory(name=name, **({'track': False} if sys.version_info >= (3, 13) else {}))
+            if sys.version_info < (3, 13):
+                # Only the creator should unlink the segment, so attaching must not register it again
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            self.owner = False
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+        self.spec = (self.shm.name, shape, dtype.str)
+
+    @classmethod
+    def attach(cls, spec) -> "SharedArray":
+        name, shape, dtype = spec
+        return cls(shape, dtype=dtype, name=name)
+
+    @classmethod
+    def from_array(cls, array) -> "SharedArray":
+        shared = cls(np.shape(array), dtype=np.asarray(array).dtype)
+        shared.array[...] = array
+        return shared
+
+    def close(self):
+        # The view must be released before the segment is closed
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def block_ranges(total_blocks: int, workers: int, min_blocks: int = None) -> List[Tuple[int, int]]:
+    """Splits the blocks [0, total_blocks) into contiguous chunks [first, last) for the workers"""
+    min_blocks = MIN_BLOCKS_PER_CHUNK if min_blocks is None else min_blocks
+    chunks = max(1, min(workers * CHUNKS_PER_WORKER, total_blocks // max(1, min_blocks)))
+    bounds = np.linspace(0, total_blocks, chunks + 1).astype(int)
+    return [(int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool of worker processes started by a fork server (or spawned where there is none), never forked
+    from the caller, which may hold locks of its other threads, such as those of the daemon or of I/O pools"""
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+
+
+def run(function: Callable, ranges: List[Tuple[int, int]], workers: int, *args):
+    """Calls function(first, last, *args) for every block range in a pool of worker processes"""
+    with process_pool(workers) as executor:
+        futures = [executor.submit(function, first, last, *args) for first, last in ranges]
+        for future in futures:
+            future.result()
@@ -1,19 +1,50 @@
+import mmap
+import os
 import struct
+import numpy as np
+from src.utils import atomic_write, convert_to_matrix, flatten_array, strip_row_padding
 
 class BMPFile:
     HEADER_BYTES = 54
     BITS_PER_BYTE = 8
     ROW_ALIGNMENT = 4
+    # signature, file_size, reserved1, reserved2, data_offset, header_size, width, height, planes,
+    # bits_per_pixel, compression, image_size, x_pixels_per_meter, y_pixels_per_meter, total_colors, important_colors
+    HEADER_FORMAT = '<2sIHHIIIIHHIIIIII'
+    RESERVED1_OFFSET = 6
 
-    def __init__(self, file_path=None, header=None, image_data=None):
-        if file_path and not header and not image_data:
+    def __init__(self, file_path=None, header=None, image_data=None, pixel_data=None, use_mmap=False, gap_data=None):
+        """
+        Arguments:
+            file_path {str} -- BMP file to load
+            header {dict} -- Header of an image built in memory, together with image_data or pixel_data
+            gap_data {bytes} -- Bytes between the header and data_offset (the color table) of an image built in memory
+            use_mmap {bool} -- Map the file instead of reading it. The pixels are then a read-only view
+                               over the mapping, and they are only copied when pixel_data is accessed to mutate them
+
+        Only the header of a file is read on construction, the pixels and the gap bytes are read the first
+        time they are accessed. Geometry checks, such as capacity or is_dibisible_by, never read them.
+        """
+        self._pixel_data = None
+        self._mapped_pixels = None
+        self._mmap = None
+        self._pending = False
+        self._gap_data = gap_data
+        if file_path and not header and image_data is None and pixel_data is None:
             self.file_path = file_path
             self.header = {}
             self.header_size = {}
-            self.image_data = []
             self.set_header_size()
-            self.read_header()
-            self.read_image_data()
+            if use_mmap:
+                self.map_file()
+            else:
+                self.read_header()
+                self._pending = True
+        elif header is not None and pixel_data is not None:
+            self.header_size = {}
+            self.set_header_size()
+            self.header = header
+            self.pixel_data = bytearray(pixel_data)
         elif header is not None and image_data is not None:
             self.header_size = {}
             self.set_header_size()
@@ -22,6 +53,71 @@ class BMPFile:
         else:
             raise ValueError("Invalid arguments")
 
+    @property
+    def pixel_data(self):
+        """
+        Contiguous, mutable pixel buffer (rows in file order, without row padding).
+        For memory-mapped files this is where the pixels get copied out of the mapping.
+        """
+        if self._pending:
+            self.read_image_data()
+        if self._pixel_data is None and self._mapped_pixels is not None:
+            self._pixel_data = bytearray(self._mapped_pixels.tobytes())
+            self._mapped_pixels = None
+        return self._pixel_data
+
+    @pixel_data.setter
+    def pixel_data(self, pixel_data):
+        self._pixel_data = pixel_data
+        self._mapped_pixels = None
+        self._pending = False
+
+    @property
+    def gap_data(self):
+        """Bytes between the header and data_offset (the color table), read on first access"""
+        if self._gap_data is None and self._pending:
+            self.read_gap_data()
+        return self._gap_data
+
+    @gap_data.setter
+    def gap_data(self, gap_data):
+        self._gap_data = gap_data
+
+    @property
+    def is_loaded(self):
+        """False while only the header of the file has been read"""
+        return not self._pending
+
+    @property
+    def is_on_disk(self):
+        """True while the pixels are those of the file, not read yet or a view over its mapping, so another process can load them"""
+        return self._pending or self._mapped_pixels is not None
+
+    @property
+    def pixels(self):
+        """
+        2-D NumPy view (height, width * bytes_per_pixel) over the pixels, rows in file order.
+        Writing to the view writes to pixel_data, unless the file is still memory-mapped,
+        in which case the view is read-only and strided over the padded rows of the mapping.
+        """
+        if self._mapped_pixels is not None:
+            return self._mapped_pixels
+        return np.frombuffer(self.pixel_data, dtype=np.uint8).reshape(self.header['height'], self.row_bytes)
+
+    @property
+    def image_data(self):
+        """
+        Rows of pixels, each pixel as a bytes object of bytes_per_pixel length.
+        Kept for compatibility, pixel_data holds the actual image.
+        """
+        data = self.pixels.tobytes()
+        pixels = [data[i:i + self.bytes_per_pixel] for i in range(0, len(data), self.bytes_per_pixel)]
+        return convert_to_matrix(pixels, self.header['width'], self.header['height'])
+
+    @image_data.setter
+    def image_data(self, image_data):
+        self.pixel_data = bytearray(b"".join(flatten_array(image_data)))
+
     @property
     def total_pixels(self):
         return self.header['width'] * self.header['height']
@@ -34,10 +130,20 @@ class BMPFile:
     def bytes_per_pixel(self):
         return self.header['bits_per_pixel'] // BMPFile.BITS_PER_BYTE
     
+    @property
+    def channels(self):
+        """Bytes of each pixel that are shared as separate planes (3 for 24-bit images)"""
+        return max(1, self.bytes_per_pixel)
+
     @property
     def total_bytes(self):
         return self.total_bits // BMPFile.BITS_PER_BYTE
     
+    @property
+    def row_bytes(self):
+        """Bytes of pixel data in each row, without padding"""
+        return self.header['width'] * self.bytes_per_pixel
+
     @property
     def is_square(self):
         return self.header['width'] == self.header['height']
@@ -62,28 +168,104 @@ class BMPFile:
         """
         return self.total_pixels % n == 0
 
+    def planes(self) -> np.ndarray:
+        """Pixels de-interleaved into one contiguous plane per channel (channels, total_pixels)"""
+        return BMPFile.to_planes(self.pixels.reshape(-1), self.channels)
+
+    @staticmethod
+    def to_planes(pixel_bytes, channels: int) -> np.ndarray:
+        """De-interleaves pixel bytes (B, G, R, B, G, R, ...) into a (channels, pixels) stack of contiguous planes"""
+        return np.ascontiguousarray(np.asarray(pixel_bytes).reshape(-1, channels).T)
+
+    @staticmethod
+    def from_planes(planes) -> np.ndarray:
+        """Interleaves a (channels, pixels) stack of planes back into pixel bytes, in a single pass"""
+        planes = np.asarray(planes)
+        return np.ascontiguousarray(planes.T).reshape(-1)
+
     def read_header(self):
         with open(self.file_path, 'rb') as file:
             # Read the first 54 bytes corresponding to the header
-            header_data = file.read(BMPFile.HEADER_BYTES)
-
-            # Get the header data
-            self.header['signature'] = header_data[:2].decode('utf-8')
-            self.header['file_size'] = int.from_bytes(header_data[2:6], 'little')
-            self.header['reserved1'] = int.from_bytes(header_data[6:8], 'little')
-            self.header['reserved2'] = int.from_bytes(header_data[8:10], 'little')
-            self.header['data_offset'] = int.from_bytes(header_data[10:14], 'little')
-            self.header['header_size'] = int.from_bytes(header_data[14:18], 'little')
-            self.header['width'] = int.from_bytes(header_data[18:22], 'little')
-            self.header['height'] = int.from_bytes(header_data[22:26], 'little')
-            self.header['planes'] = int.from_bytes(header_data[26:28], 'little')
-            self.header['bits_per_pixel'] = int.from_bytes(header_data[28:30], 'little')
-            self.header['compression'] = int.from_bytes(header_data[30:34], 'little')
-            self.header['image_size'] = int.from_bytes(header_data[34:38], 'little')
-            self.header['x_pixels_per_meter'] = int.from_bytes(header_data[38:42], 'little')
-            self.header['y_pixels_per_meter'] = int.from_bytes(header_data[42:46], 'little')
-            self.header['total_colors'] = int.from_bytes(header_data[46:50], 'little')
-            self.header['important_colors'] = int.from_bytes(header_data[50:54], 'little')
+            self.parse_header(file.read(BMPFile.HEADER_BYTES))
+
+    def parse_header(self, buffer):
+        """Fill the header from the first 54 bytes of buffer (bytes, mmap or any object supporting the buffer protocol)
+
+        Raises:
+            ValueError -- If the buffer is too short to hold a BMP header
+        """
+        try:
+            values = struct.unpack_from(BMPFile.HEADER_FORMAT, buffer, 0)
+        except struct.error:
+            raise ValueError(f"{self.file_path} is too small to be a BMP file")
+        for key, value in zip(self.header_size.keys(), values):
+            self.header[key] = value.decode('utf-8') if key == 'signature' else value
+
+    def map_file(self):
+        """Map the file once and expose the pixels as a read-only view over the mapping, without copying them"""
+        with open(self.file_path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.parse_header(self._mmap)
+        self.gap_data = self._mmap[BMPFile.HEADER_BYTES:self.header['data_offset']]
+
+        self._mapped_pixels = self.pixel_view(self._mmap)
+
+    def close(self):
+        """Releases the mapping of a file opened with use_mmap. Pixels that weren't copied out are read from the file if accessed again"""
+        if self._mmap is None:
+            return
+        self._mapped_pixels = None
+        self._mmap.close()
+        self._mmap = None
+        self._pending = self._pixel_data is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pixel_view(self, buffer, offset=None, rows=None):
+        """
+        2-D view (rows, width * bytes_per_pixel) over padded pixel rows stored in a buffer.
+        Row padding is skipped through the row stride, so no byte is moved.
+        The view is writable if the buffer is.
+
+        Arguments:
+            buffer -- Buffer holding the rows, by default the whole file (such as an mmap)
+            offset {int} -- Position of the first row in buffer (default: data_offset)
+            rows {int} -- Number of rows (default: height)
+        """
+        return np.ndarray(
+            shape=(self.header['height'] if rows is None else rows, self.row_bytes),
+            dtype=np.uint8,
+            buffer=buffer,
+            offset=self.header['data_offset'] if offset is None else offset,
+            strides=(self.row_bytes + self.row_padding, 1),
+        )
+
+    def rows_spanning(self, start, stop):
+        """Returns the first row and the number of rows that hold the pixel bytes [start, stop)"""
+        first_row = start // self.row_bytes
+        return first_row, (stop - 1) // self.row_bytes - first_row + 1
+
+    def read_rows(self, file, first_row, rows):
+        """Reads rows (with their padding) from an open file with a single pread, as a mutable buffer"""
+        row_size = self.row_bytes + self.row_padding
+        return bytearray(os.pread(file.fileno(), rows * row_size, self.header['data_offset'] + first_row * row_size))
+
+    def write_rows(self, file, first_row, data):
+        """Writes rows (with their padding) read with read_rows back to an open file with a single pwrite"""
+        row_size = self.row_bytes + self.row_padding
+        return os.pwrite(file.fileno(), data, self.header['data_offset'] + first_row * row_size)
+
+    def read_pixels(self, file, start, stop):
+        """Reads only the pixel bytes [start, stop) (rows in file order, without padding) from an open file"""
+        first_row, rows = self.rows_spanning(start, stop)
+        region = self.pixel_view(self.read_rows(file, first_row, rows), offset=0, rows=rows)
+        skipped = first_row * self.row_bytes
+        return region.reshape(-1)[start - skipped:stop - skipped]
 
     def set_header_size(self):
         self.header_size['signature'] = 2
@@ -103,26 +285,22 @@ class BMPFile:
         self.header_size['total_colors'] = 4
         self.header_size['important_colors'] = 4
 
+    def read_gap_data(self):
+        with open(self.file_path, 'rb') as file:
+            file.seek(BMPFile.HEADER_BYTES)
+            self.gap_data = file.read(self.header['data_offset'] - BMPFile.HEADER_BYTES)
+
     def read_image_data(self):
         with open(self.file_path, 'rb') as file:
             # Skip the first bytes corresponding to the header
-            file.seek(self.header['data_offset'])
-
-            # Iterate over each row of pixels
-            for _ in range(self.header['height']):
-                row_data = []
-
-                # Iterate over each pixel in the row
-                for _ in range(self.header['width']):
-                    # Read the pixel data corresponding to the bits per pixel size
-                    pixel_data = file.read(self.bytes_per_pixel)
-                    row_data.append(pixel_data)
+            file.seek(BMPFile.HEADER_BYTES)
 
-                # Skip the row padding, if present
-                file.seek(self.row_padding, 1)
+            # Keep whatever the file has between the header and the data (the color table) to write it back on save
+            self.gap_data = file.read(self.header['data_offset'] - BMPFile.HEADER_BYTES)
 
-                # Add the row pixel data to the image data list
-                self.image_data.append(row_data)
+            # Read every row at once and drop the row padding, if present
+            raw_data = file.read((self.row_bytes + self.row_padding) * self.header['height'])
+            self.pixel_data = strip_row_padding(raw_data, self.row_bytes, self.row_padding, self.header['height'])
 
     def print_header_info(self):
         print("[Header Info]")
@@ -150,39 +328,69 @@ class BMPFile:
                 print(pixel_data)
             print()
 
-    def save(self, file_path):
+    def save(self, file_path, atomic=False):
         """Save the image data as a BMP file
         
         Arguments:
             file_path {str} -- File path to save the BMP file
+            atomic {bool} -- Write to a temporary file in the same directory and rename it over file_path,
+                             so readers never see a partially written image
         """
-        flatten_array = []
-        for row in self.image_data:
-            for pixel in row:
-                flatten_array.append(pixel)
-
-        with open(file_path, 'w+b') as file:
-            file.seek(0)
-            for key, value in self.header.items():
-                if key == 'signature':
-                    file.write(value.encode('utf-8'))
-                else:
-                    file.write(value.to_bytes(self.header_size[key], 'little'))
-
-            # this is in order to copy what other bmp files
-            # had between the header and the data
-            zero = 0
-            count = 0
-            for _ in range(BMPFile.HEADER_BYTES, self.header['data_offset']):
-                file.write(zero.to_bytes(1, 'little'))
-                count += 1
-                if count == 4:
-                    count = 0
-                    zero += 1
-
-            for column in range(self.header['height']):
-                for row in range(self.header['width']):
-                    file.write(flatten_array[column * self.header['width'] + row])
+        # Pixels that haven't been read yet must be read before the file is truncated
+        if self._pending:
+            self.read_image_data()
+
+        # Truncating the file that is still mapped would pull the pixels out from under the mapping
+        if self._mapped_pixels is not None and os.path.exists(file_path) and os.path.samefile(file_path, self.file_path):
+            atomic = True
+
+        if not atomic:
+            with open(file_path, 'wb') as file:
+                self.write(file)
+            return
+
+        with atomic_write(file_path) as file:
+            self.write(file)
+
+    def write(self, file):
+        """Write the whole BMP file (header, gap bytes and padded rows) to a binary file object in a few large writes"""
+        self.write_header(file)
+        self.write_rows_to(file, self.pixels)
+
+    def write_header(self, file):
+        """Write the header and the gap bytes up to data_offset to a binary file object"""
+        gap_data = self.gap_data
+        if gap_data is None or len(gap_data) != self.header['data_offset'] - BMPFile.HEADER_BYTES:
+            gap_data = BMPFile.default_gap_data(self.header['data_offset'])
+        file.write(self.get_header_data() + gap_data)
+
+    def write_rows_to(self, file, pixels):
+        """Write (rows, row_bytes) pixels to a binary file object, adding the row padding"""
+        if self.row_padding == 0 and pixels.flags.c_contiguous:
+            file.write(pixels)
+        else:
+            padding = bytes(self.row_padding)
+            file.writelines(chunk for row in pixels for chunk in (row, padding))
+
+    @staticmethod
+    def default_header(width, height, bits_per_pixel=8):
+        """Header of an uncompressed BMP of the given geometry, with a greyscale color table for 8-bit images"""
+        row_size = (width * bits_per_pixel // BMPFile.BITS_PER_BYTE + BMPFile.ROW_ALIGNMENT - 1) // BMPFile.ROW_ALIGNMENT * BMPFile.ROW_ALIGNMENT
+        data_offset = BMPFile.HEADER_BYTES + (4 * 256 if bits_per_pixel <= BMPFile.BITS_PER_BYTE else 0)
+        return {
+            'signature': 'BM', 'file_size': data_offset + row_size * height, 'reserved1': 0, 'reserved2': 0,
+            'data_offset': data_offset, 'header_size': 40, 'width': width, 'height': height, 'planes': 1,
+            'bits_per_pixel': bits_per_pixel, 'compression': 0, 'image_size': row_size * height,
+            'x_pixels_per_meter': 0, 'y_pixels_per_meter': 0, 'total_colors': 0, 'important_colors': 0,
+        }
+
+    @staticmethod
+    def default_gap_data(data_offset):
+        """
+        Bytes written between the header and the data when the image doesn't have its own:
+        a table of 4-byte entries (i, i, i, i), which is a greyscale color table for 8-bit images
+        """
+        return bytes(i // 4 % 256 for i in range(data_offset - BMPFile.HEADER_BYTES))
 
     def get_header_data(self):
         """Get the header data as bytes
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from src import plan_cache, z251_array
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.recover_image import RecoverImage
+from src.shadow_file import ShadowFile
+
+# Every message, both ways, is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON
+LENGTH_FORMAT = '>I'
+LENGTH_BYTES = struct.calcsize(LENGTH_FORMAT)
+MAX_MESSAGE_BYTES = 1 << 20
+DEFAULT_WORKERS = 4
+# Seconds a connection may stay idle between requests before the daemon closes it
+IDLE_TIMEOUT = 300
+# Type of every field a request may have, booleans aren't accepted as integers
+FIELD_TYPES = {
+    "operation": str, "secret_image": str, "directory": str, "output": str, "format": str,
+    "k": int, "shares": int, "seed": int, "jobs": int, "io_threads": int, "memory_limit": int,
+    "in_place": bool, "identify_cheaters": bool,
+}
+
+
+class HeaderCache:
+    """
+    Bounded, thread-safe LRU cache of the headers of covers and shadow files
+
+    An entry is only used while the file keeps the inode, size and modification time it had when it was
+    read, so a share rewritten by a distribution (atomically or in place) is read again.
+
+        headers = HeaderCache()
+        headers.header("covers/a.bmp")['reserved1']
+    """
+
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._headers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._headers)
+
+    def header(self, file_path) -> dict:
+        """Header of a .bmp or .shd file, read from disk only if the file changed since it was cached"""
+        file_path = str(file_path)
+        stat = os.stat(file_path)
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._headers.get(file_path)
+            if cached is not None and cached[0] == signature:
+                self._headers.move_to_end(file_path)
+                self.hits += 1
+                return cached[1]
+
+        if file_path.endswith(ShadowFile.EXTENSION):
+            with ShadowFile(file_path, verify=False) as shadow_file:
+                header = shadow_file.header
+        else:
+            # Only the header of a lazily loaded BMPFile is read
+            header = BMPFile(file_path).header
+        with self._lock:
+            self.misses += 1
+            self._headers[file_path] = (signature, header)
+            self._headers.move_to_end(file_path)
+            while len(self._headers) > self.capacity:
+                self._headers.popitem(last=False)
+        return header
+
+
+class SharingDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long-running server that distributes and recovers secrets for clients on the same host
+
+    Requests arrive over a Unix domain socket as length-prefixed JSON messages (see send_message), one
+    reply per request, and a connection may carry any number of them. Each connection is read by a thread
+    of its own, but every job runs on a bounded pool of workers, so at most that many jobs run at once and
+    the rest wait their turn, while idle connections hold no worker. The field tables, the recovery plans
+    and the headers of the shares stay warm between jobs:
+
+        daemon = SharingDaemon("/tmp/sis.sock", workers=4)
+        daemon.serve_forever()
+
+        request("/tmp/sis.sock", {"operation": "r", "k": 3, "directory": "/covers", "output": "/tmp/secret.bmp"})
+
+    Paths in the requests are resolved by the daemon, so clients should send absolute ones.
+    """
+
+    # Connection threads don't keep the daemon from closing, only the jobs already running do
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, socket_path: str, workers: int = DEFAULT_WORKERS, plans: plan_cache.PlanCache = None):
+        """
+        Arguments:
+            socket_path {str} -- Path of the Unix socket, replaced if it already exists
+            workers {int} -- Jobs running at the same time
+            plans {PlanCache} -- Cache of recovery plans (default: the one shared by the whole process)
+        """
+        if workers < 1:
+            raise ValueError(f"Invalid workers amount: {workers}. At least 1 is required")
+        self.socket_path = socket_path
+        self.plans = plan_cache.DEFAULT_CACHE if plans is None else plans
+        self.headers = HeaderCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sharing-daemon")
+        self.jobs_served = 0
+        self._jobs_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, SharingRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def handle(self, message: dict) -> dict:
+        """Runs the job of a request and returns its reply, {"ok": True, ...} or {"ok": False, "error": ...}"""
+        operation = message.get("operation")
+        try:
+            validate_fields(message)
+            match operation:
+                case "d":
+                    reply = self.distribute(message)
+                case "r":
+                    reply = self.recover(message)
+                case "status":
+                    reply = self.status()
+                case _:
+                    raise ValueError(f"Invalid operation: {operation} (must be 'd', 'r' or 'status')")
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            # Including CheatingDetectedError. A missing field is reported by name
+            return {"ok": False, "error": f"Missing field: {error}" if isinstance(error, KeyError) else str(error)}
+
+        with self._jobs_lock:
+            self.jobs_served += 1
+        return {"ok": True, **reply}
+
+    def distribute(self, message: dict) -> dict:
+        """Hides the shadows of message["secret_image"] in the covers of message["directory"], or saves them as .shd files"""
+        k = message["k"]
+        directory_path = Path(message["directory"])
+        if not directory_path.is_dir():
+            raise ValueError(f"The directory {directory_path} does not exist")
+        jobs = message.get("jobs", 1)
+        seed = message.get("seed")
+
+        if message.get("format", "bmp") == "shd":
+            shares = message.get("shares")
+            if shares is None or shares < k:
+                raise ValueError(f"The number of shares (at least {k}) is required to distribute into shadow files")
+            file_paths = [str(directory_path / f"shadow{i + 1}{ShadowFile.EXTENSION}") for i in range(shares)]
+            distribute_image = DistributeImage(message["secret_image"], k, participants=[], workers=jobs, seed=seed, n=shares)
+            with distribute_image.secret_image:
+                distribute_image.save_shadow_files(file_paths)
+        else:
+            file_paths = [str(image) for image in sorted(directory_path.glob("*.bmp"))]
+            if len(file_paths) < k:
+                raise ValueError(f"At least {k} images are required in the directory")
+            participants = [BMPFile(image) for image in file_paths]
+            distribute_image = DistributeImage(
+                message["secret_image"], k, participants=participants, in_place=message.get("in_place", False), workers=jobs, seed=seed
+            )
+            # The secret is mapped, and released once its shadows are hidden
+            with distribute_image.secret_image:
+                if message.get("memory_limit") is not None:
+                    distribute_image.stream_shadows(memory_limit=message["memory_limit"])
+                elif message.get("io_threads", 1) > 1:
+                    distribute_image.pipeline_shadows(threads=message["io_threads"])
+                else:
+                    distribute_image.generate_shadows()
+
+        return {"bytes_written": dict(zip(file_paths, distribute_image.bytes_written))}
+
+    def recover(self, message: dict) -> dict:
+        """Recovers the secret from the shares of message["directory"] into message["output"]"""
+        k = message["k"]
+        directory_path = Path(message["directory"])
+        if not directory_path.is_dir():
+            raise ValueError(f"The directory {directory_path} does not exist")
+        shadow_format = message.get("format", "bmp")
+        extension = ShadowFile.EXTENSION if shadow_format == "shd" else ".bmp"
+        file_paths = sorted(directory_path.glob(f"*{extension}"))
+        identify_cheaters = message.get("identify_cheaters", False)
+
+        if not identify_cheaters:
+            # The cached headers pick k shares with distinct ids, so only those are opened, and the
+            # same directory keeps hitting the same recovery plan
+            file_paths = self.select_shares(file_paths, k)
+        if len(file_paths) < k:
+            raise ValueError(f"At least {k} {extension} files with distinct ids are required in the directory")
+
+        output = message["output"]
+        cheaters = []
+        # The daemon outlives its jobs, so the mappings of the shares are released as soon as each one ends
+        with ExitStack() as stack:
+            shares = [stack.enter_context(ShadowFile(path) if shadow_format == "shd" else BMPFile(path, use_mmap=True)) for path in file_paths]
+            recover_image = RecoverImage(shares=shares, k=k, share_length=shares[0].total_pixels, workers=message.get("jobs", 1), plans=self.plans)
+            if identify_cheaters:
+                recovered_image, cheaters = recover_image.identify_cheaters(threads=message.get("io_threads", 1))
+                recovered_image.save(output)
+            elif message.get("memory_limit") is not None:
+                recover_image.stream_recover(output, memory_limit=message["memory_limit"])
+            else:
+                recover_image.recover(threads=message.get("io_threads", 1)).save(output)
+        return {"output": output, "cheaters": cheaters}
+
+    def select_shares(self, file_paths: list[Path], k: int) -> list[Path]:
+        """First k shares with distinct, non zero ids, by their cached headers (fewer if there aren't k)"""
+        selected = {}
+        for path in file_paths:
+            share_id = self.headers.header(path)['reserved1'] % z251_array.MODULUS
+            if share_id != 0 and share_id not in selected:
+                selected[share_id] = path
+                if len(selected) == k:
+                    break
+        return list(selected.values())
+
+    def status(self) -> dict:
+        return {
+            "jobs_served": self.jobs_served,
+            "plans": {"cached": len(self.plans), "hits": self.plans.hits, "misses": self.plans.misses, "evictions": self.plans.evictions},
+            "headers": {"cached": len(self.headers), "hits": self.headers.hits, "misses": self.headers.misses},
+        }
+
+
+class SharingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.settimeout(IDLE_TIMEOUT)
+        while True:
+            try:
+                message = receive_message(self.request)
+            except TimeoutError:
+                return
+            except ValueError as error:
+                # The rest of the stream can't be framed anymore, so the connection is dropped after replying
+                send_message(self.request, json.dumps({"ok": False, "error": str(error)}).encode())
+                return
+            if message is None:
+                return
+            send_message(self.request, json.dumps(self.reply(message)).encode())
+
+    def reply(self, message: bytes) -> dict:
+        try:
+            message = json.loads(message)
+        except json.JSONDecodeError as error:
+            return {"ok": False, "error": f"Invalid request: {error}"}
+        if not isinstance(message, dict):
+            return {"ok": False, "error": "Invalid request: not an object"}
+
+        # The job waits for a free worker, this thread only waits for its reply
+        try:
+            return self.server.executor.submit(self.server.handle, message).result()
+        except (CancelledError, RuntimeError):
+            return {"ok": False, "error": "The daemon is shutting down"}
+
+
+def validate_fields(message: dict):
+    """Checks the type of every field of a request
+
+    Raises:
+        ValueError -- If a field has a value of another type
+    """
+    for name, value in message.items():
+        expected = FIELD_TYPES.get(name)
+        if expected is None or value is None:
+            continue
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise ValueError(f"Invalid field {name}: expected {expected.__name__}, got {value!r}")
+
+
+def send_message(connection: socket.socket, payload: bytes):
+    """Sends a payload prefixed with its length"""
+    connection.sendall(struct.pack(LENGTH_FORMAT, len(payload)) + payload)
+
+
+def receive_message(connection: socket.socket) -> bytes:
+    """Receives a length-prefixed payload, or None if the peer closed the connection before one started
+
+    Raises:
+        ValueError -- If the payload is larger than MAX_MESSAGE_BYTES or the connection closes in the middle of it
+    """
+    prefix = receive_exactly(connection, LENGTH_BYTES)
+    if prefix is None:
+        return None
+    (length,) = struct.unpack(LENGTH_FORMAT, prefix)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes exceeds the limit of {MAX_MESSAGE_BYTES} bytes")
+    payload = receive_exactly(connection, length)
+    if payload is None and length > 0:
+        raise ValueError("Connection closed in the middle of a message")
+    return payload or b""
+
+
+def receive_exactly(connection: socket.socket, length: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < length:
+        chunk = connection.recv(length - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def request(socket_path: str, message: dict, timeout: float = None) -> dict:
+    """Sends a request to the daemon listening on socket_path and returns its reply
+
+    Raises:
+        OSError -- If the daemon can't be reached
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        send_message(connection, json.dumps(message).encode())
+        reply = receive_message(connection)
+    if reply is None:
+        raise OSError(f"The daemon at {socket_path} closed the connection without replying")
+    return json.loads(reply)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve distribute and recover jobs over a Unix socket.")
+    parser.add_argument("socket", help="Path of the Unix socket to listen on")
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS, help="Number of jobs run at the same time, the others wait in line"
+    )
+    parser.add_argument(
+        "--plan-cache",
+        metavar="FILE",
+        help="Load the recovery plans from this file (.npz) on start, and save them back on exit",
+    )
+    args = parser.parse_args()
+
+    try:
+        plans = plan_cache.PlanCache(file_path=args.plan_cache) if args.plan_cache is not None else None
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    # Stopping the daemon with kill is handled as Ctrl+C, so the plans are saved and the socket removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with SharingDaemon(args.socket, workers=args.workers, plans=plans) as daemon:
+        print(f"Listening on {args.socket} with {args.workers} workers")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if plans is not None:
+                plans.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,125 +1,401 @@
 from __future__ import annotations
-import random
-from src.polynomial import Polynomial
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+import numpy as np
+from src import bit_planes, block_parallel, z251_array
 from src.bmp_file import BMPFile
-from src.z251 import Z251
-from src.utils import flatten_array, convert_to_matrix
+from src.ri_generator import RiGenerator
+from src.shadow_file import ShadowFile
 from typing import List
 
 class DistributeImage:
     ALLOWED_K_VALUES = [3, 4, 5, 6, 7, 8]
+    DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+    DEFAULT_IO_THREADS = 4
 
-    def __init__(self, secret_image: str, k: int, participants: list[BMPFile]):
+    def __init__(self, secret_image: str, k: int, participants: list[BMPFile], in_place: bool = False, workers: int = 1, seed: int = None, n: int = None):
+        """
+        Arguments:
+            secret_image {str} -- Path of the secret image (.bmp)
+            k {int} -- Minimum number of shadows to recover the secret
+            participants {list[BMPFile]} -- Covers where the shadows are hidden, one per participant
+            in_place {bool} -- Patch only reserved1 and the carrier bytes of each cover file instead of rewriting it
+            workers {int} -- Processes used to compute the shadows of large secrets and to embed and save the covers in parallel
+            seed {int} -- Seed of a private generator for the r_i, for reproducible runs (default: drawn from os.urandom)
+            n {int} -- Number of participants, for shadows saved as shadow files without covers (default: one per cover)
+        """
         if k not in DistributeImage.ALLOWED_K_VALUES:
             raise ValueError(f"Invalid k value: {k}. Allowed values: {DistributeImage.ALLOWED_K_VALUES}")
 
-        self.secret_image = BMPFile(file_path=secret_image)
+        self.secret_image = BMPFile(file_path=secret_image, use_mmap=True)
         self.k = k
         self.participants = participants
+        self.n = len(participants) if n is None else n
+        self.in_place = in_place
+        self.workers = workers
+        self.bytes_written = []
         self.block_size = 2 * self.k - 2
+        self.ri_generator = RiGenerator(seed)
+
+        # Participant P_j receives the evaluations at x = j, so the powers of every j are computed once
+        self.vandermonde = z251_array.vandermonde(range(1, self.n + 1), self.k)
 
         if not self.secret_image.is_dibisible_by(self.block_size):
             raise ValueError(f"Image size must be divisible by {self.block_size}")
 
+        # Only the headers are needed to check that every cover can carry its shadow
+        carrier_bytes = self.total_blocks * 2 * BMPFile.BITS_PER_BYTE // self.lsb()
+        for image in self.participants:
+            # Recovery takes the channels of the secret from the shares, so covers must have those of the secret
+            if image.header['bits_per_pixel'] != self.secret_image.header['bits_per_pixel']:
+                raise ValueError(
+                    f"Cover {image.file_path} has {image.header['bits_per_pixel']} bits per pixel, "
+                    f"the secret has {self.secret_image.header['bits_per_pixel']}"
+                )
+            if image.total_bytes < carrier_bytes:
+                raise ValueError(f"Cover {image.file_path} is too small to hide a shadow of {2 * self.total_blocks} bytes")
+
 
-    @property
-    def ri(self):
-        return random.randint(1, 251)
-    
     @property
     def total_blocks(self):
-        return self.secret_image.total_pixels // self.block_size
+        # Every channel of the secret is a plane of its own blocks
+        return self.secret_image.channels * self.secret_image.total_pixels // self.block_size
     
     def generate_shadows(self):
-        shadows = []
-        v_ij = {}
+        # The channels of 24-bit secrets are stacked as planes, which are shared together in one batch
+        shadows = self.compute_shadows(self.secret_image.planes().reshape(-1))
+        self.bytes_written = self.lsb_hide(shadows, self.participants, in_place=self.in_place)
+        return shadows
 
-        # v_ij should be a dictionary with the following structure:
-        # v_ij = {1: [f_1(j), g_1(j)], 2: [f_2(j), g_2(j)], ..., t: [f_t(j), g_t(j)]}
-        for i in range(self.total_blocks):
-            v_ij.update({i+1: []})
+    def compute_shadows(self, image_array: np.ndarray) -> np.ndarray:
+        """Computes the shadows of a run of whole blocks of the secret
 
-        image_array = [byte for row in self.secret_image.image_data for byte in row]
-        # The dealer divides the image intro t-non-overlapping 2k - 2 pixel blocks
-        # For each block Bi (i in [1, t]) there are 2k - 2 secret pixels
-        # a_{i,0}, a_{i,1}, ..., a_{i,k-1} and b_{i,0}, b_{i,1}, ..., b_{i,k-1} in Z251
-        for i in range(0, self.secret_image.total_pixels, self.block_size):
-            # The dealer generates a k-1 degree polynomial fi(x) = a_{i,0} + a_{i,1}x + ... + a_{i,k-1}x^k-1 in Z251[x]
+        With more than one worker and enough blocks, the blocks are split in chunks computed in worker
+        processes, with the pixels and the shadows in shared memory.
 
+        Arguments:
+            image_array {np.ndarray} -- Secret pixels, a multiple of 2k - 2 of them
 
-            fi_coefficients = [Z251(image_array[i + j]) for j in range(self.k)]
-            fi = Polynomial(coefficients=fi_coefficients[::-1])
+        Returns:
+            np.ndarray -- Shadows (n, 2 * blocks), one row per participant
+        """
+        total_blocks = len(image_array) // self.block_size
 
-            # The dealer chooses a random integer r_i and computes two pixels b_{i,0} and b_{i,1} which satisfy that:
-            # r_i*a_{i,0} + b_{i,0} = 0 (mod 251) and r_i*a_{i,1} + b_{i,1} = 0 (mod 251)
-            # and then generates another k-1 degree polynomial g_i(x) = b_{i,0} + b_{i,1}x + ... + b_{i,k-1}x^k-1 in Z251[x]
+        # The dealer chooses a random integer r_i for each block, all of them in one draw
+        ri = self.ri_generator.draw(total_blocks)
 
-            ri = self.ri
+        ranges = block_parallel.block_ranges(total_blocks, self.workers) if self.workers > 1 else []
+        if len(ranges) <= 1:
+            return DistributeImage.shadows_for_blocks(image_array, ri, self.k, self.vandermonde)
 
-            # a_0 and a_1 cant be 0, otherwise they are computed as 1
-            a0 = image_array[i] if image_array[i] != 0 else 1
-            a1 = image_array[i + 1] if image_array[i + 1] != 0 else 1
+        with block_parallel.SharedArray.from_array(image_array) as pixels, \
+                block_parallel.SharedArray.from_array(ri) as shared_ri, \
+                block_parallel.SharedArray((self.n, 2 * total_blocks)) as shadows:
+            block_parallel.run(compute_shadows_range, ranges, self.workers, pixels.spec, shared_ri.spec, shadows.spec, self.k, self.vandermonde)
+            return shadows.array.copy()
+
+    @staticmethod
+    def shadows_for_blocks(image_array: np.ndarray, ri: np.ndarray, k: int, vandermonde: np.ndarray) -> np.ndarray:
+        """Computes the shadows of a run of whole blocks given their r_i
+
+        Arguments:
+            image_array {np.ndarray} -- Secret pixels, a multiple of 2k - 2 of them
+            ri {np.ndarray} -- r_i of each block
+            k {int} -- Minimum number of shadows to recover the secret
+            vandermonde {np.ndarray} -- Vandermonde matrix (n, k) of the participant ids
+
+        Returns:
+            np.ndarray -- Shadows (n, 2 * blocks), one row per participant
+        """
+        block_size = 2 * k - 2
+        total_blocks = len(image_array) // block_size
+
+        # The dealer divides the image intro t-non-overlapping 2k - 2 pixel blocks
+        # For each block Bi (i in [1, t]) there are 2k - 2 secret pixels
+        # a_{i,0}, a_{i,1}, ..., a_{i,k-1} and b_{i,0}, b_{i,1}, ..., b_{i,k-1} in Z251
+        blocks = image_array.reshape(total_blocks, block_size)
 
-            b0 = Z251(ri * a0 * -1)
-            b1 = Z251(ri * a1 * -1)
+        # The dealer generates a k-1 degree polynomial fi(x) = a_{i,0} + a_{i,1}x + ... + a_{i,k-1}x^k-1 in Z251[x]
+        fi_coefficients = z251_array.reduce(blocks[:, :k])
 
-            gi_coefficients = [b0, b1]
-            for j in range(2, self.k):
-                gi_coefficients.append(Z251(image_array[i + self.k + j - 2]))
+        # With r_i, the dealer computes two pixels b_{i,0} and b_{i,1} which satisfy that:
+        # r_i*a_{i,0} + b_{i,0} = 0 (mod 251) and r_i*a_{i,1} + b_{i,1} = 0 (mod 251)
+        # and then generates another k-1 degree polynomial g_i(x) = b_{i,0} + b_{i,1}x + ... + b_{i,k-1}x^k-1 in Z251[x]
 
-            gi = Polynomial(coefficients=gi_coefficients[::-1])
+        # a_0 and a_1 cant be 0, otherwise they are computed as 1
+        a01 = fi_coefficients[:, :2]
+        a01 = np.where(a01 == 0, 1, a01)
 
-            dict_idx = i // self.block_size + 1
-            v_ij[dict_idx].append(fi)
-            v_ij[dict_idx].append(gi)
+        b01 = z251_array.neg(z251_array.mul(ri[:, np.newaxis], a01))
+        gi_coefficients = np.concatenate((b01, z251_array.reduce(blocks[:, k:])), axis=1)
 
         # For each block B_i (i in [1, t]) the dealer computes sub-shadow
         # v_{i,j} = (m_{i,j}; d_{i,j}) with: m_{i,j} = fi(j) and d_{i,j} = g_i(j) for j in [1, n] for each participant P_j
         # the shadow S_j for P_j is S_j = (v_{1,j}, v_{2,j}, ..., v_{t,j})
-        for i in range(len(self.participants)):
-            pratial_shadows = []
-            for j in range(self.total_blocks):
-                m_ij = v_ij[j+1][0].evaluate(i+1)
-                d_ij = v_ij[j+1][1].evaluate(i+1)
-                pratial_shadows.append(m_ij)
-                pratial_shadows.append(d_ij)
-            shadows.append(pratial_shadows)
-        self.lsb_hide(shadows, self.participants)
-        return shadows
+        # Interleaving fi and gi row by row makes the product come out in shadow order: (2t, k) x (k, n) -> (2t, n)
+        coefficients = np.stack((fi_coefficients, gi_coefficients), axis=1).reshape(2 * total_blocks, k)
+        return z251_array.dot(coefficients, vandermonde.T).T
+
+    def save_shadow_files(self, file_paths: List[str]) -> List[int]:
+        """Saves the shadows in the native shadow format instead of hiding them in covers
+
+        Arguments:
+            file_paths {List[str]} -- Shadow file of each participant (.shd), the i-th one gets the id i + 1
+
+        Returns:
+            List[int] -- Bytes written to each shadow file
+        """
+        if len(file_paths) != self.n:
+            raise ValueError(f"Invalid shadow files amount: {len(file_paths)}. Exactly {self.n} are required")
+
+        header = self.secret_image.header
+        shadows = self.compute_shadows(self.secret_image.planes().reshape(-1))
+        self.bytes_written = [
+            ShadowFile.save(file_path, shadow, self.k, i + 1, header['width'], header['height'], header['bits_per_pixel'])
+            for i, (file_path, shadow) in enumerate(zip(file_paths, shadows))
+        ]
+        return self.bytes_written
+
+    def stripe_blocks(self, memory_limit: int) -> int:
+        """Number of blocks per stripe so that streaming distribution stays under memory_limit bytes
+
+        The estimate per block covers the secret pixels, the int64 coefficients and products of
+        compute_shadows, the shadows, and the bit groups and carrier rows of one participant at a time.
+        """
+        carrier_bytes = 2 * BMPFile.BITS_PER_BYTE // self.lsb()
+        bytes_per_block = 2 * self.block_size + 18 * 2 * self.k + 20 * 2 * len(self.participants) + 4 * carrier_bytes
+        return max(1, memory_limit // bytes_per_block)
+
+    def stream_shadows(self, memory_limit: int = DEFAULT_MEMORY_LIMIT) -> List[int]:
+        """Distributes the secret stripe by stripe, so memory use doesn't grow with the image size
+
+        Each stripe of whole blocks is read from the secret file, turned into shadow bytes, and embedded
+        straight into the matching carrier rows of every cover with pread/pwrite. Only reserved1 and
+        the rows that carry shadow bits are written.
+
+        Arguments:
+            memory_limit {int} -- Approximate ceiling, in bytes, for the data held while a stripe is processed
+
+        Raises:
+            ValueError -- If the secret has more than one channel, as its planes span the whole image
+
+        Returns:
+            List[int] -- Bytes written to each cover
+        """
+        if self.secret_image.channels > 1:
+            raise ValueError("Streaming distribution only supports 8-bit secrets")
+
+        lsb = self.lsb()
+        clear_lsb_mask = 0b11111111 ^ self.lsb_mask()
+        carrier_bytes_per_block = 2 * BMPFile.BITS_PER_BYTE // lsb
+        stripe_blocks = self.stripe_blocks(memory_limit)
+        self.bytes_written = [0] * len(self.participants)
+        with ExitStack() as stack:
+            secret_file = stack.enter_context(open(self.secret_image.file_path, 'rb'))
+            cover_files = [stack.enter_context(open(image.file_path, 'r+b')) for image in self.participants]
+
+            for i, (image, cover_file) in enumerate(zip(self.participants, cover_files)):
+                image.header['reserved1'] = i + 1
+                self.bytes_written[i] += os.pwrite(cover_file.fileno(), struct.pack('<H', i + 1), BMPFile.RESERVED1_OFFSET)
+
+            for first_block in range(0, self.total_blocks, stripe_blocks):
+                last_block = min(first_block + stripe_blocks, self.total_blocks)
+                image_array = self.secret_image.read_pixels(secret_file, first_block * self.block_size, last_block * self.block_size)
+                shadows = self.compute_shadows(image_array)
 
-    def lsb_hide(self, shadows: List[List[Z251]], images: List[BMPFile]):
-        mask = self.lsb_mask() # determine whether LSB2 or LSB4 should be used
+                for i, (image, cover_file) in enumerate(zip(self.participants, cover_files)):
+                    shadow_bits = bit_planes.unpack(shadows[i], lsb)
+                    start = first_block * carrier_bytes_per_block
+                    first_row, rows = image.rows_spanning(start, start + len(shadow_bits))
+                    region = image.read_rows(cover_file, first_row, rows)
+                    self.set_lsbs(image.pixel_view(region, offset=0, rows=rows), shadow_bits, clear_lsb_mask, start=start - first_row * image.row_bytes)
+                    self.bytes_written[i] += image.write_rows(cover_file, first_row, region)
+
+        return self.bytes_written
+
+    def pipeline_shadows(self, threads: int = DEFAULT_IO_THREADS) -> List[int]:
+        """Distributes the secret overlapping the cover I/O with the computation of the shadows
+
+        Reader threads load the covers while the shadows of the secret are computed, and every cover is
+        handed to a writer thread as soon as it is loaded and the shadows are ready, so the covers that
+        are still being read don't hold back the ones that can already be saved. Wall time follows the
+        slowest of I/O and computation rather than their sum. The files end up as with generate_shadows.
+        With more than one worker, the shadows are computed by processes of block_parallel.process_pool,
+        which aren't forked from this one while its reader threads are running.
+
+        Arguments:
+            threads {int} -- Size of each of the reader and writer thread pools
+
+        Returns:
+            List[int] -- Bytes written to each cover
+        """
+        lsb = self.lsb()
+        with ThreadPoolExecutor(max_workers=threads) as readers, ThreadPoolExecutor(max_workers=threads) as writers:
+            loads = {readers.submit(self.load_cover, image, self.in_place): i for i, image in enumerate(self.participants)}
+
+            # The secret is read with plain reads, which release the GIL, and shared while the covers load
+            with open(self.secret_image.file_path, 'rb') as secret_file:
+                image_array = self.secret_image.read_pixels(secret_file, 0, self.total_blocks * self.block_size)
+            shadows = self.compute_shadows(BMPFile.to_planes(image_array, self.secret_image.channels).reshape(-1))
+
+            saves = [None] * len(self.participants)
+            for load in as_completed(loads):
+                i = loads[load]
+                saves[i] = writers.submit(self.hide_shadow, load.result(), i + 1, shadows[i], lsb, self.in_place)
+            self.bytes_written = [save.result() for save in saves]
+
+        return self.bytes_written
+
+    @staticmethod
+    def load_cover(image: BMPFile, in_place: bool = False) -> BMPFile:
+        """Reads the pixels of a cover of which only the header was parsed, unless it is going to be patched in place"""
+        if not in_place:
+            image.pixel_data
+        return image
+
+    def lsb_hide(self, shadows: np.ndarray, images: List[BMPFile], in_place: bool = False) -> List[int]:
+        """Hides each shadow in the LSBs of the first bytes of its cover and writes the cover back to disk
+
+        Arguments:
+            shadows {np.ndarray} -- Shadows (n, 2t), one row per participant
+            images {List[BMPFile]} -- Covers, one per participant
+            in_place {bool} -- Patch the cover files through a writable mmap, touching only reserved1 and
+                               the bytes that carry shadow bits, instead of saving the whole image
+
+        With more than one worker, every cover whose pixels are still on disk (see BMPFile.is_on_disk) is
+        embedded and saved in its own process, reading the cover from its file. The files end up
+        byte-identical to the serial mode, but the pixels of those BMPFile objects are left as they were.
+        Covers built or already read in memory are hidden here, as the worker couldn't see their pixels.
+
+        Returns:
+            List[int] -- Bytes written to each cover
+        """
         lsb = self.lsb() # determine how many LSBs should be used
 
-        for i, shadow in enumerate(shadows):
-            # get the i-th BMPFile from images
-            image = images[i]
-            image.header['reserved1'] = i + 1
+        on_disk = [i for i, image in enumerate(images) if image.is_on_disk] if self.workers > 1 else []
+        if len(on_disk) < 2:
+            # the i-th shadow goes to the i-th BMPFile from images
+            return [self.hide_shadow(image, i + 1, shadow, lsb, in_place) for i, (image, shadow) in enumerate(zip(images, shadows))]
+
+        # Each worker loads its own cover from disk, so only the compact shadow bytes are pickled
+        bytes_written = [None] * len(images)
+        with block_parallel.process_pool(self.workers) as executor:
+            futures = {
+                i: executor.submit(hide_shadow_in_file, images[i].file_path, i + 1, shadows[i].tobytes(), lsb, in_place)
+                for i in on_disk
+            }
+            # The covers held in memory are hidden meanwhile
+            for i, (image, shadow) in enumerate(zip(images, shadows)):
+                if i not in futures:
+                    bytes_written[i] = self.hide_shadow(image, i + 1, shadow, lsb, in_place)
+            for i, future in futures.items():
+                bytes_written[i] = future.result()
+                images[i].header['reserved1'] = i + 1
+        return bytes_written
+
+    @staticmethod
+    def hide_shadow(image: BMPFile, participant_id: int, shadow: np.ndarray, lsb: int, in_place: bool = False) -> int:
+        """Hides one shadow in its cover and writes the cover back to disk
 
-            image_bytes = flatten_array(image.image_data)
+        Arguments:
+            image {BMPFile} -- Cover of the participant
+            participant_id {int} -- Id stored in reserved1, the x where the shadow was evaluated
+            shadow {np.ndarray} -- Shadow bytes (2t)
+            lsb {int} -- How many LSBs of each carrier byte are used (2 or 4)
+            in_place {bool} -- Patch the cover file instead of saving the whole image
 
-            shadow_bits = []
-            for _, byte in enumerate(shadow):
-                for shifting in range(BMPFile.BITS_PER_BYTE - lsb, -2, -lsb):
-                    # divide shadow byte into groups of mask bits
-                    shadow_bits.append((byte.value >> shifting) & mask)
+        Returns:
+            int -- Bytes written to the cover
+        """
+        image.header['reserved1'] = participant_id
 
-            # for each byte in the image, replace the LSBs with the shadow bits
-            clear_lsb_mask = 0b11111111 ^ mask
+        # divide each shadow byte into groups of mask bits
+        shadow_bits = bit_planes.unpack(shadow, lsb)
 
-            pixels_used = 2 * self.total_blocks * (BMPFile.BITS_PER_BYTE // lsb)
-            for j in range(pixels_used):
-                image_byte: int = int.from_bytes(image_bytes[j], byteorder='little', signed=False)
-                image_byte &= clear_lsb_mask # clear the LSBs
-                image_byte |= shadow_bits[j] # set the LSBs
-                image_bytes[j] = image_byte.to_bytes(1, byteorder='little')
+        # for each byte in the image, replace the LSBs with the shadow bits
+        clear_lsb_mask = 0b11111111 ^ ((1 << lsb) - 1)
 
-            # Update image to modified image
-            image.image_data = convert_to_matrix(image_bytes, image.header['width'], image.header['height'])
-            image.save(image.file_path)
+        if in_place:
+            return DistributeImage.embed_in_place(image, shadow_bits, clear_lsb_mask)
+
+        # Accessing pixel_data makes the pixels writable (copying them out of the mapping for mmap-ed covers)
+        image.pixel_data
+        DistributeImage.set_lsbs(image.pixels, shadow_bits, clear_lsb_mask)
+
+        image.save(image.file_path)
+        return os.path.getsize(image.file_path)
+
+    @staticmethod
+    def embed_in_place(image: BMPFile, shadow_bits: np.ndarray, clear_lsb_mask: int) -> int:
+        """Writes reserved1 and the shadow bits straight into the cover file, leaving every other byte untouched
+
+        Arguments:
+            image {BMPFile} -- Cover, its header['reserved1'] is written as is
+            shadow_bits {np.ndarray} -- Groups of shadow bits, one per carrier byte
+            clear_lsb_mask {int} -- Mask that clears the LSBs of a carrier byte
+
+        Returns:
+            int -- Bytes written to the cover
+        """
+        with open(image.file_path, 'r+b') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE) as mapping:
+            struct.pack_into('<H', mapping, BMPFile.RESERVED1_OFFSET, image.header['reserved1'])
+            carrier = image.pixel_view(mapping)
+            DistributeImage.set_lsbs(carrier, shadow_bits, clear_lsb_mask)
+            # The view must be released before the mapping is closed
+            del carrier
+        return struct.calcsize('<H') + len(shadow_bits)
+
+    @staticmethod
+    def set_lsbs(carrier: np.ndarray, shadow_bits: np.ndarray, clear_lsb_mask: int, start: int = 0):
+        """Replaces the LSBs of len(shadow_bits) bytes of a (rows, row_bytes) carrier, starting at byte start (rows in order)"""
+        row_bytes = carrier.shape[1]
+        row, column = divmod(start, row_bytes)
+        used = 0
+
+        # Leading partial row
+        if column:
+            used = min(row_bytes - column, len(shadow_bits))
+            DistributeImage.patch(carrier[row, column:column + used], shadow_bits[:used], clear_lsb_mask)
+            row += 1
+
+        # Full rows, all at once
+        full_rows = (len(shadow_bits) - used) // row_bytes
+        if full_rows:
+            DistributeImage.patch(carrier[row:row + full_rows], shadow_bits[used:used + full_rows * row_bytes].reshape(full_rows, row_bytes), clear_lsb_mask)
+            used += full_rows * row_bytes
+            row += full_rows
+
+        # Trailing partial row
+        if used < len(shadow_bits):
+            DistributeImage.patch(carrier[row, :len(shadow_bits) - used], shadow_bits[used:], clear_lsb_mask)
+
+    @staticmethod
+    def patch(carrier_bytes: np.ndarray, shadow_bits: np.ndarray, clear_lsb_mask: int):
+        carrier_bytes &= clear_lsb_mask # clear the LSBs
+        carrier_bytes |= shadow_bits # set the LSBs
 
     def lsb_mask(self):
         return 0b1111 if self.k < 5 else 0b11
 
     def lsb(self):
-        return 4 if self.k < 5 else 2
\ No newline at end of file
+        return 4 if self.k < 5 else 2
+
+
+def hide_shadow_in_file(file_path: str, participant_id: int, shadow: bytes, lsb: int, in_place: bool) -> int:
+    """Process pool entry point: loads the cover from file_path and hides the shadow in it"""
+    image = BMPFile(file_path, use_mmap=True)
+    return DistributeImage.hide_shadow(image, participant_id, np.frombuffer(shadow, dtype=np.uint8), lsb, in_place)
+
+
+def compute_shadows_range(first_block: int, last_block: int, pixels_spec, ri_spec, shadows_spec, k: int, vandermonde: np.ndarray):
+    """Block-parallel entry point: computes the shadows of blocks [first_block, last_block) in shared memory"""
+    block_size = 2 * k - 2
+    with block_parallel.SharedArray.attach(pixels_spec) as pixels, \
+            block_parallel.SharedArray.attach(ri_spec) as ri, \
+            block_parallel.SharedArray.attach(shadows_spec) as shadows:
+        shadows.array[:, 2 * first_block:2 * last_block] = DistributeImage.shadows_for_blocks(
+            pixels.array[first_block * block_size:last_block * block_size], ri.array[first_block:last_block], k, vandermonde
+        )
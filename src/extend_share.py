@@ -0,0 +1,89 @@
+import numpy as np
+from src import z251_array
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.recover_image import RecoverImage
+
+class ExtendShare:
+    """
+    Issues the share of a new participant from k existing shares, without the secret
+
+    Every fi(x) and gi(x) goes through the shadow values of any k shares, so the shadow at a new id
+    is a fixed linear combination of theirs (the Lagrange weights at that id), computed for every block
+    in a single weight-vector x shadow-matrix product. The secret is never reconstructed.
+
+        extend_share = ExtendShare(shares, k=3, share_length=shares[0].total_pixels)
+        extend_share.extend(BMPFile("new_cover.bmp"), participant_id=extend_share.next_id())
+    """
+
+    # reserved1 is a 2-byte field
+    MAX_ID = 0xFFFF
+
+    def __init__(self, shares: list[BMPFile], k: int, share_length: int):
+        """
+        Arguments:
+            shares {list[BMPFile]} -- Existing shares, k of them are read (the others only reserve their ids)
+            k {int} -- Minimum number of shadows to recover the secret
+            share_length {int} -- Pixels of the secret image
+        """
+        self.k = k
+        self.recover_image = RecoverImage(shares, k, share_length)
+        self.used_ids = {share.header['reserved1'] % z251_array.MODULUS for share in shares}
+        # The channels of the secret, and so the size of the shadow, follow the bit depth of the shares
+        self.bits_per_pixel = shares[0].header['bits_per_pixel']
+
+    def next_id(self) -> int:
+        """Lowest participant id that isn't taken by any existing share
+
+        Raises:
+            ValueError -- If every non zero id in Z251 is taken
+        """
+        free_id = next((x for x in range(1, z251_array.MODULUS) if x not in self.used_ids), None)
+        if free_id is None:
+            raise ValueError(f"Every participant id is taken, there can't be more than {z251_array.MODULUS - 1} shares")
+        return free_id
+
+    def shadow_for(self, participant_id: int, threads: int = 1) -> np.ndarray:
+        """Computes the shadow of the participant with the given id
+
+        Arguments:
+            participant_id {int} -- Id of the new participant, the x where the shadow is evaluated
+            threads {int} -- Threads that load the shadows of the k shares
+
+        Raises:
+            ValueError -- If the id is 0 in Z251, doesn't fit in reserved1, or belongs to an existing share
+
+        Returns:
+            np.ndarray -- Shadow bytes (2t)
+        """
+        if not 0 < participant_id <= ExtendShare.MAX_ID or participant_id % z251_array.MODULUS == 0:
+            raise ValueError(f"Invalid participant id: {participant_id}. It must fit in reserved1 and be non zero in Z251")
+        if participant_id % z251_array.MODULUS in self.used_ids:
+            raise ValueError(f"Participant id {participant_id} is already taken by an existing share")
+
+        self.recover_image.validate_shares()
+        return self.recover_image.recovery_plan().evaluate(self.recover_image.read_shadows(threads), participant_id)
+
+    def extend(self, cover: BMPFile, participant_id: int, in_place: bool = False, threads: int = 1) -> int:
+        """Computes the shadow of a new participant and hides it in their cover, which is written back to disk
+
+        Arguments:
+            cover {BMPFile} -- Cover of the new participant
+            participant_id {int} -- Id of the new participant, stored in reserved1
+            in_place {bool} -- Patch only reserved1 and the carrier bytes of the cover file instead of rewriting it
+            threads {int} -- Threads that load the shadows of the k shares
+
+        Raises:
+            ValueError -- If the id isn't valid, or the cover is too small to hide the shadow or has another bit depth than the shares
+
+        Returns:
+            int -- Bytes written to the cover
+        """
+        if cover.header['bits_per_pixel'] != self.bits_per_pixel:
+            raise ValueError(f"Cover {cover.file_path} has {cover.header['bits_per_pixel']} bits per pixel, the shares have {self.bits_per_pixel}")
+        if cover.total_bytes < self.recover_image.blocks_amount * self.recover_image.carrier_bytes_per_block:
+            raise ValueError(f"Cover {cover.file_path} is too small to hide a shadow of {2 * self.recover_image.blocks_amount} bytes")
+
+        shadow = self.shadow_for(participant_id, threads=threads)
+        self.used_ids.add(participant_id % z251_array.MODULUS)
+        return DistributeImage.hide_shadow(cover, participant_id, shadow, self.recover_image.mask_bits, in_place)
@@ -2,14 +2,25 @@
 
 import argparse
 from pathlib import Path
+from src import daemon
 from src.distribute_image import DistributeImage
 from src.recover_image import RecoverImage
 from src.bmp_file import BMPFile
+from src.extend_share import ExtendShare
+from src.plan_cache import PlanCache
+from src.shadow_file import ShadowFile
 
 def distribute_image(
     secret_image: str,
     k: int,
     directory: str,
+    in_place: bool = False,
+    memory_limit: int = None,
+    jobs: int = 1,
+    io_threads: int = 1,
+    seed: int = None,
+    shadow_format: str = "bmp",
+    shares: int = None,
 ):
     # Verify existence of the secret image
     secret_image_path = Path(secret_image)
@@ -25,6 +36,10 @@ def distribute_image(
         print("Error: The directory does not exist")
         return
 
+    if shadow_format == "shd":
+        distribute_shadow_files(secret_image, k, directory_path, shares, jobs=jobs, seed=seed)
+        return
+
     images = list(directory_path.glob("*.bmp"))
     if len(images) < k:
         print(f"Error: At least {k} images are required in the directory")
@@ -36,9 +51,45 @@ def distribute_image(
         f"Distributing the secret image '{secret_image}' into {len(images)} images with path: {image_paths}..."
     )
 
-    distribute_image = DistributeImage(secret_image, k, participants=[BMPFile(image) for image in images])
-    distribute_image.generate_shadows()
+    # Only the headers are read here, the pixels of a cover are read when its shadow is embedded (if ever, in place or streaming)
+    participants = [BMPFile(image) for image in images]
+    try:
+        distribute_image = DistributeImage(secret_image, k, participants=participants, in_place=in_place, workers=jobs, seed=seed)
+        if memory_limit is not None:
+            distribute_image.stream_shadows(memory_limit=memory_limit)
+        elif io_threads > 1:
+            distribute_image.pipeline_shadows(threads=io_threads)
+        else:
+            distribute_image.generate_shadows()
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+
+    for image, bytes_written in zip(image_paths, distribute_image.bytes_written):
+        print(f"{image}: {bytes_written} bytes written")
+    print(f"Image successfully distributed!")
+
+
+def distribute_shadow_files(secret_image: str, k: int, directory_path: Path, shares: int, jobs: int = 1, seed: int = None):
+    if shares is None or shares < k:
+        print(f"Error: The number of shares (at least {k}) is required to distribute into shadow files")
+        return
+
+    # The shadows are saved as they are, without covers
+    file_paths = [str(directory_path / f"shadow{i + 1}{ShadowFile.EXTENSION}") for i in range(shares)]
+    print(
+        f"Distributing the secret image '{secret_image}' into {shares} shadow files with path: {file_paths}..."
+    )
+
+    try:
+        distribute_image = DistributeImage(secret_image, k, participants=[], workers=jobs, seed=seed, n=shares)
+        distribute_image.save_shadow_files(file_paths)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
 
+    for file_path, bytes_written in zip(file_paths, distribute_image.bytes_written):
+        print(f"{file_path}: {bytes_written} bytes written")
     print(f"Image successfully distributed!")
 
 
@@ -46,6 +97,12 @@ def recover_image(
     secret_image: str,
     k: int,
     directory: str,
+    memory_limit: int = None,
+    jobs: int = 1,
+    io_threads: int = 1,
+    identify_cheaters: bool = False,
+    shadow_format: str = "bmp",
+    plan_cache: str = None,
 ):
     # Verify existence of the directory and count images
     directory_path = Path(directory)
@@ -53,44 +110,212 @@ def recover_image(
         print("Error: The directory does not exist")
         return
 
-    images = list(directory_path.glob("*.bmp"))
+    extension = ShadowFile.EXTENSION if shadow_format == "shd" else ".bmp"
+    images = list(directory_path.glob(f"*{extension}"))
     if len(images) < k:
-        print(f"Error: At least {k} images are required in the directory")
+        print(f"Error: At least {k} {extension} files are required in the directory")
         return
 
     print(
         f"Recovering the secret image '{secret_image}' from {len(images)} images"
     )
 
-    bmp_images = [BMPFile(image) for image in images]
-    recover_image = RecoverImage(shares=bmp_images, k=k, share_length=bmp_images[0].total_pixels)
-    recovered_image = recover_image.recover()
+    try:
+        plans = PlanCache(file_path=plan_cache) if plan_cache is not None else None
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    try:
+        # Mapping a share only parses its header, and only the carrier rows of the k selected shares are ever read
+        shares = [ShadowFile(image) if shadow_format == "shd" else BMPFile(image, use_mmap=True) for image in images]
+        recover_image = RecoverImage(shares=shares, k=k, share_length=shares[0].total_pixels, workers=jobs, plans=plans)
+        if identify_cheaters:
+            recovered_image, cheaters = recover_image.identify_cheaters(threads=io_threads)
+            print(f"Inconsistent shares: {cheaters}" if cheaters else "All shares are consistent")
+        elif memory_limit is not None:
+            recover_image.stream_recover("recovered.bmp", memory_limit=memory_limit)
+            return
+        else:
+            recovered_image = recover_image.recover(threads=io_threads)
+    except ValueError as error:
+        # Including CheatingDetectedError
+        print(f"Error: {error}")
+        return
+    finally:
+        if plans is not None:
+            plans.save()
     recovered_image.save("recovered.bmp")
 
 
+def extend_share(
+    cover_image: str,
+    k: int,
+    directory: str,
+    participant_id: int = None,
+    in_place: bool = False,
+    io_threads: int = 1,
+):
+    # Verify existence of the new cover
+    cover_image_path = Path(cover_image)
+    if not cover_image_path.is_file() or cover_image_path.suffix.lower() != ".bmp":
+        print(
+            "Error: The cover image does not exist or does not have a .bmp extension"
+        )
+        return
+
+    # Verify existence of the directory and count images
+    directory_path = Path(directory)
+    if not directory_path.is_dir():
+        print("Error: The directory does not exist")
+        return
+
+    images = [image for image in directory_path.glob("*.bmp") if not image.samefile(cover_image_path)]
+    if len(images) < k:
+        print(f"Error: At least {k} images are required in the directory")
+        return
+
+    try:
+        bmp_images = [BMPFile(image, use_mmap=True) for image in images]
+        extend = ExtendShare(shares=bmp_images, k=k, share_length=bmp_images[0].total_pixels)
+        if participant_id is None:
+            # Raises ValueError once every id is taken
+            participant_id = extend.next_id()
+
+        print(
+            f"Issuing the share of participant {participant_id} into '{cover_image}' from {len(images)} images"
+        )
+        bytes_written = extend.extend(BMPFile(cover_image), participant_id, in_place=in_place, threads=io_threads)
+    except ValueError as error:
+        print(f"Error: {error}")
+        return
+    print(f"{cover_image}: {bytes_written} bytes written")
+    print(f"Share successfully issued!")
+
+
+def daemon_client(socket_path: str, operation: str, secret_image: str, k: int, directory: str, **options):
+    # The daemon resolves the paths, so they are sent absolute. As locally, the secret is recovered into recovered.bmp
+    message = {"operation": operation, "k": k, "directory": str(Path(directory).resolve()), **options}
+    if operation == "d":
+        message["secret_image"] = str(Path(secret_image).resolve())
+    else:
+        message["output"] = str(Path("recovered.bmp").resolve())
+
+    try:
+        reply = daemon.request(socket_path, message)
+    except OSError as error:
+        print(f"Error: The daemon at {socket_path} can't be reached ({error})")
+        return
+    if not reply["ok"]:
+        print(f"Error: {reply['error']}")
+        return
+
+    if operation == "d":
+        for file_path, bytes_written in reply["bytes_written"].items():
+            print(f"{file_path}: {bytes_written} bytes written")
+        print(f"Image successfully distributed!")
+    else:
+        if options.get("identify_cheaters"):
+            print(f"Inconsistent shares: {reply['cheaters']}" if reply["cheaters"] else "All shares are consistent")
+        print(f"Secret image recovered into '{reply['output']}'")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Distribute or recover secret images.")
     parser.add_argument(
         "operation",
-        choices=["d", "r"],
-        help="Operation to perform ('d' for distribute, 'r' for recover)",
+        choices=["d", "r", "e"],
+        help="Operation to perform ('d' for distribute, 'r' for recover, 'e' for extend: issue a new share from k existing ones)",
     )
-    parser.add_argument("secret_image", help="Name of the secret image file (.bmp)")
+    parser.add_argument("secret_image", help="Name of the secret image file (.bmp), or of the cover of the new share when extending")
     parser.add_argument(
         "k", type=int, help="Minimum number of shadows to recover the secret in a (k, n) scheme"
     )
     parser.add_argument(
         "directory", help="Directory containing the images (.bmp)"
     )
+    parser.add_argument(
+        "--in-place",
+        action="store_true",
+        help="When distributing or extending, patch only the bytes of each cover that carry the shadow instead of rewriting it",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        metavar="MB",
+        help="Stream the secret in stripes using about this many megabytes (when distributing, implies patching the covers in place)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes: blocks of large secrets are shared and recovered in parallel, and covers are embedded and saved in parallel",
+    )
+    parser.add_argument(
+        "--io-threads",
+        type=int,
+        default=1,
+        help="Number of threads that read and write covers and shares while the shadows are computed (pipelined mode)",
+    )
+    parser.add_argument(
+        "--identify-cheaters",
+        action="store_true",
+        help="When recovering, decode with every share in the directory to locate fake ones and recover the secret without them",
+    )
+    parser.add_argument(
+        "--id",
+        type=int,
+        dest="participant_id",
+        help="When extending, participant id of the new share (default: the lowest id not taken by the shares in the directory)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="When distributing, draw the random r_i from a generator with this seed, for reproducible runs (default: os.urandom)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["bmp", "shd"],
+        default="bmp",
+        dest="shadow_format",
+        help="Where the shadows are kept: hidden in the .bmp covers of the directory, or as plain .shd shadow files",
+    )
+    parser.add_argument(
+        "--shares",
+        type=int,
+        help="When distributing into .shd shadow files, number of participants (n)",
+    )
+    parser.add_argument(
+        "--plan-cache",
+        metavar="FILE",
+        help="When recovering, keep the recovery plans of each set of share ids in this file (.npz) across runs",
+    )
+    parser.add_argument(
+        "--daemon",
+        metavar="SOCKET",
+        help="Send the distribution or recovery to the daemon listening on this Unix socket (python3 -m src.daemon SOCKET) instead of running it here",
+    )
     args = parser.parse_args()
+    memory_limit = args.memory_limit * 1024 * 1024 if args.memory_limit is not None else None
+
+    if args.daemon is not None:
+        match args.operation:
+            case "d":
+                daemon_client(args.daemon, "d", args.secret_image, args.k, args.directory, in_place=args.in_place, memory_limit=memory_limit, jobs=args.jobs, io_threads=args.io_threads, seed=args.seed, format=args.shadow_format, shares=args.shares)
+            case "r":
+                daemon_client(args.daemon, "r", args.secret_image, args.k, args.directory, memory_limit=memory_limit, jobs=args.jobs, io_threads=args.io_threads, identify_cheaters=args.identify_cheaters, format=args.shadow_format)
+            case _:
+                print("Error: Only 'd' and 'r' can be sent to the daemon")
+        return
 
     match args.operation:
         case "d":
-            distribute_image(args.secret_image, args.k, args.directory)
+            distribute_image(args.secret_image, args.k, args.directory, in_place=args.in_place, memory_limit=memory_limit, jobs=args.jobs, io_threads=args.io_threads, seed=args.seed, shadow_format=args.shadow_format, shares=args.shares)
         case "r":
-            recover_image(args.secret_image, args.k, args.directory)
+            recover_image(args.secret_image, args.k, args.directory, memory_limit=memory_limit, jobs=args.jobs, io_threads=args.io_threads, identify_cheaters=args.identify_cheaters, shadow_format=args.shadow_format, plan_cache=args.plan_cache)
+        case "e":
+            extend_share(args.secret_image, args.k, args.directory, participant_id=args.participant_id, in_place=args.in_place, io_threads=args.io_threads)
         case _:
-            print("Error: Invalid operation (must be 'd' or 'r')")
+            print("Error: Invalid operation (must be 'd', 'r' or 'e')")
 
 
 if __name__ == "__main__":
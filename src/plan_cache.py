@@ -0,0 +1,118 @@
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from src import z251_array
+from src.recovery_plan import RecoveryPlan
+from src.utils import atomic_write
+
+class PlanCache:
+    """
+    Bounded, thread-safe LRU cache of the interpolation weights of recovery plans
+
+    Weights are kept per (k, sorted ids), so any order of the same shares hits the same entry: the
+    plan for the requested order is the cached inverse Vandermonde matrix with its columns permuted.
+    The cache can be saved to an .npz file and loaded back, so warm plans survive restarts:
+
+        cache = PlanCache(capacity=64, file_path="plans.npz")
+        plan = cache.plan([4, 1, 3], k=3)
+        cache.save()
+        cache.hits, cache.misses, cache.evictions
+    """
+
+    DEFAULT_CAPACITY = 128
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, file_path: str = None):
+        """
+        Arguments:
+            capacity {int} -- Maximum number of plans kept, the least recently used one is evicted first
+            file_path {str} -- File the cache is loaded from, if it exists, and saved to
+        """
+        if capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}. At least 1 plan must fit")
+        self.capacity = capacity
+        self.file_path = file_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+        if file_path is not None and os.path.exists(file_path):
+            self.load(file_path)
+
+    def __len__(self):
+        return len(self._plans)
+
+    def plan(self, ids: list[int], k: int) -> RecoveryPlan:
+        """Recovery plan for the shares with the given ids, in that order
+
+        Raises:
+            ValueError -- If the ids aren't k distinct, non zero values in Z251
+        """
+        reduced = [int(share_id) % z251_array.MODULUS for share_id in ids]
+        key = (k, tuple(sorted(reduced)))
+        with self._lock:
+            inverse = self._plans.get(key)
+            if inverse is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+
+        if inverse is None:
+            # Computed outside the lock, a concurrent miss on the same key only costs a duplicate inversion
+            inverse = RecoveryPlan(list(key[1]), k).inverse_vandermonde
+            with self._lock:
+                self.misses += 1
+                self._store(key, inverse)
+
+        # Only valid ids make it into the cache, and column j of the inverse belongs to the j-th sorted id
+        columns = [key[1].index(share_id) for share_id in reduced]
+        return RecoveryPlan(ids, k, inverse_vandermonde=inverse[:, columns])
+
+    def _store(self, key, inverse: np.ndarray):
+        self._plans[key] = inverse
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.capacity:
+            self._plans.popitem(last=False)
+            self.evictions += 1
+
+    def save(self, file_path: str = None):
+        """Writes every plan, least recently used first, to an .npz file (by default, the one it was loaded from)"""
+        file_path = self.file_path if file_path is None else file_path
+        with self._lock:
+            arrays = {
+                f"{k}-" + "-".join(str(share_id) for share_id in ids): inverse
+                for (k, ids), inverse in self._plans.items()
+            }
+        with atomic_write(file_path) as file:
+            np.savez(file, **arrays)
+
+    def load(self, file_path: str):
+        """Adds the plans saved in an .npz file, without counting them as misses
+
+        Raises:
+            ValueError -- If an entry isn't the k x k inverse of k sorted, distinct and non zero ids, nothing is added then
+        """
+        with np.load(file_path) as saved:
+            plans = [(name, saved[name]) for name in saved.files]
+
+        keys = []
+        for name, inverse in plans:
+            try:
+                k, *ids = (int(value) for value in name.split("-"))
+            except ValueError:
+                raise ValueError(f"Invalid plan {name} in {file_path}: expected k-id1-id2-...")
+            if not ids or len(ids) != k or ids != sorted(set(ids)) or not 0 < ids[0] <= ids[-1] < z251_array.MODULUS:
+                raise ValueError(f"Invalid plan {name} in {file_path}: expected {k} sorted, distinct and non zero ids in Z251")
+            if inverse.shape != (k, k):
+                raise ValueError(f"Invalid plan {name} in {file_path}: expected a {k}x{k} matrix, got {inverse.shape}")
+            keys.append((k, tuple(ids)))
+
+        with self._lock:
+            for key, (_, inverse) in zip(keys, plans):
+                self._store(key, inverse)
+
+
+# Shared by every RecoverImage that isn't given a cache of its own
+DEFAULT_CACHE = PlanCache()
@@ -1,105 +1,379 @@
 import random
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import numpy as np
+from src import berlekamp_welch, bit_planes, block_parallel, plan_cache, z251_array
 from src.bmp_file import BMPFile
-from src.polynomial import Polynomial
-from src.z251 import Z251
-from typing import List, Tuple
+from src.recovery_plan import RecoveryPlan
+from src.shadow_file import ShadowFile
+from src.utils import atomic_write
+
+class CheatingReport:
+    """
+    Result of the cheating check over every recovered block
+
+        report = recover_image.is_cheating(a0, a1, b0, b1)
+        if report:
+            print(report.failed_blocks)  # 0-based indices of the blocks without a common r
+    """
+
+    # Blocks listed in the message, failed_blocks keeps all of them
+    MAX_LISTED_BLOCKS = 10
+
+    def __init__(self, failed_blocks, total_blocks: int, cheaters=None):
+        self.failed_blocks = [int(block) for block in failed_blocks]
+        self.total_blocks = total_blocks
+        # Ids of the shares found inconsistent, when they could be identified
+        self.cheaters = [] if cheaters is None else list(cheaters)
+
+    def __bool__(self):
+        return len(self.failed_blocks) > 0
+
+    def __str__(self):
+        listed = ", ".join(str(block) for block in self.failed_blocks[:CheatingReport.MAX_LISTED_BLOCKS])
+        if len(self.failed_blocks) > CheatingReport.MAX_LISTED_BLOCKS:
+            listed += ", ..."
+        report = f"{len(self.failed_blocks)} of {self.total_blocks} blocks failed the cheating check: [{listed}]"
+        if self.cheaters:
+            report += f" (inconsistent shares: {self.cheaters})"
+        return report
+
+
+class CheatingDetectedError(ValueError):
+    def __init__(self, report: CheatingReport):
+        super().__init__(f"Cheating detected! {report}")
+        self.report = report
+
 
 class RecoverImage:
-    def __init__(self, shares: list[BMPFile], k, share_length):
+    DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+    # Blocks decoded together when identifying cheaters, which bounds the size of the batched linear systems
+    DECODE_CHUNK_BLOCKS = 1 << 13
+
+    def __init__(self, shares: list[BMPFile], k, share_length, workers: int = 1, plans: plan_cache.PlanCache = None):
+        """
+        Arguments:
+            shares {list[BMPFile | ShadowFile]} -- Available shares, covers or shadow files, k of them are picked at random (all of them are used to identify cheaters)
+            k {int} -- Minimum number of shadows to recover the secret
+            share_length {int} -- Pixels of the secret image
+            workers {int} -- Processes used to recover the blocks of large secrets in parallel
+            plans {PlanCache} -- Cache of recovery plans (default: the one shared by the whole process)
+        """
         self.k = k
+        self.workers = workers
+        self.plans = plan_cache.DEFAULT_CACHE if plans is None else plans
         self.shares_amount = len(shares)
         if self.shares_amount < self.k:
             raise ValueError(f"Invalid shares amount value: {self.shares_amount}. At least {self.k} shares are required")
         
         # pick k shadows randomly
+        self.available_shares = list(shares)
         self.shares = random.sample(shares, self.k)
 
         self.block_size = 2 * self.k - 2
         self.secret_length = share_length
-        self.blocks_amount = self.secret_length // self.block_size
 
-        self.shadow_length = self.secret_length // (self.k - 1)
+    @property
+    def channels(self):
+        # The secret has the geometry, and so the channels, of the shares
+        return self.shares[0].channels
+
+    @property
+    def blocks_amount(self):
+        # Every channel of the secret is a plane of its own blocks
+        return self.channels * self.secret_length // self.block_size
+
+    @property
+    def shadow_length(self):
+        return self.channels * self.secret_length // (self.k - 1)
+
+    @property
+    def mask_bits(self):
+        return bin(self.lsb_mask())[2:].count('1')
+
+    @property
+    def carrier_bytes_per_block(self):
+        # Each block leaves 2 shadow bytes (mi,j and di,j) in every share
+        return 2 * BMPFile.BITS_PER_BYTE // self.mask_bits
 
     # Input k shadows, without loss of generality (S1, S2, ..., Sk)
-    def recover(self):
-        secret_data = []
-        ids = []
-
-        shadows = []
-        mask = self.lsb_mask()
-        mask_bits = bin(mask)[2:].count('1')
-
-        # Reconstruct the shadows
-        for share in self.shares:
-            image_array = [byte for row in share.image_data for byte in row]
-            shadow = 0
-            for i in range(0, self.shadow_length * (BMPFile.BITS_PER_BYTE//mask_bits)):
-                share_byte = int.from_bytes(image_array[i], byteorder='little')
-                shadow_bits = share_byte & mask
-                shadow = shadow << mask_bits
-                shadow = shadow | shadow_bits
-            shadow_bytearray = shadow.to_bytes((shadow.bit_length() + 7) // 8, 'big')
-            shadows.append(shadow_bytearray)
-            ids.append(Z251(share.header['reserved1']))
+    def recover(self, threads: int = 1):
+        """Recovers the secret from the selected shares
 
-        # Extract vi,j = (mi,j, di,j), i = 1, 2, ..., t, j = 1, 2, ..., k from S1, S2, ..., Sk
-        # For each group of vi,1, vi,2, ..., vi,k, i = 1,2,...,t, reconstruct fi(x) and gi(x)
-        # from mi,1, mi,2, ..., mi,k and di,1, di,2, ..., di,k using Lagrange interpolation+
-
-        for block in range(0, self.shadow_length, 2):
-            fi_points = []
-            gi_points = []
-
-            for i in range(0, self.k):
-                mik: Tuple[Z251, Z251] = (ids[i], Z251(shadows[i][block]))
-                dik: Tuple[Z251, Z251] = (ids[i], Z251(shadows[i][block + 1]))
-                fi_points.append(mik)
-                gi_points.append(dik)
-
-            fi = Polynomial.interpolate(points=fi_points)
-            gi = Polynomial.interpolate(points=gi_points)
-
-            # Let ai,0, ai,1, bi,0 and bi,1 be the coefficients of x^0 and x^1 in fi(x) and gi(x) 
-            a0 = fi.coefficients[0]
-            a1 = fi.coefficients[1]
-            b0 = gi.coefficients[0]
-            b1 = gi.coefficients[1]
-
-            # If there exists a common integer ri, which satisfies that riai,0 + bi,0 = 0 and riai,1 + bi,1 = 0
-            # recover the 2k - 2 pixel block Bi = {ai,0, ai,1, ..., ai,k-1, bi,2, bi,3, ..., bi,k-1} 
-            # then, the secret image I is I = B1 || B2 || ... || Bt
-            # Else, there are fake shadows participating in the image reconstruction -> cheating is detected
-            if self.is_cheating(a0, a1, b0, b1):
-                print("Cheating detected!")
-                return None
-
-            # Recover the 2k - 2 pixel block Bi = {ai,0, ai,1, ..., ai,k-1, bi,2, bi,3, ..., bi,k-1}
-            # each coefficient needs to be transformed to a byte
-            bi = []
-            for i in range(0, self.k):
-                bi.append(fi.coefficients[i].value.to_bytes(1, 'little'))
-            for i in range(2, self.k):
-                bi.append(gi.coefficients[i].value.to_bytes(1, 'little'))
-
-            # Append the recovered block to the secret image
-            secret_data.extend(bi)
+        Arguments:
+            threads {int} -- Threads that load the shadows of the shares, so the reads of one share overlap
+                             with the unpacking of the others
+
+        Raises:
+            ValueError -- If a selected share is too small to carry a shadow
+            CheatingDetectedError -- If any block fails the cheating check, listing all of them
+
+        Returns:
+            BMPFile -- The secret image, with the header of the first selected share
+        """
+        self.validate_shares()
+        return self.reconstruct(self.recovery_plan(), self.read_shadows(threads))
+
+    def reconstruct(self, plan: RecoveryPlan, shadows: np.ndarray):
+        """Recovers the secret from shadows already read, the last phase of recover
+
+        Arguments:
+            plan {RecoveryPlan} -- Plan for the ids of the selected shares (see recovery_plan)
+            shadows {np.ndarray} -- Shadow bytes (k, 2 * blocks), in the order of the selected shares (see read_shadows)
+
+        Raises:
+            CheatingDetectedError -- If any block fails the cheating check, listing all of them
+
+        Returns:
+            BMPFile -- The secret image, with the header of the first selected share
+        """
+        secret_data, failed_blocks = self.recover_all_blocks(plan, shadows)
+        if failed_blocks:
+            raise CheatingDetectedError(CheatingReport(failed_blocks, self.blocks_amount))
 
         # Copy the header from the first shadow
         secret_header = self.shares[0].header
-        height = secret_header['height']
-        width = secret_header['width']
-
-        reshaped_data = [[secret_data[row*width + col] for col in range(width)] for row in range(height)]
-        secret_image = BMPFile(header=secret_header, image_data=reshaped_data)
+        # The planes of every channel are interleaved back into pixels
+        pixel_data = BMPFile.from_planes(secret_data.reshape(self.channels, -1)).tobytes()
+        secret_image = BMPFile(header=secret_header, pixel_data=pixel_data, gap_data=self.shares[0].gap_data)
         
         return secret_image
+
+    def identify_cheaters(self, threads: int = 1):
+        """Recovers the secret from all the available shares, locating the inconsistent ones
+
+        The shadow values of every polynomial fi(x) and gi(x) are decoded as a Reed-Solomon codeword with
+        Berlekamp-Welch, all the blocks of a chunk in one batch, in a single pass over the shares. Up to
+        (n - k) // 2 fake shares are located and left out of every block, so the secret is still recovered.
+
+        Arguments:
+            threads {int} -- Threads that load the shadows of the shares
+
+        Raises:
+            ValueError -- If the share ids aren't distinct or a share is too small to carry a shadow
+            CheatingDetectedError -- If some blocks have too many wrong values to be decoded, or fail the cheating
+                                     check anyway. The report lists the shares found inconsistent elsewhere
+
+        Returns:
+            Tuple[BMPFile, List[int]] -- The secret image and the ids of the inconsistent shares
+        """
+        shares = self.available_shares
+        ids = [share.header['reserved1'] for share in shares]
+        if len(set(share_id % z251_array.MODULUS for share_id in ids)) != len(ids) or any(share_id % z251_array.MODULUS == 0 for share_id in ids):
+            raise ValueError(f"Share ids must be distinct and non zero in Z251: {ids}")
+        self.validate_shares(shares)
+        shadows = self.read_shadows(threads, shares)
+
+        secret_data = []
+        failed_blocks = []
+        inconsistent = np.zeros(len(shares), dtype=bool)
+        for first_block in range(0, self.blocks_amount, RecoverImage.DECODE_CHUNK_BLOCKS):
+            last_block = min(first_block + RecoverImage.DECODE_CHUNK_BLOCKS, self.blocks_amount)
+            coefficients, wrong, decoded = berlekamp_welch.decode(ids, self.k, shadows[:, 2 * first_block:2 * last_block])
+            inconsistent |= np.any(wrong[decoded], axis=0)
+
+            # A block is only as good as its two polynomials
+            pixels, failed = self.secret_blocks(coefficients.T, first_block=first_block)
+            undecoded = first_block + np.flatnonzero(~(decoded[0::2] & decoded[1::2]))
+            secret_data.append(pixels)
+            failed_blocks.extend(sorted(set(failed) | set(undecoded.tolist())))
+
+        cheaters = [share_id for share_id, is_inconsistent in zip(ids, inconsistent) if is_inconsistent]
+        if failed_blocks:
+            raise CheatingDetectedError(CheatingReport(failed_blocks, self.blocks_amount, cheaters=cheaters))
+
+        pixel_data = BMPFile.from_planes(np.concatenate(secret_data).reshape(self.channels, -1)).tobytes()
+        secret_image = BMPFile(header=shares[0].header, pixel_data=pixel_data, gap_data=shares[0].gap_data)
+        return secret_image, cheaters
+
+    def validate_shares(self, shares: list[BMPFile] = None):
+        """Checks, on their headers alone, that the shares (by default the selected ones) carry a whole shadow
+
+        Raises:
+            ValueError -- If a share is too small to carry a shadow
+        """
+        for share in self.shares if shares is None else shares:
+            if isinstance(share, ShadowFile):
+                if share.k != self.k:
+                    raise ValueError(f"Shadow file {share.file_path} was made for k = {share.k}, not {self.k}")
+                available_blocks = share.block_count
+            else:
+                available_blocks = share.total_bytes // self.carrier_bytes_per_block
+            if available_blocks < self.blocks_amount:
+                raise ValueError(f"Share {share.file_path} is too small to carry a shadow of {2 * self.blocks_amount} bytes")
+
+    def read_shadows(self, threads: int = 1, shares: list[BMPFile] = None) -> np.ndarray:
+        """Reconstructs the shadows from the LSBs of the first carrier bytes of each share
+
+        Arguments:
+            threads {int} -- With more than one, the shares are read concurrently by a pool of threads
+            shares {list[BMPFile]} -- Shares to read (default: the selected ones)
+
+        Returns:
+            np.ndarray -- Shadow bytes (shares, 2 * blocks), in the order of the shares
+        """
+        shares = self.shares if shares is None else shares
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                return np.stack(list(executor.map(self.read_shadow, shares)))
+        return np.stack([self.read_shadow(share) for share in shares])
+
+    def read_shadow(self, share) -> np.ndarray:
+        if isinstance(share, ShadowFile):
+            # Native shadows are used straight from the mapping
+            return share.shadow[:2 * self.blocks_amount]
+
+        # Only the rows holding the carrier bytes are flattened
+        carrier_length = self.blocks_amount * self.carrier_bytes_per_block
+        _, rows = share.rows_spanning(0, carrier_length)
+        return bit_planes.pack(share.pixels[:rows].reshape(-1)[:carrier_length], self.mask_bits)
+
+    def stream_recover(self, file_path, memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        """Recovers the secret block by block straight into file_path
+
+        Only the header and the carrier prefix of each selected share are read, a stripe at a time, and
+        recovered rows are written as soon as they are complete. Memory and I/O follow the secret size,
+        not the covers. The file is written atomically, and it isn't created if cheating is detected.
+
+        Arguments:
+            file_path {str} -- Where the recovered secret is written (.bmp)
+            memory_limit {int} -- Approximate ceiling, in bytes, for the data held while a stripe is processed
+
+        Raises:
+            ValueError -- If a selected share is too small to carry a shadow, or the secret has more than one channel
+            CheatingDetectedError -- If any block fails the cheating check, listing all of them
+        """
+        if self.channels > 1:
+            raise ValueError("Streaming recovery only supports 8-bit secrets, as the rows need every plane")
+        self.validate_shares()
+        plan = self.recovery_plan()
+        bytes_per_block = 3 * self.k * self.carrier_bytes_per_block + 32 * 2 * self.k + 2 * self.block_size
+        stripe_blocks = max(1, memory_limit // bytes_per_block)
+
+        # Only the header of the secret is kept in memory, its rows are written as they complete
+        secret_image = BMPFile(header=dict(self.shares[0].header), pixel_data=bytearray(), gap_data=self.shares[0].gap_data)
+        row_bytes = secret_image.row_bytes
+        pending = bytearray()
+        failed_blocks = []
+
+        with ExitStack() as stack:
+            share_files = [stack.enter_context(open(share.file_path, 'rb')) for share in self.shares]
+            output = stack.enter_context(atomic_write(file_path))
+            secret_image.write_header(output)
+
+            for first_block in range(0, self.blocks_amount, stripe_blocks):
+                last_block = min(first_block + stripe_blocks, self.blocks_amount)
+                start = first_block * self.carrier_bytes_per_block
+                stop = last_block * self.carrier_bytes_per_block
+                shadows = np.stack([
+                    # Shadow files are already mapped, only their pages for the stripe are touched
+                    share.shadow[2 * first_block:2 * last_block] if isinstance(share, ShadowFile)
+                    else bit_planes.pack(share.read_pixels(share_file, start, stop), self.mask_bits)
+                    for share, share_file in zip(self.shares, share_files)
+                ])
+
+                secret_data, failed = self.recover_blocks(plan, shadows, first_block=first_block)
+                failed_blocks.extend(failed)
+
+                # Write every row that is complete and keep the rest for the next stripe
+                pending += secret_data.tobytes()
+                rows = len(pending) // row_bytes
+                secret_image.write_rows_to(output, np.frombuffer(pending, dtype=np.uint8, count=rows * row_bytes).reshape(rows, row_bytes))
+                del pending[:rows * row_bytes]
+
+            if failed_blocks:
+                raise CheatingDetectedError(CheatingReport(failed_blocks, self.blocks_amount))
+
+    def recover_all_blocks(self, plan: RecoveryPlan, shadows: np.ndarray):
+        """Same as recover_blocks over every block of the image, split across worker processes when there are enough"""
+        ranges = block_parallel.block_ranges(self.blocks_amount, self.workers) if self.workers > 1 else []
+        if len(ranges) <= 1:
+            return self.recover_blocks(plan, shadows)
+
+        with block_parallel.SharedArray.from_array(shadows) as shared_shadows, \
+                block_parallel.SharedArray((self.blocks_amount * self.block_size,)) as pixels, \
+                block_parallel.SharedArray((self.blocks_amount,), dtype=bool) as failed:
+            failed.array[:] = False
+            block_parallel.run(recover_blocks_range, ranges, self.workers, plan, shared_shadows.spec, pixels.spec, failed.spec)
+            return pixels.array.copy(), np.flatnonzero(failed.array).tolist()
+
+    def recovery_plan(self) -> RecoveryPlan:
+        return self.plans.plan([share.header['reserved1'] for share in self.shares], self.k)
+
+    @staticmethod
+    def recover_blocks(plan: RecoveryPlan, shadows: np.ndarray, first_block: int = 0):
+        """Recovers the pixels of a run of blocks from the shadow bytes of the k shares
+
+        Arguments:
+            plan {RecoveryPlan} -- Plan for the ids of the shares, in the same order as the shadows
+            shadows {np.ndarray} -- Shadow bytes (k, 2 * blocks)
+            first_block {int} -- Index of the first block, used to report the failed blocks
+
+        Returns:
+            Tuple[np.ndarray, List[int]] -- The recovered pixels and the indices of the blocks that failed the cheating check
+        """
+        # Extract vi,j = (mi,j, di,j), i = 1, 2, ..., t, j = 1, 2, ..., k from S1, S2, ..., Sk
+        # For each group of vi,1, vi,2, ..., vi,k, i = 1,2,...,t, reconstruct fi(x) and gi(x)
+        # from mi,1, mi,2, ..., mi,k and di,1, di,2, ..., di,k using Lagrange interpolation
+        # Every block shares the same ids, so one plan turns all the stacked shadows into coefficients
+        return RecoverImage.secret_blocks(plan.interpolate(shadows), first_block=first_block)
+
+    @staticmethod
+    def secret_blocks(coefficients: np.ndarray, first_block: int = 0):
+        """Checks and assembles the pixels of a run of blocks from the coefficients of their polynomials
+
+        Arguments:
+            coefficients {np.ndarray} -- Coefficients (k, 2 * blocks), constant term first, fi(x) and gi(x) interleaved
+            first_block {int} -- Index of the first block, used to report the failed blocks
+
+        Returns:
+            Tuple[np.ndarray, List[int]] -- The recovered pixels and the indices of the blocks that failed the cheating check
+        """
+        fi = coefficients[:, 0::2]
+        gi = coefficients[:, 1::2]
+
+        # Let ai,0, ai,1, bi,0 and bi,1 be the coefficients of x^0 and x^1 in fi(x) and gi(x)
+        # If there exists a common integer ri, which satisfies that riai,0 + bi,0 = 0 and riai,1 + bi,1 = 0
+        # recover the 2k - 2 pixel block Bi = {ai,0, ai,1, ..., ai,k-1, bi,2, bi,3, ..., bi,k-1}
+        # then, the secret image I is I = B1 || B2 || ... || Bt
+        # Else, there are fake shadows participating in the image reconstruction -> cheating is detected
+        report = RecoverImage.is_cheating(fi[0], fi[1], gi[0], gi[1])
+
+        # Recover the 2k - 2 pixel block Bi = {ai,0, ai,1, ..., ai,k-1, bi,2, bi,3, ..., bi,k-1}
+        secret_data = np.concatenate((fi.T, gi[2:].T), axis=1).reshape(-1)
+        return secret_data, [first_block + block for block in report.failed_blocks]
     
-    def is_cheating(self, a0, a1, b0, b1):
-        for r in range(0, 251):
-            if r * a0 + b0 == Z251(0) and r * a1 + b1 == Z251(0):
-                return False
-        return True
+    @staticmethod
+    def is_cheating(a0, a1, b0, b1) -> CheatingReport:
+        """Checks every block at once for a common r_i
+
+        With a_0 and a_1 non zero, r = -b_0 / a_0 is the only candidate, and it also satisfies
+        r*a_1 + b_1 = 0 exactly when the determinant a_0*b_1 - a_1*b_0 is 0 (mod 251)
+
+        Arguments:
+            a0, a1, b0, b1 {np.ndarray} -- Coefficients of x^0 and x^1 in fi(x) and gi(x), one per block
+
+        Returns:
+            CheatingReport -- Report listing the blocks for which no common r exists
+        """
+        # The dealer computes b_{i,0} and b_{i,1} with a_0 and a_1 replaced by 1 when they are 0
+        a0 = np.where(a0 == 0, 1, a0)
+        a1 = np.where(a1 == 0, 1, a1)
+
+        determinant = z251_array.sub(z251_array.mul(a0, b1), z251_array.mul(a1, b0))
+        return CheatingReport(np.flatnonzero(determinant), total_blocks=len(determinant))
     
     def lsb_mask(self):
         # If k is 3 or 4, get the 4 least significant bits, otherwise get the 2 least significant bits
-        return 0b1111 if self.k < 5 else 0b11
\ No newline at end of file
+        return 0b1111 if self.k < 5 else 0b11
+
+
+def recover_blocks_range(first_block: int, last_block: int, plan: RecoveryPlan, shadows_spec, pixels_spec, failed_spec):
+    """Block-parallel entry point: recovers blocks [first_block, last_block) in shared memory"""
+    with block_parallel.SharedArray.attach(shadows_spec) as shadows, \
+            block_parallel.SharedArray.attach(pixels_spec) as pixels, \
+            block_parallel.SharedArray.attach(failed_spec) as failed:
+        secret_data, failed_blocks = RecoverImage.recover_blocks(plan, shadows.array[:, 2 * first_block:2 * last_block], first_block=first_block)
+        block_size = len(secret_data) // (last_block - first_block)
+        pixels.array[first_block * block_size:last_block * block_size] = secret_data
+        failed.array[failed_blocks] = True
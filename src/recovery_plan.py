@@ -0,0 +1,72 @@
+from __future__ import annotations
+import numpy as np
+from src import z251_array
+
+
+class RecoveryPlan:
+    """
+    Everything recovery needs that only depends on the k share ids.
+
+    Every block of an image is interpolated at the same x coordinates (the ids stored in
+    header['reserved1']), so the inverse of their Vandermonde matrix is computed once and
+    the coefficients of all the fi(x) and gi(x) come out of a single matrix product:
+
+        plan = RecoveryPlan(ids=[1, 3, 4], k=3)
+        coefficients = plan.interpolate(shadows)  # (k, 2t) -> (k, 2t)
+    """
+
+    def __init__(self, ids: list[int], k: int, inverse_vandermonde: np.ndarray = None):
+        """
+        Arguments:
+            ids {list[int]} -- Ids of the k shares, in the order of their shadows
+            k {int} -- Minimum number of shadows to recover the secret
+            inverse_vandermonde {np.ndarray} -- Inverse of the Vandermonde matrix of ids, when it is already known
+        """
+        if len(ids) != k:
+            raise ValueError(f"Invalid ids amount: {len(ids)}. Exactly {k} ids are required")
+        if len(set(share_id % z251_array.MODULUS for share_id in ids)) != k or any(share_id % z251_array.MODULUS == 0 for share_id in ids):
+            raise ValueError(f"Share ids must be distinct and non zero in Z251: {ids}")
+
+        self.ids = list(ids)
+        self.k = k
+        if inverse_vandermonde is None:
+            inverse_vandermonde = z251_array.inverse_matrix(z251_array.vandermonde(self.ids, self.k))
+        self.inverse_vandermonde = inverse_vandermonde
+
+    def interpolate(self, shadows) -> np.ndarray:
+        """
+        Returns the coefficients of the polynomials that go through the given shadow values
+
+        Arguments:
+            shadows {array_like} -- Shadow values (k, m), row j holds the values of the share with id ids[j]
+
+        Returns:
+            np.ndarray -- Coefficients (k, m), constant term first, one column per polynomial
+        """
+        return z251_array.dot(self.inverse_vandermonde, shadows)
+
+    def weights(self, x: int) -> np.ndarray:
+        """
+        Lagrange weights of the shares at x: the value at x of the polynomial that goes through
+        the shadow values is weights(x) . shadows, without computing its coefficients
+
+        Arguments:
+            x {int} -- Point where the polynomials are evaluated
+
+        Returns:
+            np.ndarray -- Weights (k,), one per id
+        """
+        return z251_array.dot(z251_array.vandermonde([x], self.k)[0], self.inverse_vandermonde)
+
+    def evaluate(self, shadows, x: int) -> np.ndarray:
+        """
+        Returns the values at x of the polynomials that go through the given shadow values
+
+        Arguments:
+            shadows {array_like} -- Shadow values (k, m), row j holds the values of the share with id ids[j]
+            x {int} -- Point where the polynomials are evaluated
+
+        Returns:
+            np.ndarray -- Values (m,), one per polynomial
+        """
+        return z251_array.dot(self.weights(x), shadows)
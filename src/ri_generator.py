@@ -0,0 +1,44 @@
+import os
+import numpy as np
+
+
+class RiGenerator:
+    """
+    Source of the r_i the dealer draws for every block, uniform in [1, 250]
+
+    Random bytes are drawn in bulk and rejection sampled: bytes below 250 are kept and shifted to
+    [1, 250], the rest are dropped, so no value is favoured and r_i is never 0 (mod 251). By default
+    the bytes come from os.urandom. With a seed they come from a private NumPy generator instead,
+    which makes runs reproducible without touching the global random state:
+
+        RiGenerator().draw(t)         # cryptographically secure
+        RiGenerator(seed=7).draw(t)   # same values on every run
+
+    Bytes are always drawn in whole chunks and accepted values are kept for the next draw, so the
+    values only depend on the seed, not on how many are drawn at a time (in stripes, for instance).
+    """
+
+    MAX_RI = 250
+    CHUNK_BYTES = 1 << 16
+
+    def __init__(self, seed: int = None):
+        self.seed = seed
+        self._generator = None if seed is None else np.random.default_rng(seed)
+        self._pending = np.empty(0, dtype=np.uint8)
+
+    def draw(self, count: int) -> np.ndarray:
+        """Returns the next count values of r_i, as a uint8 array"""
+        while len(self._pending) < count:
+            # 250 of every 256 bytes are accepted, the extra 3% avoids most second rounds
+            needed = (count - len(self._pending)) * 103 // 100
+            chunks = needed // RiGenerator.CHUNK_BYTES + 1
+            raw = np.frombuffer(self.random_bytes(chunks * RiGenerator.CHUNK_BYTES), dtype=np.uint8)
+            self._pending = np.concatenate((self._pending, raw[raw < RiGenerator.MAX_RI] + 1))
+
+        drawn, self._pending = self._pending[:count], self._pending[count:]
+        return drawn
+
+    def random_bytes(self, length: int) -> bytes:
+        if self._generator is None:
+            return os.urandom(length)
+        return self._generator.bytes(length)
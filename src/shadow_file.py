@@ -0,0 +1,131 @@
+import mmap
+import struct
+import zlib
+import numpy as np
+from src.bmp_file import BMPFile
+from src.utils import atomic_write
+
+class ShadowFile:
+    """
+    Native container (.shd) for a shadow that doesn't need to be hidden in a cover
+
+    A fixed 32-byte header is followed by the raw shadow bytes (2 per block):
+
+        magic, version, k, bits_per_pixel, participant id, width, height, block count, CRC-32 of the shadow
+
+    The file is memory-mapped, so its shadow is used by RecoverImage without being copied. Width, height
+    and bits per pixel describe the secret, and header mirrors a BMP header for it, reserved1 holding the
+    participant id as in the covers, so recovery treats .shd and .bmp shares alike.
+
+        ShadowFile.save("shadows/1.shd", shadow, k=3, participant_id=1, width=300, height=300)
+        share = ShadowFile("shadows/1.shd")
+        share.shadow  # read-only view over the mapping
+        share.close()  # or use it in a with block
+    """
+
+    MAGIC = b'SHD\x00'
+    VERSION = 1
+    # magic, version, k, bits_per_pixel, participant_id, width, height, block_count, checksum (padded to 32 bytes)
+    HEADER_FORMAT = '<4sHBBHIIII6x'
+    HEADER_BYTES = struct.calcsize(HEADER_FORMAT)
+    EXTENSION = '.shd'
+
+    def __init__(self, file_path, verify: bool = True):
+        """
+        Arguments:
+            file_path {str} -- Shadow file to map
+            verify {bool} -- Check the magic, version, size and checksum of the file
+
+        Raises:
+            ValueError -- If verify is set and the file isn't a valid shadow file
+        """
+        self.file_path = file_path
+        with open(file_path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(self._mmap) < ShadowFile.HEADER_BYTES:
+                raise ValueError(f"{file_path} is too small to be a shadow file")
+            magic, self.version, self.k, bits_per_pixel, participant_id, width, height, self.block_count, self.checksum = struct.unpack_from(
+                ShadowFile.HEADER_FORMAT, self._mmap, 0
+            )
+            if magic != ShadowFile.MAGIC:
+                raise ValueError(f"{file_path} is not a shadow file")
+
+            # Same fields as the header of a BMP with the geometry of the secret
+            self.header = BMPFile.default_header(width, height, bits_per_pixel)
+            self.header['reserved1'] = participant_id
+            self.gap_data = None
+
+            if verify:
+                self.verify()
+            self.shadow = np.frombuffer(self._mmap, dtype=np.uint8, count=2 * self.block_count, offset=ShadowFile.HEADER_BYTES)
+        except ValueError:
+            # Files that aren't shadow files aren't kept mapped
+            self.close()
+            raise
+
+    def close(self):
+        """Releases the mapping, the shadow is no longer available"""
+        if self._mmap is None:
+            return
+        self.shadow = None
+        self._mmap.close()
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def participant_id(self):
+        return self.header['reserved1']
+
+    @property
+    def total_pixels(self):
+        return self.header['width'] * self.header['height']
+
+    @property
+    def channels(self):
+        return max(1, self.header['bits_per_pixel'] // BMPFile.BITS_PER_BYTE)
+
+    def verify(self):
+        """Checks the version, the size and the checksum of the shadow
+
+        Raises:
+            ValueError -- If the file is corrupt or of an unsupported version
+        """
+        if self.version != ShadowFile.VERSION:
+            raise ValueError(f"Unsupported shadow file version: {self.version}")
+        if len(self._mmap) != ShadowFile.HEADER_BYTES + 2 * self.block_count:
+            raise ValueError(f"{self.file_path} should hold {2 * self.block_count} shadow bytes")
+        if zlib.crc32(memoryview(self._mmap)[ShadowFile.HEADER_BYTES:]) != self.checksum:
+            raise ValueError(f"Checksum mismatch in {self.file_path}")
+
+    @staticmethod
+    def save(file_path, shadow, k: int, participant_id: int, width: int, height: int, bits_per_pixel: int = 8) -> int:
+        """Writes a shadow file atomically, filling it through a writable mapping
+
+        Arguments:
+            file_path {str} -- Where the shadow file is written (.shd)
+            shadow {array_like} -- Shadow bytes (2t)
+            k {int} -- Minimum number of shadows to recover the secret
+            participant_id {int} -- Id of the participant, the x where the shadow was evaluated
+            width, height, bits_per_pixel {int} -- Geometry of the secret
+
+        Returns:
+            int -- Bytes written
+        """
+        shadow = np.ascontiguousarray(shadow, dtype=np.uint8)
+        size = ShadowFile.HEADER_BYTES + len(shadow)
+        with atomic_write(file_path) as file:
+            file.truncate(size)
+            with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_WRITE) as mapping:
+                struct.pack_into(
+                    ShadowFile.HEADER_FORMAT, mapping, 0, ShadowFile.MAGIC, ShadowFile.VERSION, k, bits_per_pixel,
+                    participant_id, width, height, len(shadow) // 2, zlib.crc32(shadow),
+                )
+                mapping[ShadowFile.HEADER_BYTES:] = shadow
+        return size
@@ -1,3 +1,7 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
 
 def flatten_array(arr):
     flattened = []
@@ -17,4 +21,33 @@ def convert_to_matrix(array, width, height):
             row.append(array[i * width + j])
         matrix.append(row)
 
-    return matrix
\ No newline at end of file
+    return matrix
+
+def strip_row_padding(raw_data, row_bytes, row_padding, height):
+    """Returns the rows of raw_data as one contiguous bytearray, without the padding at the end of each row"""
+    if row_padding == 0:
+        return bytearray(raw_data[:row_bytes * height])
+
+    view = memoryview(raw_data)
+    row_size = row_bytes + row_padding
+    pixel_data = bytearray(row_bytes * height)
+    for row in range(height):
+        pixel_data[row * row_bytes:(row + 1) * row_bytes] = view[row * row_size:row * row_size + row_bytes]
+    return pixel_data
+
+
+@contextmanager
+def atomic_write(file_path):
+    """
+    Opens a temporary file next to file_path for binary writing and renames it over file_path once the
+    block finishes, so readers never see a partially written file. If the block raises, the temporary file is removed.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    file = tempfile.NamedTemporaryFile(dir=directory, prefix='.', suffix='.tmp', delete=False)
+    try:
+        with file:
+            yield file
+    except BaseException:
+        os.unlink(file.name)
+        raise
+    os.replace(file.name, file_path)
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import numpy as np
+from src.z251 import Z251
+
+
+MODULUS = 251
+
+# Inverse table for the finite field of integers modulo 251, as a lookup array
+INVERSE_TABLE = np.array([Z251.INVERSE_TABLE[value] for value in range(MODULUS)], dtype=np.uint8)
+
+
+def reduce(values) -> np.ndarray:
+    """Reduce an array of integers to Z251
+
+    Arguments:
+        values {array_like} -- Integers to reduce (any integer dtype, negatives allowed)
+
+    Returns:
+        np.ndarray -- uint8 array with values in [0, 250]
+    """
+    values = np.asarray(values)
+    if values.dtype == np.uint8:
+        # Only 251..255 need reducing, which avoids widening the whole array
+        return np.where(values >= MODULUS, values - MODULUS, values).astype(np.uint8)
+    return np.mod(values, MODULUS).astype(np.uint8)
+
+
+def _widen(values) -> np.ndarray:
+    # uint16 holds every sum and product of two reduced elements (250 * 250 = 62500)
+    return reduce(values).astype(np.uint16)
+
+
+def add(a, b) -> np.ndarray:
+    return reduce(_widen(a) + _widen(b))
+
+
+def sub(a, b) -> np.ndarray:
+    # Adding the modulus before subtracting keeps the result non negative in uint16
+    return reduce(_widen(a) + MODULUS - _widen(b))
+
+
+def neg(a) -> np.ndarray:
+    return sub(0, a)
+
+
+def mul(a, b) -> np.ndarray:
+    return reduce(_widen(a) * _widen(b))
+
+
+def inverse(a) -> np.ndarray:
+    """Multiplicative inverse of every element
+
+    Raises:
+        ValueError -- If any element is 0 (mod 251)
+    """
+    a = reduce(a)
+    if np.any(a == 0):
+        raise ValueError("Division by zero is not allowed")
+    return INVERSE_TABLE[a]
+
+
+def div(a, b) -> np.ndarray:
+    return mul(a, inverse(b))
+
+
+def power(a, exponent: int) -> np.ndarray:
+    """Raise every element to a non negative integer exponent using square and multiply"""
+    if exponent < 0:
+        raise ValueError("Negative exponents are not supported")
+    base = reduce(a)
+    result = np.ones_like(base)
+    while exponent:
+        if exponent & 1:
+            result = mul(result, base)
+        base = mul(base, base)
+        exponent >>= 1
+    return result
+
+
+def dot(a, b) -> np.ndarray:
+    """Matrix (or vector) product in Z251
+
+    The product is accumulated in int64, so the inner dimension can be as large as needed.
+
+    Arguments:
+        a {array_like} -- Left operand (..., m)
+        b {array_like} -- Right operand (m, ...)
+
+    Returns:
+        np.ndarray -- uint8 array with the product reduced mod 251
+    """
+    return reduce(np.dot(reduce(a).astype(np.int64), reduce(b).astype(np.int64)))
+
+
+def vandermonde(xs, k: int) -> np.ndarray:
+    """Vandermonde matrix V[j][c] = x_j^c (mod 251)
+
+    Multiplying a (t, k) matrix of coefficients (constant term first) by V.T evaluates the t
+    polynomials at every x in one product.
+
+    Arguments:
+        xs {array_like} -- Points where the polynomials are evaluated (n,)
+        k {int} -- Number of coefficients (degree + 1)
+
+    Returns:
+        np.ndarray -- uint8 matrix (n, k)
+    """
+    xs = reduce(xs)
+    matrix = np.empty((len(xs), k), dtype=np.uint8)
+    matrix[:, 0] = 1
+    for column in range(1, k):
+        matrix[:, column] = mul(matrix[:, column - 1], xs)
+    return matrix
+
+
+def inverse_matrix(matrix) -> np.ndarray:
+    """Inverts a square matrix in Z251 with Gauss-Jordan elimination
+
+    Arguments:
+        matrix {array_like} -- Square matrix (k, k)
+
+    Raises:
+        ValueError -- If the matrix is singular
+
+    Returns:
+        np.ndarray -- uint8 matrix (k, k)
+    """
+    matrix = reduce(matrix)
+    size = matrix.shape[0]
+    augmented = np.concatenate((matrix, np.eye(size, dtype=np.uint8)), axis=1)
+    for column in range(size):
+        pivots = np.nonzero(augmented[column:, column])[0]
+        if len(pivots) == 0:
+            raise ValueError("Matrix is not invertible in Z251")
+        pivot = column + pivots[0]
+        augmented[[column, pivot]] = augmented[[pivot, column]]
+        augmented[column] = mul(augmented[column], INVERSE_TABLE[augmented[column, column]])
+
+        # Eliminate the column from every other row at once
+        factors = augmented[:, column].copy()
+        factors[column] = 0
+        augmented = sub(augmented, mul(factors[:, np.newaxis], augmented[column]))
+    return augmented[:, size:]
+
+
+def solve(a, b):
+    """Solves a batch of linear systems a[s] x = b[s] in Z251 with Gauss-Jordan elimination
+
+    Every system is eliminated at once, each one with its own pivots. Systems with more than one
+    solution get the one with the free unknowns set to 0.
+
+    Arguments:
+        a {array_like} -- Coefficients (s, rows, unknowns)
+        b {array_like} -- Right-hand sides (s, rows)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- Solutions (s, unknowns) and whether each system is solvable (s,)
+    """
+    a = reduce(a)
+    systems, rows, unknowns = a.shape
+    augmented = np.concatenate((a, reduce(b)[:, :, np.newaxis]), axis=2)
+    pivot_rows = np.zeros(systems, dtype=np.int64)
+    pivot_columns = np.full((systems, rows), -1, dtype=np.int64)
+    row_indices = np.arange(rows)
+
+    for column in range(unknowns):
+        candidates = (augmented[:, :, column] != 0) & (row_indices >= pivot_rows[:, np.newaxis])
+        pivoting = np.flatnonzero(candidates.any(axis=1))
+        if len(pivoting) == 0:
+            continue
+        pivot_row = pivot_rows[pivoting]
+        found_row = np.argmax(candidates[pivoting], axis=1)
+
+        # Swap the pivot into place and scale it to 1
+        system = augmented[pivoting]
+        batch = np.arange(len(pivoting))
+        found = system[batch, found_row]
+        system[batch, found_row] = system[batch, pivot_row]
+        pivot = mul(found, INVERSE_TABLE[found[:, column]][:, np.newaxis])
+
+        # Eliminate the column from every other row of every system at once
+        factors = system[:, :, column].copy()
+        factors[batch, pivot_row] = 0
+        system = sub(system, mul(factors[:, :, np.newaxis], pivot[:, np.newaxis, :]))
+        system[batch, pivot_row] = pivot
+        augmented[pivoting] = system
+
+        pivot_columns[pivoting, pivot_row] = column
+        pivot_rows[pivoting] += 1
+
+    # Rows without a pivot read 0 = rhs, which only holds when the rhs is 0
+    solvable = ~np.any((row_indices >= pivot_rows[:, np.newaxis]) & (augmented[:, :, unknowns] != 0), axis=1)
+
+    solutions = np.zeros((systems, unknowns), dtype=np.uint8)
+    system_indices, pivot_indices = np.nonzero(pivot_columns >= 0)
+    solutions[system_indices, pivot_columns[system_indices, pivot_indices]] = augmented[system_indices, pivot_indices, unknowns]
+    return solutions, solvable
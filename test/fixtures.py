@@ -0,0 +1,2 @@
+# The tests build their images with the same helper as the benchmarks
+from bench.fixtures import synthetic_bmp as make_bmp
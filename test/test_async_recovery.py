@@ -0,0 +1,70 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.async_recovery import recover_first_k
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from test.fixtures import make_bmp
+
+
+class RecoverFirstKTestCase(unittest.TestCase):
+    WIDTH, HEIGHT = 30, 28
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        directory = Path(self.directory.name)
+        secret = make_bmp(directory / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+        self.cover_paths = [directory / f"cover{i}.bmp" for i in range(5)]
+        for i, cover_path in enumerate(self.cover_paths):
+            make_bmp(cover_path, self.WIDTH, self.HEIGHT, seed=2 + i)
+        covers = [BMPFile(cover_path) for cover_path in self.cover_paths]
+        DistributeImage(str(directory / "secret.bmp"), k=3, participants=covers).generate_shadows()
+        self.expected = z251_array.reduce(np.frombuffer(secret.pixel_data, dtype=np.uint8)).tobytes()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_slow_shares_are_cancelled(self):
+        async def run():
+            cancelled = []
+
+            async def never_arrives():
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+
+            async def failing():
+                raise OSError("Volume unavailable")
+
+            # The first share is repeated, so a third distinct id is needed
+            sources = [never_arrives(), failing(), self.cover_paths[0], self.cover_paths[0], self.cover_paths[1], self.cover_paths[2]]
+            recovered = await recover_first_k(sources, k=3)
+            await asyncio.sleep(0)
+            return recovered, list(cancelled)
+
+        recovered, cancelled = asyncio.run(run())
+        self.assertEqual(bytes(recovered.pixel_data), self.expected)
+        self.assertEqual(cancelled, [True])
+
+    def test_shares_of_another_size_are_skipped(self):
+        # A share of another secret, with an id of its own, can't be recovered with the others
+        other_path = Path(self.directory.name) / "other.bmp"
+        make_bmp(other_path, self.WIDTH + 2, self.HEIGHT, seed=9, reserved1=4)
+        recovered = asyncio.run(recover_first_k([other_path, self.cover_paths[0], self.cover_paths[1], self.cover_paths[2]], k=3))
+        self.assertEqual(bytes(recovered.pixel_data), self.expected)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(recover_first_k([other_path, self.cover_paths[0], self.cover_paths[1]], k=3))
+
+    def test_not_enough_distinct_shares(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(recover_first_k([self.cover_paths[0], self.cover_paths[0], self.cover_paths[1]], k=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
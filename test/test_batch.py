@@ -0,0 +1,108 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.batch import Batch, BatchJob
+from src.bmp_file import BMPFile
+from src.recover_image import RecoverImage
+from test.fixtures import make_bmp
+
+
+class BatchTestCase(unittest.TestCase):
+    WIDTH, HEIGHT = 30, 28
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / "covers").mkdir()
+        self.covers = [make_bmp(self.path / "covers" / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=10 + i) for i in range(4)]
+        self.secrets = [make_bmp(self.path / f"secret{i}.bmp", self.WIDTH, self.HEIGHT, seed=i) for i in range(3)]
+        self.manifest = self.path / "manifest.jsonl"
+        self.manifest.write_text("".join(
+            json.dumps({"secret": str(self.path / f"secret{i}.bmp"), "k": 3 + i % 2, "covers": str(self.path / "covers"), "output": str(self.path / f"shares{i}")}) + "\n"
+            for i in range(3)
+        ))
+        self.journal = str(self.manifest) + ".done"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertRecovered(self, i, k):
+        shares = [BMPFile(share) for share in sorted((self.path / f"shares{i}").glob("*.bmp"))]
+        recovered = RecoverImage(shares, k, shares[0].total_pixels).recover()
+        expected = z251_array.reduce(np.frombuffer(self.secrets[i].pixel_data, dtype=np.uint8)).tobytes()
+        self.assertEqual(bytes(recovered.pixel_data), expected)
+
+    def test_run(self):
+        lines = []
+        results = Batch(Batch.read_manifest(str(self.manifest)), journal=self.journal, workers=3).run(lines.append)
+
+        self.assertEqual([result["status"] for result in results], ["ok"] * 3)
+        self.assertEqual([result["line"] for result in results], [1, 2, 3])
+        self.assertEqual(len(lines), 3)
+        for i in range(3):
+            self.assertRecovered(i, 3 + i % 2)
+        # The covers are left untouched
+        for i, cover in enumerate(self.covers):
+            self.assertEqual(BMPFile(self.path / "covers" / f"cover{i}.bmp").pixel_data, cover.pixel_data)
+
+    def test_resume(self):
+        jobs = Batch.read_manifest(str(self.manifest))
+        Batch(jobs[:2], journal=self.journal).run()
+        # An interruption in the middle of a journal line only reruns that job
+        with open(self.journal, "a") as file:
+            file.write('{"job": "')
+
+        results = Batch(Batch.read_manifest(str(self.manifest)), journal=self.journal).run()
+        self.assertEqual([result["status"] for result in results], ["skipped", "skipped", "ok"])
+        self.assertRecovered(2, 3)
+
+    def test_errors(self):
+        self.manifest.write_text(json.dumps({"secret": str(self.path / "missing.bmp"), "k": 3, "covers": str(self.path / "covers")}) + "\n")
+        results = Batch(Batch.read_manifest(str(self.manifest)), journal=self.journal).run()
+        self.assertEqual(results[0]["status"], "error")
+        # Failed jobs aren't journaled, so they run again on resume
+        self.assertFalse(Path(self.journal).exists())
+
+        # Malformed secrets fail their own job, the others still run
+        (self.path / "short.bmp").write_bytes(b"BM" + bytes(8))
+        (self.path / "truncated.bmp").write_bytes((self.path / "secret0.bmp").read_bytes()[:1500])
+        self.manifest.write_text("".join(
+            json.dumps({"secret": str(self.path / secret), "k": 3, "covers": str(self.path / "covers"), "output": str(self.path / f"shares{i}")}) + "\n"
+            for i, secret in enumerate(["short.bmp", "truncated.bmp", "secret2.bmp"])
+        ))
+        results = Batch(Batch.read_manifest(str(self.manifest)), journal=self.journal).run()
+        self.assertEqual([result["status"] for result in results], ["error", "error", "ok"])
+        self.assertIn("too small to be a BMP file", results[0]["error"])
+        self.assertRecovered(2, 3)
+
+        self.manifest.write_text('{"secret": "a.bmp"}\n')
+        with self.assertRaises(ValueError):
+            Batch.read_manifest(str(self.manifest))
+
+    def test_csv_manifest(self):
+        manifest = self.path / "manifest.csv"
+        covers = ";".join(str(self.path / "covers" / f"cover{i}.bmp") for i in range(3))
+        manifest.write_text(f"secret,k,covers,output\n{self.path / 'secret0.bmp'},3,{covers},{self.path / 'shares0'}\n")
+
+        jobs = Batch.read_manifest(str(manifest))
+        self.assertEqual((jobs[0].line, jobs[0].k, len(jobs[0].covers)), (2, 3, 3))
+        self.assertEqual(Batch(jobs, journal=str(manifest) + ".done").run()[0]["status"], "ok")
+        self.assertRecovered(0, 3)
+
+    def test_in_place(self):
+        job = BatchJob(1, str(self.path / "secret0.bmp"), 3, str(self.path / "covers"))
+        self.assertEqual(Batch([job], journal=self.journal).run()[0]["status"], "ok")
+        shares = [BMPFile(self.path / "covers" / f"cover{i}.bmp") for i in range(4)]
+        self.assertEqual(sorted(share.header['reserved1'] for share in shares), [1, 2, 3, 4])
+
+        # A second secret hidden in the same covers would overwrite the first one
+        other = BatchJob(2, str(self.path / "secret1.bmp"), 4, str(self.path / "covers"))
+        with self.assertRaises(ValueError):
+            Batch([job, other], journal=self.journal)
+
+
+if __name__ == '__main__':
+    unittest.main()
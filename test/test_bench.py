@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from bench.compare import compare
+from bench.fixtures import parse_size
+from bench.run import bench_distribute, bench_recover, make_fixtures, record, secret_geometry
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_secret_geometry(self):
+        self.assertEqual(secret_geometry(300, 300, 3), (300, 300))
+        # 300 * 294 is the first area that splits in blocks of 14 pixels
+        self.assertEqual(secret_geometry(300, 300, 8), (300, 294))
+        self.assertEqual(parse_size("8192x4096"), (8192, 4096))
+        with self.assertRaises(ValueError):
+            parse_size("300")
+
+    def test_distribute_and_recover(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_fixtures(directory, 24, 20, n=4)
+            distribute = record("distribute", "distribute", bench_distribute(directory, 3, repeat=1), pixels=24 * 20)
+            recover = record("recover", "recover", bench_recover(directory, 3, repeat=1), pixels=24 * 20)
+
+        self.assertEqual(list(distribute["phases"]), ["read", "share", "embed_save"])
+        self.assertEqual(list(recover["phases"]), ["open", "plan", "read_shadows", "reconstruct", "save"])
+        self.assertAlmostEqual(recover["seconds"], sum(recover["phases"].values()))
+        self.assertGreater(distribute["pixels_per_second"], 0)
+
+    def test_compare(self):
+        def run(seconds, rss):
+            return {"results": [{"name": "recover", "seconds": seconds, "phases": {"read": seconds}, "peak_rss_bytes": rss}]}
+
+        comparisons = compare(run(1.0, 100), run(1.5, 105), threshold=0.1)
+        self.assertEqual([(c["metric"], c["regression"]) for c in comparisons], [
+            ("seconds", True), ("phases.read", True), ("peak_rss_bytes", False),
+        ])
+        # Slowdowns within the noise floor aren't regressions, whatever their ratio
+        self.assertFalse(any(c["regression"] for c in compare(run(0.001, 100), run(0.002, 100), min_seconds=0.002)))
+
+
+if __name__ == '__main__':
+    unittest.main()
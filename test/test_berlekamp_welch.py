@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from src import berlekamp_welch, z251_array
+
+
+class BerlekampWelchTestCase(unittest.TestCase):
+    XS = [1, 2, 3, 4, 5, 6, 7]
+    K = 3
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.coefficients = rng.integers(0, 251, (500, BerlekampWelchTestCase.K)).astype(np.uint8)
+        self.values = z251_array.dot(self.coefficients, z251_array.vandermonde(BerlekampWelchTestCase.XS, BerlekampWelchTestCase.K).T).T.copy()
+        self.noise = rng.integers(1, 251, 500)
+
+    def test_decode_locates_errors(self):
+        # Up to (7 - 3) // 2 = 2 wrong values per polynomial
+        self.values[2] = z251_array.add(self.values[2], self.noise)
+        self.values[5, :250] = z251_array.add(self.values[5, :250], self.noise[:250])
+
+        coefficients, wrong, decoded = berlekamp_welch.decode(BerlekampWelchTestCase.XS, BerlekampWelchTestCase.K, self.values)
+        self.assertTrue(np.all(decoded))
+        self.assertTrue(np.array_equal(coefficients, self.coefficients))
+        self.assertTrue(np.array_equal(np.flatnonzero(wrong.any(axis=0)), [2, 5]))
+        self.assertTrue(np.all(wrong[:250, 5]) and not np.any(wrong[250:, 5]))
+
+    def test_decode_too_many_errors(self):
+        for row in (0, 3, 6):
+            self.values[row, :10] = z251_array.add(self.values[row, :10], self.noise[:10])
+
+        coefficients, _, decoded = berlekamp_welch.decode(BerlekampWelchTestCase.XS, BerlekampWelchTestCase.K, self.values)
+        self.assertTrue(np.all(decoded[10:]))
+        # Three wrong values are never passed off as the original polynomial
+        self.assertFalse(np.any(decoded[:10] & np.all(coefficients[:10] == self.coefficients[:10], axis=1)))
+
+    def test_divide(self):
+        # (x + 1)(x + 2) + 3 divided by x + 1
+        quotient, remainder = berlekamp_welch.divide(np.array([[5, 3, 1]]), np.array([[1, 1]]))
+        self.assertEqual(quotient.tolist(), [[2, 1]])
+        self.assertEqual(remainder.tolist(), [[3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
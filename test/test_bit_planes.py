@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+from src import bit_planes
+
+
+class BitPlanesTestCase(unittest.TestCase):
+    def test_unpack(self):
+        self.assertEqual(list(bit_planes.unpack(b"\xb4\x0f", 2)), [0b10, 0b11, 0b01, 0b00, 0b00, 0b00, 0b11, 0b11])
+        self.assertEqual(list(bit_planes.unpack(b"\xb4\x0f", 4)), [0b1011, 0b0100, 0b0000, 0b1111])
+
+    def test_round_trip(self):
+        data = np.random.default_rng(0).integers(0, 256, size=1000, dtype=np.uint8)
+        data[:3] = 0 # leading zero bytes must survive
+        for bits in (2, 4):
+            packed = bit_planes.pack(bit_planes.unpack(data, bits), bits)
+            self.assertEqual(len(packed), len(data))
+            self.assertTrue(np.array_equal(packed, data))
+
+    def test_pack_ignores_high_bits(self):
+        # the carrier bytes can be passed as they are
+        self.assertEqual(list(bit_planes.pack([0xf2, 0x13, 0xa1, 0x40], 2)), [0b10110100])
+
+    def test_invalid_bits(self):
+        with self.assertRaises(ValueError):
+            bit_planes.unpack(b"\x00", 3)
+        with self.assertRaises(ValueError):
+            bit_planes.pack([1, 2, 3], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
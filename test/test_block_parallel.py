@@ -0,0 +1,55 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+from src import block_parallel
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.recover_image import RecoverImage
+from test.fixtures import make_bmp
+
+
+class BlockParallelTestCase(unittest.TestCase):
+    def test_block_ranges(self):
+        ranges = block_parallel.block_ranges(1000, workers=3, min_blocks=10)
+        self.assertEqual(len(ranges), 3 * block_parallel.CHUNKS_PER_WORKER)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], 1000)
+        self.assertTrue(all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:])))
+
+        # Small images aren't worth splitting
+        self.assertEqual(block_parallel.block_ranges(1000, workers=3, min_blocks=1000), [(0, 1000)])
+
+    def test_shared_array(self):
+        with block_parallel.SharedArray.from_array(np.arange(10, dtype=np.uint8)) as shared:
+            attached = block_parallel.SharedArray.attach(shared.spec)
+            attached.array[0] = 42
+            attached.close()
+            self.assertEqual(shared.array[0], 42)
+
+    @patch.object(block_parallel, 'MIN_BLOCKS_PER_CHUNK', 16)
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 64, 48, seed=1)
+            for i in range(5):
+                make_bmp(Path(directory) / f"cover{i}.bmp", 64, 48, seed=2 + i)
+            covers = [BMPFile(Path(directory) / f"cover{i}.bmp") for i in range(5)]
+
+            shadows = []
+            for workers in (1, 3):
+                distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=4, participants=covers, workers=workers, seed=7)
+                shadows.append(distribute_image.compute_shadows(distribute_image.secret_image.pixels.reshape(-1)))
+            self.assertTrue(np.array_equal(shadows[0], shadows[1]))
+
+            distribute_image.lsb_hide(shadows[0], covers)
+            shares = [BMPFile(Path(directory) / f"cover{i}.bmp", use_mmap=True) for i in range(5)]
+            recovered = [
+                RecoverImage(shares, k=4, share_length=shares[0].total_pixels, workers=workers).recover().pixel_data
+                for workers in (1, 3)
+            ]
+            self.assertEqual(recovered[0], recovered[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
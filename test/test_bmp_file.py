@@ -1,7 +1,11 @@
 import os
+import struct
+import tempfile
 import unittest
 from pathlib import Path
+import numpy as np
 from src.bmp_file import BMPFile
+from test.fixtures import make_bmp
 
 class BMPFileTestCase(unittest.TestCase):
     folder_path = Path("images/shares")
@@ -77,5 +81,136 @@ class BMPFileTestCase(unittest.TestCase):
             self.assertTrue(bmp.is_dibisible_by(2 * 6 - 2))
             self.assertTrue(bmp.is_dibisible_by(2 * 7 - 2))
 
+
+class BMPFileFixtureTestCase(unittest.TestCase):
+    """Tests on images built by make_bmp or by hand, which don't need the images/ tree"""
+
+    def test_row_padding_is_stripped(self):
+        width, height = 3, 2
+        rows = [b"\x01\x02\x03", b"\x04\x05\x06"]
+        header = b"BM" + struct.pack('<IHHIIIIHHIIIIII', 54 + 8, 0, 0, 54, 40, width, height, 1, 8, 0, 8, 0, 0, 0, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "padded.bmp"
+            file_path.write_bytes(header + rows[0] + b"\x00" + rows[1] + b"\x00")
+            bmp = BMPFile(file_path)
+            mapped_bmp = BMPFile(file_path, use_mmap=True)
+
+            self.assertEqual(bmp.row_padding, 1)
+            self.assertEqual(bytes(bmp.pixel_data), rows[0] + rows[1])
+            self.assertEqual(bmp.image_data, [[b"\x01", b"\x02", b"\x03"], [b"\x04", b"\x05", b"\x06"]])
+
+            # The mapped pixels skip the padding through the strides and can't be written
+            self.assertEqual(mapped_bmp.header, bmp.header)
+            self.assertEqual(mapped_bmp.pixels.strides, (4, 1))
+            self.assertEqual(mapped_bmp.pixels.tobytes(), rows[0] + rows[1])
+            self.assertFalse(mapped_bmp.pixels.flags.writeable)
+
+            # Mutating goes through pixel_data, which copies the pixels out of the mapping
+            mapped_bmp.pixel_data[0] = 9
+            self.assertEqual(mapped_bmp.pixels[0][0], 9)
+            self.assertEqual(file_path.read_bytes()[54], 1)
+
+    def test_save_writes_row_padding(self):
+        width, height = 3, 2
+        header = {
+            'signature': 'BM', 'file_size': 1078 + 8, 'reserved1': 0, 'reserved2': 0, 'data_offset': 1078,
+            'header_size': 40, 'width': width, 'height': height, 'planes': 1, 'bits_per_pixel': 8, 'compression': 0,
+            'image_size': 8, 'x_pixels_per_meter': 0, 'y_pixels_per_meter': 0, 'total_colors': 0, 'important_colors': 0,
+        }
+        bmp = BMPFile(header=header, pixel_data=b"\x01\x02\x03\x04\x05\x06")
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "padded.bmp"
+            bmp.save(file_path)
+            data = file_path.read_bytes()
+            saved_bmp = BMPFile(file_path)
+            saved_pixels = bytes(saved_bmp.pixel_data)
+
+        self.assertEqual(len(data), 1078 + 8)
+        self.assertEqual(data[54:62], b"\x00\x00\x00\x00\x01\x01\x01\x01")
+        self.assertEqual(data[1078:], b"\x01\x02\x03\x00\x04\x05\x06\x00")
+        self.assertEqual(saved_pixels, b"\x01\x02\x03\x04\x05\x06")
+
+    def test_lazy_loading(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "lazy.bmp"
+            expected = make_bmp(file_path, 30, 28, seed=3)
+            bmp = BMPFile(file_path)
+
+            # Geometry only needs the header
+            self.assertTrue(bmp.is_dibisible_by(4))
+            self.assertEqual(bmp.total_bytes, 30 * 28)
+            self.assertEqual(len(bmp.gap_data), 1024)
+            self.assertFalse(bmp.is_loaded)
+
+            # The file is read before saving over it
+            bmp.save(file_path)
+            self.assertTrue(bmp.is_loaded)
+            self.assertEqual(bytes(bmp.pixel_data), bytes(expected.pixel_data))
+            self.assertEqual(BMPFile(file_path).pixels.tobytes(), bytes(expected.pixel_data))
+
+    def test_planes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bmp = make_bmp(Path(directory) / "color.bmp", 5, 3, seed=4, bits_per_pixel=24)
+            planes = bmp.planes()
+            pixels = np.frombuffer(bmp.pixel_data, dtype=np.uint8)
+
+            self.assertEqual(planes.shape, (3, 15))
+            self.assertTrue(planes.flags.c_contiguous)
+            self.assertTrue(np.array_equal(planes[1], pixels[1::3]))
+            self.assertTrue(np.array_equal(BMPFile.from_planes(planes), pixels))
+
+    def test_mmap_matches_read(self):
+        # 30 pixel wide 8-bit rows are padded, 24-bit ones aren't
+        with tempfile.TemporaryDirectory() as directory:
+            for bits_per_pixel in (8, 24):
+                file_path = Path(directory) / f"image{bits_per_pixel}.bmp"
+                make_bmp(file_path, 30, 28, seed=5, bits_per_pixel=bits_per_pixel)
+                bmp = BMPFile(file_path)
+                mapped_bmp = BMPFile(file_path, use_mmap=True)
+
+                self.assertEqual(mapped_bmp.header, bmp.header)
+                self.assertEqual(mapped_bmp.pixels.tobytes(), bytes(bmp.pixel_data))
+
+    def test_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "image.bmp"
+            expected = make_bmp(file_path, 30, 28, seed=5).pixel_data
+            with BMPFile(file_path, use_mmap=True) as mapped_bmp:
+                self.assertEqual(mapped_bmp.pixels.tobytes(), bytes(expected))
+            self.assertIsNone(mapped_bmp._mmap)
+            # Once the mapping is released, the pixels are read from the file
+            self.assertEqual(mapped_bmp.pixel_data, expected)
+
+    def test_pixel_data(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "image.bmp"
+            make_bmp(file_path, 30, 28, seed=4)
+            bmp = BMPFile(file_path)
+
+            # pixel_data is one contiguous buffer, and pixels/image_data are views of it
+            self.assertIsInstance(bmp.pixel_data, bytearray)
+            self.assertEqual(len(bmp.pixel_data), 30 * 28)
+            self.assertEqual(bmp.pixels.shape, (28, 30))
+            self.assertEqual(bmp.pixels[1][2], bmp.pixel_data[32])
+            self.assertEqual(bmp.image_data[1][2], bytes([bmp.pixel_data[32]]))
+
+    def test_save_round_trip(self):
+        # 30 pixel wide 8-bit rows are padded and keep a color table, 24-bit ones have neither
+        with tempfile.TemporaryDirectory() as directory:
+            for bits_per_pixel in (8, 24):
+                file_name = f"image{bits_per_pixel}.bmp"
+                file_path = Path(directory) / file_name
+                make_bmp(file_path, 30, 28, seed=6, bits_per_pixel=bits_per_pixel)
+                saved_directory = Path(directory) / f"saved{bits_per_pixel}"
+                saved_directory.mkdir()
+                for use_mmap, atomic in [(False, False), (True, True)]:
+                    saved_path = saved_directory / file_name
+                    BMPFile(file_path, use_mmap=use_mmap).save(saved_path, atomic=atomic)
+
+                    # The header, the gap bytes and the pixels are written back unchanged, and no temporary file is left
+                    self.assertEqual(saved_path.read_bytes(), file_path.read_bytes())
+                    self.assertEqual(os.listdir(saved_directory), [file_name])
+
+
 if __name__ == '__main__':
     unittest.main()
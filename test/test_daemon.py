@@ -0,0 +1,144 @@
+import socket
+import tempfile
+import threading
+import unittest
+import warnings
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+from src import block_parallel, z251_array
+from src.bmp_file import BMPFile
+from src.daemon import HeaderCache, SharingDaemon, receive_message, request, send_message
+from src.plan_cache import PlanCache
+from test.fixtures import make_bmp
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix domain sockets are not available")
+class SharingDaemonTestCase(unittest.TestCase):
+    WIDTH, HEIGHT = 30, 28
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.secret = make_bmp(self.path / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+        (self.path / "covers").mkdir()
+        for i in range(5):
+            make_bmp(self.path / "covers" / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i)
+
+        self.socket_path = str(self.path / "daemon.sock")
+        self.daemon = SharingDaemon(self.socket_path, workers=2, plans=PlanCache())
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        self.directory.cleanup()
+
+    def distribute(self, **options):
+        return request(self.socket_path, {"operation": "d", "secret_image": str(self.path / "secret.bmp"), "k": 3, "directory": str(self.path / "covers"), **options})
+
+    def recover(self, output, **options):
+        return request(self.socket_path, {"operation": "r", "k": 3, "directory": str(self.path / "covers"), "output": str(output), **options})
+
+    def assertRecovered(self, output):
+        expected = z251_array.reduce(np.frombuffer(self.secret.pixel_data, dtype=np.uint8)).tobytes()
+        self.assertEqual(bytes(BMPFile(output).pixel_data), expected)
+
+    def test_distribute_and_recover(self):
+        reply = self.distribute(seed=7)
+        self.assertTrue(reply["ok"], reply)
+        self.assertEqual(len(reply["bytes_written"]), 5)
+
+        for i in range(3):
+            reply = self.recover(self.path / f"recovered{i}.bmp")
+            self.assertTrue(reply["ok"], reply)
+            self.assertRecovered(self.path / f"recovered{i}.bmp")
+
+        status = request(self.socket_path, {"operation": "status"})
+        self.assertEqual(status["jobs_served"], 4)
+        # The same directory keeps hitting the same plan, and its headers are only read once
+        self.assertEqual((status["plans"]["misses"], status["plans"]["hits"]), (1, 2))
+        self.assertEqual(status["headers"]["misses"], 3)
+
+    def test_concurrent_jobs(self):
+        self.assertTrue(self.distribute()["ok"])
+        replies = [None] * 6
+
+        def recover(i):
+            replies[i] = self.recover(self.path / f"recovered{i}.bmp", io_threads=2)
+
+        threads = [threading.Thread(target=recover, args=(i,)) for i in range(len(replies))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, reply in enumerate(replies):
+            self.assertTrue(reply["ok"], reply)
+            self.assertRecovered(self.path / f"recovered{i}.bmp")
+
+    @patch.object(block_parallel, 'MIN_BLOCKS_PER_CHUNK', 16)
+    def test_worker_processes(self):
+        # The daemon runs jobs on threads, so its worker processes must not be forked from it
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            reply = self.distribute(jobs=2)
+            self.assertTrue(reply["ok"], reply)
+            reply = self.recover(self.path / "recovered.bmp", jobs=2)
+            self.assertTrue(reply["ok"], reply)
+        self.assertRecovered(self.path / "recovered.bmp")
+        self.assertEqual([str(warning.message) for warning in caught if "fork" in str(warning.message)], [])
+
+    def test_errors_are_replied(self):
+        self.assertFalse(self.recover(self.path / "recovered.bmp", format="shd")["ok"])
+        self.assertIn("Missing field", request(self.socket_path, {"operation": "r", "k": 3})["error"])
+        self.assertFalse(request(self.socket_path, {"operation": "x"})["ok"])
+
+        # Several requests share a connection, and a malformed one doesn't close it
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.socket_path)
+            send_message(connection, b"not json")
+            self.assertIn(b"Invalid request", receive_message(connection))
+            send_message(connection, b'{"operation": "status"}')
+            self.assertIn(b'"ok": true', receive_message(connection))
+
+        reply = request(self.socket_path, {"operation": "r", "k": "3", "directory": str(self.path / "covers"), "output": "x.bmp"})
+        self.assertEqual(reply, {"ok": False, "error": "Invalid field k: expected int, got '3'"})
+
+    def test_idle_connections_hold_no_worker(self):
+        self.assertTrue(self.distribute()["ok"])
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as first, socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as second:
+            # As many idle clients as workers
+            first.connect(self.socket_path)
+            second.connect(self.socket_path)
+            reply = request(self.socket_path, {"operation": "status"}, timeout=10)
+            self.assertTrue(reply["ok"])
+
+            # Closing doesn't wait for the idle clients
+            self.daemon.shutdown()
+            self.thread.join()
+            closing = threading.Thread(target=self.daemon.server_close)
+            closing.start()
+            closing.join(timeout=10)
+            self.assertFalse(closing.is_alive())
+
+
+class HeaderCacheTestCase(unittest.TestCase):
+    def test_rewritten_files_are_read_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "share.bmp"
+            make_bmp(file_path, 8, 4, reserved1=1)
+            headers = HeaderCache()
+            self.assertEqual(headers.header(file_path)['reserved1'], 1)
+            self.assertEqual(headers.header(file_path)['reserved1'], 1)
+            self.assertEqual((headers.hits, headers.misses), (1, 1))
+
+            make_bmp(file_path, 8, 4, reserved1=2)
+            self.assertEqual(headers.header(file_path)['reserved1'], 2)
+            self.assertEqual(headers.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,15 @@
+import tempfile
 import unittest
+import warnings
 from pathlib import Path
+from unittest.mock import patch
+from src import block_parallel
 from src.distribute_image import DistributeImage
 from src.bmp_file import BMPFile
+from src.polynomial import Polynomial
+from src.ri_generator import RiGenerator
+from src.z251 import Z251
+from test.fixtures import make_bmp
 
 
 class DistributeImageTests(unittest.TestCase):
@@ -31,6 +39,194 @@ class DistributeImageTests(unittest.TestCase):
             self.assertEqual(len(shadows[0]), 2 * distribute_image.total_blocks)  # |S_j| = 2 * t (where t is the number of blocks in the secret image, and S_j is the shadow j)
             self.assertEqual(len(shadows[0]), distribute_image.secret_image.total_pixels // (distribute_image.k - 1)) # |S_j| = |I| / (k - 1) (where I is the secret image, and S_j is the shadow j)
 
+    def test_shadows_match_polynomial_evaluation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+            for i in range(8):
+                make_bmp(Path(directory) / f"cover{i}.bmp", 30, 28, seed=2 + i)
+            covers = [BMPFile(Path(directory) / f"cover{i}.bmp") for i in range(8)]
+
+            for k, _ in DistributeImageTests.K_AND_BLOCK_SIZES:
+                distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=k, participants=covers, seed=7)
+
+                shadows = distribute_image.compute_shadows(distribute_image.secret_image.planes().reshape(-1))
+                ri = RiGenerator(seed=7).draw(distribute_image.total_blocks)
+
+                pixels = [byte[0] for row in distribute_image.secret_image.image_data for byte in row]
+                for block in (0, distribute_image.total_blocks - 1):
+                    block_pixels = pixels[block * distribute_image.block_size:(block + 1) * distribute_image.block_size]
+                    a = block_pixels[:k]
+                    b = [-int(ri[block]) * (a[0] % 251 or 1), -int(ri[block]) * (a[1] % 251 or 1)] + block_pixels[k:]
+                    fi = Polynomial([Z251(value) for value in a[::-1]])
+                    gi = Polynomial([Z251(value) for value in b[::-1]])
+                    for j in range(len(covers)):
+                        self.assertEqual(shadows[j][2 * block], fi.evaluate(j + 1).value)
+                        self.assertEqual(shadows[j][2 * block + 1], gi.evaluate(j + 1).value)
+
+    def test_lsb_hide_in_place(self):
+        for k, _ in DistributeImageTests.K_AND_BLOCK_SIZES:
+            with tempfile.TemporaryDirectory() as directory:
+                make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+                saved_files = []
+                for in_place in (False, True):
+                    folder = Path(directory) / str(in_place)
+                    folder.mkdir()
+                    for i in range(k + 1):
+                        make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                    covers = [BMPFile(file_path, use_mmap=in_place) for file_path in sorted(folder.glob("*.bmp"))]
+                    distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=k, participants=covers, in_place=in_place, seed=7)
+
+                    shadows = distribute_image.generate_shadows()
+                    saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+
+                # Both modes leave the same files, but in place only the carrier bytes and reserved1 are written
+                self.assertEqual(saved_files[0], saved_files[1])
+                carrier_bytes = len(shadows[0]) * 8 // distribute_image.lsb()
+                self.assertEqual(distribute_image.bytes_written, [carrier_bytes + 2] * len(covers))
+
+    def test_stream_shadows(self):
+        # 30 pixel wide rows are padded to 32 bytes, and stripes don't line up with rows
+        for k, _ in DistributeImageTests.K_AND_BLOCK_SIZES:
+            with tempfile.TemporaryDirectory() as directory:
+                make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+                saved_files = []
+                for streaming in (False, True):
+                    folder = Path(directory) / str(streaming)
+                    folder.mkdir()
+                    for i in range(k + 1):
+                        make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                    covers = [BMPFile(folder / f"cover{i}.bmp", use_mmap=True) for i in range(k + 1)]
+                    distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=k, participants=covers, in_place=True, seed=7)
+
+                    if streaming:
+                        self.assertGreater(distribute_image.total_blocks, distribute_image.stripe_blocks(1000))
+                        distribute_image.stream_shadows(memory_limit=1000)
+                    else:
+                        distribute_image.generate_shadows()
+                    saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+
+                self.assertEqual(saved_files[0], saved_files[1])
+
+    def test_lsb_hide_workers(self):
+        for in_place in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+                saved_files = []
+                for workers in (1, 3):
+                    folder = Path(directory) / str(workers)
+                    folder.mkdir()
+                    for i in range(5):
+                        make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                    covers = [BMPFile(folder / f"cover{i}.bmp") for i in range(5)]
+                    distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=4, participants=covers, in_place=in_place, workers=workers, seed=7)
+
+                    distribute_image.generate_shadows()
+                    saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+                    self.assertEqual([cover.header['reserved1'] for cover in covers], [1, 2, 3, 4, 5])
+
+                self.assertEqual(saved_files[0], saved_files[1])
+
+    def test_lsb_hide_workers_in_memory_covers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+            saved_files = []
+            for workers in (1, 3):
+                folder = Path(directory) / str(workers)
+                folder.mkdir()
+                for i in range(5):
+                    make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                covers = [BMPFile(folder / f"cover{i}.bmp") for i in range(5)]
+                # Pixels edited and not saved, which a worker reading the file wouldn't see
+                covers[0].pixel_data[:] = bytes(len(covers[0].pixel_data))
+                covers[1].pixel_data
+                distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=4, participants=covers, workers=workers, seed=7)
+
+                distribute_image.generate_shadows()
+                saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+                self.assertEqual([cover.header['reserved1'] for cover in covers], [1, 2, 3, 4, 5])
+
+            self.assertEqual(saved_files[0], saved_files[1])
+
+    def test_pipeline_shadows(self):
+        for in_place in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+                saved_files = []
+                for pipelined in (False, True):
+                    folder = Path(directory) / str(pipelined)
+                    folder.mkdir()
+                    for i in range(5):
+                        make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                    covers = [BMPFile(folder / f"cover{i}.bmp", use_mmap=True) for i in range(5)]
+                    distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=4, participants=covers, in_place=in_place, seed=7)
+
+                    if pipelined:
+                        bytes_written = distribute_image.pipeline_shadows(threads=3)
+                        self.assertEqual(bytes_written, distribute_image.bytes_written)
+                    else:
+                        distribute_image.generate_shadows()
+                    saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+                    self.assertEqual([cover.header['reserved1'] for cover in distribute_image.participants], [1, 2, 3, 4, 5])
+
+                self.assertEqual(saved_files[0], saved_files[1])
+
+    @patch.object(block_parallel, 'MIN_BLOCKS_PER_CHUNK', 16)
+    def test_pipeline_shadows_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+            saved_files = []
+            for workers in (1, 3):
+                folder = Path(directory) / str(workers)
+                folder.mkdir()
+                for i in range(4):
+                    make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i)
+                covers = [BMPFile(folder / f"cover{i}.bmp") for i in range(4)]
+                distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=3, participants=covers, workers=workers, seed=7)
+
+                # The shadows are computed while the reader threads run, so the workers must not be forked
+                with warnings.catch_warnings(record=True) as caught:
+                    warnings.simplefilter("always")
+                    distribute_image.pipeline_shadows(threads=2)
+                self.assertEqual([str(warning.message) for warning in caught if "fork" in str(warning.message)], [])
+                saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+
+            self.assertEqual(saved_files[0], saved_files[1])
+
+    def test_pipeline_shadows_24_bit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1, bits_per_pixel=24)
+            saved_files = []
+            for pipelined in (False, True):
+                folder = Path(directory) / str(pipelined)
+                folder.mkdir()
+                for i in range(4):
+                    make_bmp(folder / f"cover{i}.bmp", 30, 28, seed=2 + i, bits_per_pixel=24)
+                covers = [BMPFile(folder / f"cover{i}.bmp") for i in range(4)]
+                distribute_image = DistributeImage(str(Path(directory) / "secret.bmp"), k=3, participants=covers, seed=7)
+                # Every channel of the covers carries shadow bits
+                self.assertEqual(distribute_image.total_blocks * 2 * 8 // distribute_image.lsb(), covers[0].total_bytes)
+
+                if pipelined:
+                    distribute_image.pipeline_shadows(threads=2)
+                else:
+                    distribute_image.generate_shadows()
+                saved_files.append([file_path.read_bytes() for file_path in sorted(folder.glob("*.bmp"))])
+
+                with self.assertRaises(ValueError):
+                    distribute_image.stream_shadows()
+
+            self.assertEqual(saved_files[0], saved_files[1])
+
+    def test_covers_of_another_bit_depth(self):
+        # 24-bit covers are large enough for an 8-bit secret, but its shares would be recovered as 3 planes
+        with tempfile.TemporaryDirectory() as directory:
+            make_bmp(Path(directory) / "secret.bmp", 30, 28, seed=1)
+            for i in range(3):
+                make_bmp(Path(directory) / f"cover{i}.bmp", 30, 28, seed=2 + i, bits_per_pixel=24)
+            covers = [BMPFile(Path(directory) / f"cover{i}.bmp") for i in range(3)]
+            with self.assertRaises(ValueError):
+                DistributeImage(str(Path(directory) / "secret.bmp"), k=3, participants=covers)
+
     @unittest.skip("Skipping this test for a reason.")
     def test_lsb_hide(self):
         for k, block_size in DistributeImageTests.K_AND_BLOCK_SIZES:
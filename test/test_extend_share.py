@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.extend_share import ExtendShare
+from src.recover_image import RecoverImage
+from test.fixtures import make_bmp
+
+
+class ExtendShareTestCase(unittest.TestCase):
+    # 30 pixel wide rows are padded to 32 bytes
+    WIDTH, HEIGHT = 30, 28
+
+    def test_extend_matches_distribution(self):
+        for k in (3, 5, 8):
+            for in_place in (False, True):
+                with tempfile.TemporaryDirectory() as directory:
+                    directory = Path(directory)
+                    make_bmp(directory / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+                    for i in range(k + 1):
+                        make_bmp(directory / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i)
+                    # The new participant gets the cover the last one would have had
+                    shutil.copy(directory / f"cover{k}.bmp", directory / "new.bmp")
+                    covers = [BMPFile(directory / f"cover{i}.bmp") for i in range(k + 1)]
+                    DistributeImage(str(directory / "secret.bmp"), k=k, participants=covers).generate_shadows()
+
+                    shares = [BMPFile(directory / f"cover{i}.bmp", use_mmap=True) for i in range(k)]
+                    extend_share = ExtendShare(shares, k=k, share_length=shares[0].total_pixels)
+                    self.assertEqual(extend_share.next_id(), k + 1)
+                    extend_share.extend(BMPFile(directory / "new.bmp"), k + 1, in_place=in_place)
+
+                    self.assertEqual((directory / "new.bmp").read_bytes(), (directory / f"cover{k}.bmp").read_bytes())
+
+    def test_new_share_recovers_the_secret(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            secret = make_bmp(directory / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+            for i in range(3):
+                make_bmp(directory / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i)
+            make_bmp(directory / "new.bmp", self.WIDTH, self.HEIGHT, seed=9)
+            covers = [BMPFile(directory / f"cover{i}.bmp") for i in range(3)]
+            DistributeImage(str(directory / "secret.bmp"), k=3, participants=covers).generate_shadows()
+
+            shares = [BMPFile(directory / f"cover{i}.bmp", use_mmap=True) for i in range(3)]
+            ExtendShare(shares, k=3, share_length=shares[0].total_pixels).extend(BMPFile(directory / "new.bmp"), 200)
+
+            shares = [BMPFile(directory / "new.bmp", use_mmap=True)] + shares[:2]
+            recovered = RecoverImage(shares, k=3, share_length=shares[0].total_pixels).recover()
+            self.assertEqual(shares[0].header['reserved1'], 200)
+            self.assertEqual(bytes(recovered.pixel_data), z251_array.reduce(np.frombuffer(secret.pixel_data, dtype=np.uint8)).tobytes())
+
+    def test_invalid_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            make_bmp(directory / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+            for i in range(3):
+                make_bmp(directory / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i)
+            covers = [BMPFile(directory / f"cover{i}.bmp") for i in range(3)]
+            DistributeImage(str(directory / "secret.bmp"), k=3, participants=covers).generate_shadows()
+
+            extend_share = ExtendShare(covers, k=3, share_length=covers[0].total_pixels)
+            for participant_id in (0, 2, 251, 253, 1 << 16):
+                with self.assertRaises(ValueError):
+                    extend_share.shadow_for(participant_id)
+
+            # Once every id in Z251 is taken, there is no id left to issue
+            extend_share.used_ids = set(range(1, 251))
+            with self.assertRaises(ValueError):
+                extend_share.next_id()
+
+    def test_cover_of_another_bit_depth(self):
+        # A 24-bit cover is large enough for the shadow of 8-bit shares, but recovering with it would fail
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            make_bmp(directory / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1)
+            for i in range(3):
+                make_bmp(directory / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i)
+            make_bmp(directory / "new_cover.bmp", self.WIDTH, self.HEIGHT, seed=5, bits_per_pixel=24)
+            covers = [BMPFile(directory / f"cover{i}.bmp") for i in range(3)]
+            DistributeImage(str(directory / "secret.bmp"), k=3, participants=covers).generate_shadows()
+
+            extend_share = ExtendShare(covers, k=3, share_length=covers[0].total_pixels)
+            with self.assertRaises(ValueError):
+                extend_share.extend(BMPFile(directory / "new_cover.bmp"), participant_id=extend_share.next_id())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.plan_cache import PlanCache
+from src.recovery_plan import RecoveryPlan
+
+
+class PlanCacheTestCase(unittest.TestCase):
+    def test_plans_match_recovery_plan(self):
+        cache = PlanCache()
+        for ids in ([1, 2, 3], [3, 1, 2], [2, 1, 254]):
+            plan = cache.plan(ids, 3)
+            self.assertEqual(plan.ids, ids)
+            self.assertTrue(np.array_equal(plan.inverse_vandermonde, RecoveryPlan(ids, 3).inverse_vandermonde))
+        # Every order of the same ids is a single entry, 254 being 3 in Z251
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (2, 1, 1))
+
+        with self.assertRaises(ValueError):
+            cache.plan([1, 2, 2], 3)
+        self.assertEqual(len(cache), 1)
+
+    def test_eviction(self):
+        cache = PlanCache(capacity=2)
+        cache.plan([1, 2, 3], 3)
+        cache.plan([1, 2, 4], 3)
+        cache.plan([1, 2, 3], 3)
+        cache.plan([1, 2, 5], 3)
+        # [1, 2, 4] was the least recently used
+        cache.plan([1, 2, 3], 3)
+        cache.plan([1, 2, 4], 3)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (2, 4, 2))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "plans.npz"
+            cache = PlanCache(file_path=file_path)
+            cache.plan([1, 2, 3], 3)
+            cache.plan([2, 5, 6, 7], 4)
+            cache.save()
+
+            warm = PlanCache(file_path=file_path)
+            self.assertEqual(len(warm), 2)
+            plan = warm.plan([7, 6, 5, 2], 4)
+            self.assertEqual((warm.hits, warm.misses), (1, 0))
+            self.assertTrue(np.array_equal(plan.inverse_vandermonde, RecoveryPlan([7, 6, 5, 2], 4).inverse_vandermonde))
+
+    def test_invalid_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "plans.npz"
+            for name, inverse in (("3-1-2-3", np.eye(4)), ("3-1-2", np.eye(3)), ("3-3-2-1", np.eye(3)), ("plan", np.eye(3))):
+                np.savez(file_path, **{"2-1-2": np.eye(2), name: inverse})
+                with self.assertRaises(ValueError):
+                    PlanCache(file_path=file_path)
+
+            cache = PlanCache()
+            with self.assertRaises(ValueError):
+                cache.load(file_path)
+            self.assertEqual(len(cache), 0)
+
+    def test_threads(self):
+        cache = PlanCache(capacity=4)
+        id_sets = [[1, 2, x] for x in range(3, 11)]
+
+        # Assertions failing in a worker thread wouldn't fail the test, so the threads only collect the wrong plans
+        wrong_plans = []
+
+        def work():
+            for ids in id_sets * 5:
+                plan = cache.plan(ids, 3)
+                if not np.array_equal(z251_array.dot(plan.inverse_vandermonde, z251_array.vandermonde(ids, 3)), np.eye(3)):
+                    wrong_plans.append(ids)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(wrong_plans, [])
+        self.assertEqual(cache.hits + cache.misses, 4 * 5 * len(id_sets))
+        self.assertEqual(len(cache), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
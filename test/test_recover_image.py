@@ -0,0 +1,166 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.recover_image import CheatingDetectedError, CheatingReport, RecoverImage
+from test.fixtures import make_bmp
+
+
+class RecoverImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.recover_image = RecoverImage(shares=[None] * 3, k=3, share_length=12)
+
+    def test_is_cheating_matches_brute_force(self):
+        generator = np.random.default_rng(0)
+        a0, a1, b0, b1 = generator.integers(0, 251, size=(4, 2000), dtype=np.uint8)
+        # make half of the blocks honest
+        r = generator.integers(0, 251, size=1000)
+        b0[:1000] = z251_array.neg(z251_array.mul(r, np.where(a0[:1000] == 0, 1, a0[:1000])))
+        b1[:1000] = z251_array.neg(z251_array.mul(r, np.where(a1[:1000] == 0, 1, a1[:1000])))
+
+        expected = []
+        for block in range(2000):
+            a0_i, a1_i = int(a0[block]) or 1, int(a1[block]) or 1
+            if not any((r * a0_i + int(b0[block])) % 251 == 0 and (r * a1_i + int(b1[block])) % 251 == 0 for r in range(251)):
+                expected.append(block)
+
+        report = self.recover_image.is_cheating(a0, a1, b0, b1)
+        self.assertEqual(report.failed_blocks, expected)
+        self.assertEqual(report.total_blocks, 2000)
+        self.assertTrue(all(block >= 1000 for block in report.failed_blocks))
+        self.assertTrue(report)
+
+    def test_is_cheating_zero_pixels(self):
+        # a_0 = a_1 = 0 are shared as 1 by the dealer
+        report = self.recover_image.is_cheating(np.array([0]), np.array([0]), np.array([251 - 5]), np.array([251 - 5]))
+        self.assertFalse(report)
+        self.assertEqual(report.failed_blocks, [])
+
+
+class RecoverImageRoundTripTestCase(unittest.TestCase):
+    # 30 pixel wide rows are padded to 32 bytes
+    WIDTH, HEIGHT = 30, 28
+
+    def distribute(self, directory, k, n, bits_per_pixel=8):
+        secret = make_bmp(Path(directory) / "secret.bmp", self.WIDTH, self.HEIGHT, seed=1, bits_per_pixel=bits_per_pixel)
+        for i in range(n):
+            make_bmp(Path(directory) / f"cover{i}.bmp", self.WIDTH, self.HEIGHT, seed=2 + i, bits_per_pixel=bits_per_pixel)
+        covers = [BMPFile(Path(directory) / f"cover{i}.bmp") for i in range(n)]
+        DistributeImage(str(Path(directory) / "secret.bmp"), k=k, participants=covers).generate_shadows()
+        shares = [BMPFile(Path(directory) / f"cover{i}.bmp", use_mmap=True) for i in range(n)]
+        expected = z251_array.reduce(np.frombuffer(secret.pixel_data, dtype=np.uint8)).tobytes()
+        return shares, expected
+
+    def test_recover(self):
+        for k in (3, 5, 8):
+            with tempfile.TemporaryDirectory() as directory:
+                shares, expected = self.distribute(directory, k, k + 1)
+                recover_image = RecoverImage(shares, k=k, share_length=shares[0].total_pixels)
+                self.assertEqual(bytes(recover_image.recover().pixel_data), expected)
+                self.assertEqual(bytes(recover_image.recover(threads=3).pixel_data), expected)
+
+    def test_recover_24_bit(self):
+        for k in (3, 5, 8):
+            with tempfile.TemporaryDirectory() as directory:
+                shares, expected = self.distribute(directory, k, k + 2, bits_per_pixel=24)
+                recover_image = RecoverImage(shares, k=k, share_length=shares[0].total_pixels)
+                self.assertEqual(recover_image.blocks_amount, 3 * self.WIDTH * self.HEIGHT // (2 * k - 2))
+                self.assertEqual(bytes(recover_image.recover().pixel_data), expected)
+
+                recovered, cheaters = recover_image.identify_cheaters()
+                self.assertEqual(bytes(recovered.pixel_data), expected)
+                self.assertEqual(cheaters, [])
+
+    def test_recover_reads_only_selected_shares(self):
+        with tempfile.TemporaryDirectory() as directory:
+            _, expected = self.distribute(directory, 3, 8)
+            shares = [BMPFile(Path(directory) / f"cover{i}.bmp") for i in range(8)]
+            recover_image = RecoverImage(shares, k=3, share_length=shares[0].total_pixels)
+            self.assertEqual(bytes(recover_image.recover().pixel_data), expected)
+            self.assertCountEqual([share for share in shares if share.is_loaded], recover_image.shares)
+
+    def test_share_too_small(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shares, _ = self.distribute(directory, 3, 4)
+            with self.assertRaises(ValueError):
+                RecoverImage(shares, k=3, share_length=4 * shares[0].total_pixels).recover()
+
+    def test_stream_recover(self):
+        for k in (3, 5, 8):
+            with tempfile.TemporaryDirectory() as directory:
+                shares, expected = self.distribute(directory, k, k + 1)
+                recover_image = RecoverImage(shares, k=k, share_length=shares[0].total_pixels)
+                output_path = Path(directory) / "recovered.bmp"
+                recover_image.stream_recover(output_path, memory_limit=1000)
+
+                recovered = BMPFile(output_path)
+                self.assertEqual(bytes(recovered.pixel_data), expected)
+
+                # Same file as recovering in memory and saving
+                recover_image.recover().save(Path(directory) / "saved.bmp")
+                self.assertEqual(output_path.read_bytes(), (Path(directory) / "saved.bmp").read_bytes())
+
+    def test_stream_recover_cheating(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shares, _ = self.distribute(directory, 3, 3)
+            # A fake share: flip the shadow bits of the second block
+            with open(shares[0].file_path, 'r+b') as file:
+                file.seek(shares[0].header['data_offset'] + 4)
+                file.write(bytes(4))
+
+            output_path = Path(directory) / "recovered.bmp"
+            with self.assertRaises(CheatingDetectedError) as context:
+                RecoverImage(shares, k=3, share_length=shares[0].total_pixels).stream_recover(output_path, memory_limit=1000)
+            self.assertIn(1, context.exception.report.failed_blocks)
+            self.assertFalse(output_path.exists())
+
+
+    def test_identify_cheaters(self):
+        for k in (3, 5):
+            with tempfile.TemporaryDirectory() as directory:
+                shares, expected = self.distribute(directory, k, k + 3)
+                fake = shares[2]
+                # A fake share: replace every carrier byte with noise, keeping its id
+                with open(fake.file_path, 'r+b') as file:
+                    file.seek(fake.header['data_offset'])
+                    file.write(np.random.default_rng(k).integers(0, 256, fake.row_bytes * 10, dtype=np.uint8).tobytes())
+
+                shares = [BMPFile(share.file_path) for share in shares]
+                recovered, cheaters = RecoverImage(shares, k=k, share_length=shares[0].total_pixels).identify_cheaters()
+                self.assertEqual(bytes(recovered.pixel_data), expected)
+                self.assertEqual(cheaters, [fake.header['reserved1']])
+
+    def test_identify_cheaters_without_redundancy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shares, expected = self.distribute(directory, 3, 4)
+            recovered, cheaters = RecoverImage(shares, k=3, share_length=shares[0].total_pixels).identify_cheaters()
+            self.assertEqual(bytes(recovered.pixel_data), expected)
+            self.assertEqual(cheaters, [])
+
+            # With a single spare share a fake one can be detected, but not located
+            with open(shares[0].file_path, 'r+b') as file:
+                file.seek(shares[0].header['data_offset'] + 4)
+                file.write(bytes(4))
+            shares = [BMPFile(share.file_path) for share in shares]
+            with self.assertRaises(CheatingDetectedError) as context:
+                RecoverImage(shares, k=3, share_length=shares[0].total_pixels).identify_cheaters()
+            self.assertEqual(context.exception.report.failed_blocks, [1])
+
+
+class CheatingReportTestCase(unittest.TestCase):
+    def test_message_lists_the_first_blocks(self):
+        report = CheatingReport(range(5000), 22500, cheaters=[4])
+
+        self.assertEqual(len(report.failed_blocks), 5000)
+        self.assertEqual(
+            str(report),
+            "5000 of 22500 blocks failed the cheating check: [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, ...] (inconsistent shares: [4])",
+        )
+        self.assertEqual(str(CheatingReport([3, 7], 10)), "2 of 10 blocks failed the cheating check: [3, 7]")
+
+
+if __name__ == '__main__':
+    unittest.main()
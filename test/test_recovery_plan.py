@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from src import z251_array
+from src.recovery_plan import RecoveryPlan
+
+
+class RecoveryPlanTestCase(unittest.TestCase):
+    def test_interpolate(self):
+        generator = np.random.default_rng(0)
+        for k in range(3, 9):
+            coefficients = generator.integers(0, 251, size=(k, 40), dtype=np.uint8)
+            ids = list(generator.choice(np.arange(1, 12), size=k, replace=False))
+            shadows = z251_array.dot(z251_array.vandermonde(ids, k), coefficients)
+
+            plan = RecoveryPlan(ids, k)
+            self.assertTrue(np.array_equal(plan.interpolate(shadows), coefficients))
+
+    def test_evaluate(self):
+        generator = np.random.default_rng(1)
+        for k in range(3, 9):
+            coefficients = generator.integers(0, 251, size=(k, 40), dtype=np.uint8)
+            shadows = z251_array.dot(z251_array.vandermonde(range(1, k + 1), k), coefficients)
+
+            plan = RecoveryPlan(list(range(1, k + 1)), k)
+            for x in (k + 1, 250, 300):
+                self.assertTrue(np.array_equal(plan.evaluate(shadows, x), z251_array.dot(z251_array.vandermonde([x], k)[0], coefficients)))
+
+    def test_invalid_ids(self):
+        with self.assertRaises(ValueError):
+            RecoveryPlan([1, 2], 3)
+        with self.assertRaises(ValueError):
+            RecoveryPlan([1, 2, 2], 3)
+        with self.assertRaises(ValueError):
+            RecoveryPlan([1, 2, 251], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import random
+import unittest
+import numpy as np
+from src.ri_generator import RiGenerator
+
+
+class RiGeneratorTestCase(unittest.TestCase):
+    def test_range(self):
+        ri = RiGenerator().draw(200000)
+        self.assertEqual(ri.dtype, np.uint8)
+        self.assertEqual(len(ri), 200000)
+        self.assertEqual((ri.min(), ri.max()), (1, 250))
+
+    def test_seeded_draws_are_reproducible(self):
+        state = random.getstate()
+        drawn = RiGenerator(seed=3).draw(100000)
+        self.assertEqual(random.getstate(), state)
+
+        # Drawing in pieces gives the same values as drawing at once
+        generator = RiGenerator(seed=3)
+        pieces = [generator.draw(count) for count in (1, 70000, 29999)]
+        self.assertTrue(np.array_equal(np.concatenate(pieces), drawn))
+        self.assertFalse(np.array_equal(RiGenerator(seed=4).draw(100000), drawn))
+
+    def test_unseeded_draws_differ(self):
+        self.assertFalse(np.array_equal(RiGenerator().draw(1000), RiGenerator().draw(1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from src import z251_array
+from src.bmp_file import BMPFile
+from src.distribute_image import DistributeImage
+from src.recover_image import RecoverImage
+from src.shadow_file import ShadowFile
+from test.fixtures import make_bmp
+
+
+class ShadowFileTestCase(unittest.TestCase):
+    def test_save_and_map(self):
+        shadow = np.arange(40, dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "1.shd"
+            self.assertEqual(ShadowFile.save(file_path, shadow, k=3, participant_id=7, width=10, height=8), 32 + 40)
+
+            share = ShadowFile(file_path)
+            self.assertEqual((share.k, share.participant_id, share.block_count, share.channels), (3, 7, 20, 1))
+            self.assertEqual(share.total_pixels, 80)
+            self.assertTrue(np.array_equal(share.shadow, shadow))
+            # The shadow is a read-only view over the mapping
+            self.assertFalse(share.shadow.flags.writeable)
+
+            share.close()
+            self.assertIsNone(share.shadow)
+            with ShadowFile(file_path) as share:
+                self.assertEqual(share.participant_id, 7)
+            self.assertIsNone(share.shadow)
+
+    def test_corrupt_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = Path(directory) / "1.shd"
+            ShadowFile.save(file_path, np.arange(40, dtype=np.uint8), k=3, participant_id=1, width=10, height=8)
+            data = bytearray(file_path.read_bytes())
+
+            data[40] ^= 1
+            file_path.write_bytes(data)
+            with self.assertRaises(ValueError):
+                ShadowFile(file_path)
+            # The checksum is only checked when verifying
+            ShadowFile(file_path, verify=False)
+
+            file_path.write_bytes(b"BM" + bytes(data[2:]))
+            with self.assertRaises(ValueError):
+                ShadowFile(file_path, verify=False)
+
+    def test_round_trip(self):
+        for bits_per_pixel in (8, 24):
+            for k in (3, 5):
+                with tempfile.TemporaryDirectory() as directory:
+                    directory = Path(directory)
+                    secret = make_bmp(directory / "secret.bmp", 30, 28, seed=1, bits_per_pixel=bits_per_pixel)
+                    expected = z251_array.reduce(np.frombuffer(secret.pixel_data, dtype=np.uint8)).tobytes()
+                    file_paths = [directory / f"shadow{i + 1}.shd" for i in range(k + 2)]
+                    DistributeImage(str(directory / "secret.bmp"), k=k, participants=[], n=k + 2).save_shadow_files(file_paths)
+
+                    shares = [ShadowFile(file_path) for file_path in file_paths]
+                    recover_image = RecoverImage(shares, k=k, share_length=shares[0].total_pixels)
+                    recovered = recover_image.recover()
+                    self.assertEqual(bytes(recovered.pixel_data), expected)
+                    self.assertEqual(recovered.header['bits_per_pixel'], bits_per_pixel)
+                    self.assertEqual(bytes(recover_image.identify_cheaters()[0].pixel_data), expected)
+
+                    if bits_per_pixel == 8:
+                        recover_image.stream_recover(directory / "streamed.bmp", memory_limit=1000)
+                        self.assertEqual(bytes(BMPFile(directory / "streamed.bmp").pixel_data), expected)
+
+                    with self.assertRaises(ValueError):
+                        RecoverImage(shares, k=k + 1, share_length=shares[0].total_pixels).recover()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from src import z251_array
+from src.z251 import Z251
+
+
+class Z251ArrayTestCase(unittest.TestCase):
+    VALUES = np.arange(256, dtype=np.uint8)
+
+    def test_matches_scalar_z251(self):
+        for other in (0, 1, 2, 250, 251, 255):
+            added = z251_array.add(Z251ArrayTestCase.VALUES, other)
+            subtracted = z251_array.sub(Z251ArrayTestCase.VALUES, other)
+            multiplied = z251_array.mul(Z251ArrayTestCase.VALUES, other)
+            for value in range(256):
+                self.assertEqual(added[value], (Z251(value) + Z251(other)).value)
+                self.assertEqual(subtracted[value], (Z251(value) - Z251(other)).value)
+                self.assertEqual(multiplied[value], (Z251(value) * Z251(other)).value)
+
+    def test_inverse(self):
+        values = np.arange(1, 251)
+        self.assertTrue(np.all(z251_array.mul(values, z251_array.inverse(values)) == 1))
+        with self.assertRaises(ValueError):
+            z251_array.inverse([1, 251])
+        self.assertTrue(np.all(z251_array.div([300, 2], [2, 1]) == [150, 2]))
+
+    def test_power(self):
+        for exponent in range(6):
+            powered = z251_array.power(Z251ArrayTestCase.VALUES, exponent)
+            for value in range(256):
+                self.assertEqual(powered[value], (Z251(value) ** exponent).value)
+
+    def test_dot(self):
+        a = np.full((3, 300), 250, dtype=np.uint8)
+        b = np.full((300, 2), 250, dtype=np.uint8)
+        self.assertTrue(np.all(z251_array.dot(a, b) == (250 * 250 * 300) % 251))
+
+    def test_vandermonde(self):
+        matrix = z251_array.vandermonde([1, 2, 3, 250], 4)
+        for j, x in enumerate([1, 2, 3, 250]):
+            self.assertEqual(list(matrix[j]), [(Z251(x) ** power).value for power in range(4)])
+
+    def test_inverse_matrix(self):
+        matrix = z251_array.vandermonde([3, 1, 7, 250], 4)
+        inverse = z251_array.inverse_matrix(matrix)
+        self.assertTrue(np.array_equal(z251_array.dot(inverse, matrix), np.eye(4, dtype=np.uint8)))
+        with self.assertRaises(ValueError):
+            z251_array.inverse_matrix([[1, 2], [2, 4]])
+
+
+    def test_solve(self):
+        rng = np.random.default_rng(0)
+        a = rng.integers(0, 251, (100, 5, 4))
+        x = rng.integers(0, 251, (100, 4))
+        # Underdetermined systems get their free unknown set to 0
+        a[:20, :, 3] = 0
+        x[:20, 3] = 0
+        b = z251_array.reduce(np.einsum('sru,su->sr', a, x))
+        b[90:, 0] = z251_array.add(b[90:, 0], 1)
+
+        solutions, solvable = z251_array.solve(a, b)
+        self.assertTrue(np.array_equal(solutions[:90], x[:90]))
+        self.assertTrue(np.all(solvable[:90]))
+        self.assertFalse(np.any(solvable[90:]))
+
+
+if __name__ == '__main__':
+    unittest.main()